@@ -4,6 +4,7 @@
 # BROKER_BIND_HOST=127.0.0.1 \
 # PUB_PORT=5555 \
 # SUB_PORT=5556 \
+# BROKER_IO_THREADS=4 \
 # python broker.py
 
 
@@ -14,6 +15,7 @@
 #   -e BROKER_BIND_HOST=0.0.0.0 \
 #   -e PUB_PORT=5555 \
 #   -e SUB_PORT=5556 \
+#   -e BROKER_IO_THREADS=4 \
 #   broker
 
 import os
@@ -38,24 +40,36 @@ BROKER_BIND_HOST = getenv_str("BROKER_BIND_HOST", "0.0.0.0")
 PUB_PORT = getenv_int("PUB_PORT", 5555)  # publishers connect here
 SUB_PORT = getenv_int("SUB_PORT", 5556)  # subscribers connect here
 
+# libzmq I/O threads: socket reads/writes for XSUB/XPUB peers are spread
+# across these, so forwarding is not capped by a single core
+BROKER_IO_THREADS = max(1, getenv_int("BROKER_IO_THREADS", 4))
+
+# Bound the broker's per-peer queues (frames are ~100 KB each)
+BROKER_HWM = getenv_int("BROKER_HWM", 4)
+
 PUB_BIND = f"tcp://{BROKER_BIND_HOST}:{PUB_PORT}"
 SUB_BIND = f"tcp://{BROKER_BIND_HOST}:{SUB_PORT}"
 
 
 def main():
-    ctx = zmq.Context.instance()
+    ctx = zmq.Context.instance(io_threads=BROKER_IO_THREADS)
 
     # Publishers connect here
     xsub = ctx.socket(zmq.XSUB)
+    xsub.setsockopt(zmq.RCVHWM, BROKER_HWM)
+    xsub.setsockopt(zmq.LINGER, 0)
     xsub.bind(PUB_BIND)
 
     # Subscribers connect here
     xpub = ctx.socket(zmq.XPUB)
+    xpub.setsockopt(zmq.SNDHWM, BROKER_HWM)
+    xpub.setsockopt(zmq.LINGER, 0)
     xpub.bind(SUB_BIND)
 
     print("Broker running:")
     print(f"  PUB -> {PUB_BIND}  (publishers connect here)")
     print(f"  SUB -> {SUB_BIND}  (subscribers connect here)")
+    print(f"  io_threads={BROKER_IO_THREADS} hwm={BROKER_HWM}")
 
     zmq.proxy(xsub, xpub)
 
@@ -24,11 +24,14 @@
 #   -v "$PWD:/data:ro" \
 #   capturer
 
-import json
 import os
+import queue
+import subprocess
+import threading
 import time
 
 import cv2
+import orjson
 import zmq
 
 
@@ -73,14 +76,244 @@ LOOP = getenv_bool("LOOP", True)
 # Optional: if video reports 0 FPS, fall back here
 FALLBACK_FPS = getenv_float("FALLBACK_FPS", 25.0)
 
+# Frame source:
+#   opencv: cv2.VideoCapture decodes to BGR, cv2.imencode makes the JPEG
+#   ffmpeg: one ffmpeg process paces, samples and encodes MJPEG itself;
+#           no BGR frames are materialized in Python
+CAPTURE_BACKEND = getenv_str("CAPTURE_BACKEND", "opencv").strip().lower()
+FFMPEG_BIN = getenv_str("FFMPEG_BIN", "ffmpeg")
+FFMPEG_QSCALE = getenv_int("FFMPEG_QSCALE", 5)  # mjpeg -q:v, 2 (best) .. 31
+
+# Real-time: keep send queues tiny (prefer drop over latency growth)
+SNDHWM = getenv_int("SNDHWM", 2)
+SOCK_BUF_BYTES = getenv_int("SOCK_BUF_BYTES", 4 * 1024 * 1024)
+
+# Frames waiting between pipeline stages (read -> encode -> publish).
+# When a stage falls behind, the oldest queued frame is dropped.
+QUEUE_SIZE = max(1, getenv_int("QUEUE_SIZE", 4))
+QUEUE_STATS_EVERY_SEC = getenv_float("QUEUE_STATS_EVERY_SEC", 10.0)
+
+# Frames per ZMQ message. 1 keeps the plain [topic, header, jpeg] format;
+# N > 1 sends [topic, [header, ...], jpeg1, ..., jpegN]. A partial batch
+# is flushed after BATCH_MAX_DELAY_SEC so latency stays bounded.
+BATCH_SIZE = max(1, getenv_int("BATCH_SIZE", 1))
+BATCH_MAX_DELAY_SEC = getenv_float("BATCH_MAX_DELAY_SEC", 0.5)
+
 PUB_ENDPOINT = f"tcp://{BROKER_HOST}:{PUB_PORT}"
 
+_STOP = object()  # end-of-stream marker passed down the stage queues
+
+
+class DropOldestQueue(queue.Queue):
+    """Bounded FIFO whose put() never blocks: when full, the oldest item is
+    dropped (CCTV-style, a live stream prefers fresh frames)."""
+
+    def __init__(self, name: str, maxsize: int):
+        super().__init__()  # unbounded for Queue; the bound is enforced in _put
+        self.name = name
+        self.limit = maxsize
+        self.dropped = 0
+        self.high_water = 0
+
+    def _put(self, item):
+        # called by put() with self.mutex held
+        if len(self.queue) >= self.limit:
+            self.queue.popleft()
+            self.dropped += 1
+        self.queue.append(item)
+        self.high_water = max(self.high_water, len(self.queue))
+
+    def take_stats(self) -> tuple:
+        """Return (high_water, dropped) since the last call and reset them."""
+        with self.mutex:
+            stats = (self.high_water, self.dropped)
+            self.high_water = len(self.queue)
+            self.dropped = 0
+        return stats
 
-def main():
-    ctx = zmq.Context.instance()
-    pub = ctx.socket(zmq.PUB)
-    pub.connect(PUB_ENDPOINT)
 
+def queue_stats_loop(queues: list):
+    while True:
+        time.sleep(QUEUE_STATS_EVERY_SEC)
+        parts = []
+        for q in queues:
+            high_water, dropped = q.take_stats()
+            parts.append(f"{q.name}: hwm={high_water}/{q.limit} dropped={dropped}")
+        print("Queues  " + "  ".join(parts))
+
+
+def opencv_jpeg_backend() -> str:
+    """JPEG codec line from OpenCV's build info (e.g. build-libjpeg-turbo)."""
+    for line in cv2.getBuildInformation().splitlines():
+        key, _, value = line.partition(":")
+        if key.strip() == "JPEG":
+            return value.strip()
+    return "unknown"
+
+
+def encoder_loop(raw_q: queue.Queue, jpg_q: queue.Queue, encode_params: list, meta: dict):
+    """Stage 2: BGR frame -> JPEG (cv2.imencode releases the GIL)."""
+    while True:
+        item = raw_q.get()
+        if item is _STOP:
+            jpg_q.put(_STOP)
+            return
+
+        frame_id, ts, frame_bgr = item
+        h, w = frame_bgr.shape[:2]
+        ok, jpg = cv2.imencode(".jpg", frame_bgr, encode_params)
+        if not ok:
+            continue
+
+        header = {
+            "frame_id": frame_id,
+            "ts": ts,
+            "encoding": "jpeg",
+            "mode": "BGR",
+            "w": int(w),
+            "h": int(h),
+            **meta,
+        }
+        jpg_q.put((header, jpg))
+
+
+# SOFn markers carrying the frame size (excludes DHT/JPG/DAC)
+_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def jpeg_size(jpg: bytes) -> tuple:
+    """Return (w, h) from the SOF segment without decoding the image."""
+    i = 2  # skip SOI
+    n = len(jpg)
+    while i + 9 <= n:
+        if jpg[i] != 0xFF:
+            i += 1
+            continue
+        marker = jpg[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+        elif marker in _SOF_MARKERS:
+            h = int.from_bytes(jpg[i + 5:i + 7], "big")
+            w = int.from_bytes(jpg[i + 7:i + 9], "big")
+            return w, h
+        elif marker == 0x01 or 0xD0 <= marker <= 0xD9:  # no length field
+            i += 2
+        else:
+            i += 2 + int.from_bytes(jpg[i + 2:i + 4], "big")
+    return 0, 0
+
+
+def ffmpeg_jpeg_frames(proc: subprocess.Popen):
+    """Split ffmpeg's image2pipe MJPEG output into single JPEGs (SOI..EOI)."""
+    buf = bytearray()
+    scan = 0
+    while True:
+        chunk = proc.stdout.read1(1 << 16)
+        if not chunk:
+            return
+        buf += chunk
+        while True:
+            # 0xFFD9 cannot occur inside entropy-coded data (0xFF is stuffed)
+            end = buf.find(b"\xff\xd9", scan)
+            if end < 0:
+                scan = max(0, len(buf) - 1)
+                break
+            start = buf.find(b"\xff\xd8", 0, end)
+            if start >= 0:
+                yield bytes(buf[start:end + 2])
+            del buf[:end + 2]
+            scan = 0
+
+
+def capture_ffmpeg(jpg_q: queue.Queue):
+    cmd = [FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-nostdin", "-re"]
+    if LOOP:
+        cmd += ["-stream_loop", "-1"]
+    cmd += [
+        "-i", VIDEO_PATH,
+        "-an",
+        # -re keeps playback at normal speed; the fps filter samples it
+        "-vf", f"fps={1.0 / PUBLISH_EVERY_SEC:.6f}",
+        "-pix_fmt", "yuvj420p",
+        "-c:v", "mjpeg",
+        "-q:v", str(FFMPEG_QSCALE),
+        "-f", "image2pipe",
+        "-",
+    ]
+    meta = {
+        "src": "video",
+        "video": VIDEO_PATH,
+        "backend": "ffmpeg",
+        "publish_every_sec": float(PUBLISH_EVERY_SEC),
+    }
+
+    print(f"Streaming {VIDEO_PATH} via {FFMPEG_BIN} (q:v={FFMPEG_QSCALE})")
+
+    threading.Thread(target=queue_stats_loop, args=([jpg_q],), daemon=True).start()
+
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    try:
+        for frame_id, jpg in enumerate(ffmpeg_jpeg_frames(proc)):
+            w, h = jpeg_size(jpg)
+            header = {
+                "frame_id": frame_id,
+                "ts": time.time(),
+                "encoding": "jpeg",
+                "mode": "BGR",
+                "w": w,
+                "h": h,
+                **meta,
+            }
+            jpg_q.put((header, jpg))
+    finally:
+        proc.kill()
+        proc.wait()
+
+    print("End of video.")
+    jpg_q.put(_STOP)
+
+
+def publisher_loop(pub: zmq.Socket, jpg_q: queue.Queue):
+    """Stage 3: send JPEGs. Only this thread touches the PUB socket."""
+    headers, jpgs = [], []
+    max_delay_ns = int(BATCH_MAX_DELAY_SEC * 1e9)
+    deadline_ns = 0
+
+    def flush():
+        if jpgs:
+            pub.send_multipart([TOPIC, orjson.dumps(headers), *jpgs], copy=False)
+            headers.clear()
+            jpgs.clear()
+
+    while True:
+        timeout = None
+        if jpgs:
+            timeout = max(0.0, (deadline_ns - time.monotonic_ns()) / 1e9)
+        try:
+            item = jpg_q.get(timeout=timeout)
+        except queue.Empty:
+            flush()
+            continue
+
+        if item is _STOP:
+            flush()
+            return
+
+        header, jpg = item
+        if BATCH_SIZE == 1:
+            # jpg is a numpy buffer: hand it to zmq as-is (no .tobytes() copy)
+            pub.send_multipart([TOPIC, orjson.dumps(header), jpg], copy=False)
+            continue
+
+        if not jpgs:
+            deadline_ns = time.monotonic_ns() + max_delay_ns
+        headers.append(header)
+        jpgs.append(jpg)
+        if len(jpgs) >= BATCH_SIZE or time.monotonic_ns() >= deadline_ns:
+            flush()
+
+
+def capture_opencv(jpg_q: queue.Queue):
     cap = cv2.VideoCapture(VIDEO_PATH)
     if not cap.isOpened():
         raise RuntimeError(f"Cannot open {VIDEO_PATH}")
@@ -89,21 +322,50 @@ def main():
     if not video_fps or video_fps <= 0:
         video_fps = FALLBACK_FPS
 
-    period = 1.0 / float(video_fps)  # playback speed (normal)
-    encode_params = [cv2.IMWRITE_JPEG_QUALITY, int(JPEG_QUALITY)]
+    # Pacing uses integer nanoseconds on the monotonic clock (no NTP jumps,
+    # no float drift). Wall-clock time.time() is only used for header "ts".
+    period_ns = int(1e9 / float(video_fps))  # playback speed (normal)
+    publish_every_ns = int(PUBLISH_EVERY_SEC * 1e9)
+    # Baseline, non-optimized JPEG: optimize adds a second Huffman pass and
+    # progressive multiple scans, both of which slow the encode down.
+    encode_params = [
+        cv2.IMWRITE_JPEG_QUALITY, int(JPEG_QUALITY),
+        cv2.IMWRITE_JPEG_OPTIMIZE, 0,
+        cv2.IMWRITE_JPEG_PROGRESSIVE, 0,
+    ]
+    meta = {
+        "src": "video",
+        "video": VIDEO_PATH,
+        "video_fps": float(video_fps),
+        "publish_every_sec": float(PUBLISH_EVERY_SEC),
+    }
+
+    # This thread reads/paces the video and an encoder thread runs
+    # cv2.imencode, so decode and encode overlap on different cores.
+    raw_q = DropOldestQueue("raw", QUEUE_SIZE)
+    encoder = threading.Thread(target=encoder_loop, args=(raw_q, jpg_q, encode_params, meta), daemon=True)
+    threading.Thread(target=queue_stats_loop, args=([raw_q, jpg_q],), daemon=True).start()
+
+    # cap.read() decodes into frame_buf when given one. Frames that are not
+    # published keep reusing it; a published frame is handed to the encoder
+    # and the next read allocates a fresh buffer.
+    frame_buf = None
 
     frame_id = 0
-    next_publish_time = time.time()  # wall-clock schedule
-    time.sleep(0.5)  # PUB/SUB slow joiner mitigation
+    next_publish_ns = time.monotonic_ns()
 
     print(f"Playing {VIDEO_PATH} at ~{video_fps:.2f} FPS (fallback={FALLBACK_FPS})")
-    print(f"Publishing 1 frame every {PUBLISH_EVERY_SEC:.3f} seconds to {PUB_ENDPOINT} topic={TOPIC!r}")
-    print(f"JPEG_QUALITY={JPEG_QUALITY} LOOP={LOOP}")
+    jpeg_backend = opencv_jpeg_backend()
+    print(f"JPEG_QUALITY={JPEG_QUALITY} cv2 JPEG codec: {jpeg_backend}")
+    if "turbo" not in jpeg_backend:
+        print("Warning: OpenCV is not built with libjpeg-turbo; JPEG encode will be slower")
+
+    encoder.start()
 
     while True:
-        t0 = time.time()
+        t0 = time.monotonic_ns()
 
-        ok, frame_bgr = cap.read()
+        ok, frame_bgr = cap.read(frame_buf)
         if not ok:
             if LOOP:
                 cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
@@ -111,42 +373,60 @@ def main():
             else:
                 print("End of video.")
                 break
+        frame_buf = frame_bgr
 
         # video plays normally because we keep reading frames at video FPS
-        now = time.time()
-        if now >= next_publish_time:
-            h, w = frame_bgr.shape[:2]
-            ok2, jpg = cv2.imencode(".jpg", frame_bgr, encode_params)
-            if ok2:
-                header = {
-                    "frame_id": frame_id,
-                    "ts": now,
-                    "encoding": "jpeg",
-                    "mode": "BGR",
-                    "w": int(w),
-                    "h": int(h),
-                    "src": "video",
-                    "video": VIDEO_PATH,
-                    "video_fps": float(video_fps),
-                    "publish_every_sec": float(PUBLISH_EVERY_SEC),
-                }
-                pub.send_multipart([TOPIC, json.dumps(header).encode("utf-8"), jpg.tobytes()])
-                frame_id += 1
+        now_ns = time.monotonic_ns()
+        if now_ns >= next_publish_ns:
+            raw_q.put((frame_id, time.time(), frame_bgr))
+            frame_buf = None
+            frame_id += 1
 
             # schedule next capture
-            next_publish_time += PUBLISH_EVERY_SEC
+            next_publish_ns += publish_every_ns
 
             # if we fell behind (e.g., pause), jump forward to avoid burst publishes
-            if now - next_publish_time > PUBLISH_EVERY_SEC * 5:
-                next_publish_time = now + PUBLISH_EVERY_SEC
+            if now_ns - next_publish_ns > publish_every_ns * 5:
+                next_publish_ns = now_ns + publish_every_ns
 
         # playback pacing (normal speed)
-        elapsed = time.time() - t0
-        if elapsed < period:
-            time.sleep(period - elapsed)
+        remaining_ns = t0 + period_ns - time.monotonic_ns()
+        if remaining_ns > 0:
+            time.sleep(remaining_ns / 1e9)
 
+    raw_q.put(_STOP)  # the encoder forwards it to jpg_q
+    encoder.join()
     cap.release()
 
 
+def main():
+    ctx = zmq.Context.instance()
+    pub = ctx.socket(zmq.PUB)
+    pub.setsockopt(zmq.SNDHWM, SNDHWM)
+    pub.setsockopt(zmq.SNDBUF, SOCK_BUF_BYTES)
+    pub.setsockopt(zmq.TCP_KEEPALIVE, 1)
+    pub.setsockopt(zmq.LINGER, 0)
+    pub.connect(PUB_ENDPOINT)
+
+    # The capture stage feeds (header, jpeg) into jpg_q; a publisher thread
+    # owns the socket, so capture/encode and send overlap.
+    jpg_q = DropOldestQueue("jpeg", QUEUE_SIZE)
+    publisher = threading.Thread(target=publisher_loop, args=(pub, jpg_q), daemon=True)
+
+    time.sleep(0.5)  # PUB/SUB slow joiner mitigation
+
+    print(f"Publishing 1 frame every {PUBLISH_EVERY_SEC:.3f} seconds to {PUB_ENDPOINT} topic={TOPIC!r}")
+    print(f"CAPTURE_BACKEND={CAPTURE_BACKEND} LOOP={LOOP} QUEUE_SIZE={QUEUE_SIZE} BATCH_SIZE={BATCH_SIZE}")
+
+    publisher.start()
+
+    if CAPTURE_BACKEND == "ffmpeg":
+        capture_ffmpeg(jpg_q)
+    else:
+        capture_opencv(jpg_q)
+
+    publisher.join()
+
+
 if __name__ == "__main__":
     main()
@@ -7,6 +7,7 @@
 # SUB_TOPIC=raw \
 # PUB_TOPIC=processed \
 # JPEG_QUALITY_OUT=85 \
+# GRAY_MODE=lossless \
 # python transformer.py
 
 
@@ -18,16 +19,22 @@
 #   -e SUB_TOPIC=raw \
 #   -e PUB_TOPIC=processed \
 #   -e JPEG_QUALITY_OUT=85 \
+#   -e GRAY_MODE=lossless \
 #   transformer
 
 
-import io
-import json
 import os
 import time
 
+import numpy as np
+import orjson
+import simplejpeg
 import zmq
-from PIL import Image
+
+try:
+    from turbojpeg import TurboJPEG  # needs libturbojpeg on the system
+except Exception:  # pragma: no cover
+    TurboJPEG = None  # type: ignore
 
 
 def getenv_str(name: str, default: str) -> str:
@@ -54,60 +61,111 @@ PUB_TOPIC = getenv_str("PUB_TOPIC", "processed").encode("utf-8")
 
 JPEG_QUALITY_OUT = getenv_int("JPEG_QUALITY_OUT", 85)
 
+# lossless: drop chroma in the DCT domain (JPEG_QUALITY_OUT is not used)
+# reencode: decode Y plane + encode at JPEG_QUALITY_OUT
+GRAY_MODE = getenv_str("GRAY_MODE", "lossless").strip().lower()
+
+# Real-time: keep queues tiny (prefer drop over latency growth)
+RCVHWM = getenv_int("RCVHWM", 2)
+SNDHWM = getenv_int("SNDHWM", 2)
+SOCK_BUF_BYTES = getenv_int("SOCK_BUF_BYTES", 4 * 1024 * 1024)
+
 SUB_ENDPOINT = f"tcp://{BROKER_HOST}:{SUB_PORT}"
 PUB_ENDPOINT = f"tcp://{BROKER_HOST}:{PUB_PORT}"
 
 
-def jpeg_bytes_to_pil(b: bytes) -> Image.Image:
-    return Image.open(io.BytesIO(b))
+def jpeg_bytes_to_gray(b, out: np.ndarray | None = None) -> np.ndarray:
+    # libjpeg-turbo emits the Y plane only (chroma is never reconstructed),
+    # so there is no separate BGR -> L pass. Shape is (h, w, 1).
+    # `out` is reused as the decode target while the frame size is stable.
+    h, w, _, _ = simplejpeg.decode_jpeg_header(b)
+    if out is None or out.shape[:2] != (h, w):
+        out = np.empty((h, w, 1), dtype=np.uint8)
+    return simplejpeg.decode_jpeg(b, colorspace="GRAY", buffer=out)
 
 
-def pil_to_jpeg_bytes(img: Image.Image, quality: int = 85) -> bytes:
-    buf = io.BytesIO()
-    img.save(buf, format="JPEG", quality=quality, optimize=True)
-    return buf.getvalue()
+def gray_to_jpeg_bytes(gray: np.ndarray, quality: int = 85) -> bytes:
+    # No Huffman optimize pass: it is the slowest part of the encode
+    return simplejpeg.encode_jpeg(gray, quality=quality, colorspace="GRAY")
 
 
-def to_grayscale(img_rgb: Image.Image) -> Image.Image:
-    # Convert to grayscale (L). Keeping 'L' is fine for MJPEG viewers.
-    return img_rgb.convert("L")
+def jpeg_to_gray_lossless(tj, b) -> tuple[bytes, int, int]:
+    # Same as `jpegtran -grayscale`: the Y DC/AC coefficients are copied
+    # untouched and Cb/Cr are stripped, so neither IDCT nor FDCT runs.
+    w, h, _, _ = tj.decode_header(b)
+    return tj.crop(b, 0, 0, w, h, gray=True, copynone=True), w, h
+
+
+def init_turbojpeg():
+    if GRAY_MODE != "lossless":
+        return None
+    if TurboJPEG is None:
+        print("PyTurboJPEG not installed, falling back to GRAY_MODE=reencode")
+        return None
+    try:
+        return TurboJPEG()
+    except Exception as e:
+        print(f"libturbojpeg not available ({e}), falling back to GRAY_MODE=reencode")
+        return None
 
 
 def main():
     ctx = zmq.Context.instance()
 
     sub = ctx.socket(zmq.SUB)
+    sub.setsockopt(zmq.RCVHWM, RCVHWM)
+    sub.setsockopt(zmq.RCVBUF, SOCK_BUF_BYTES)
+    sub.setsockopt(zmq.TCP_KEEPALIVE, 1)
+    sub.setsockopt(zmq.LINGER, 0)
     sub.connect(SUB_ENDPOINT)
     sub.setsockopt(zmq.SUBSCRIBE, SUB_TOPIC)
 
     pub = ctx.socket(zmq.PUB)
+    pub.setsockopt(zmq.SNDHWM, SNDHWM)
+    pub.setsockopt(zmq.SNDBUF, SOCK_BUF_BYTES)
+    pub.setsockopt(zmq.TCP_KEEPALIVE, 1)
+    pub.setsockopt(zmq.LINGER, 0)
     pub.connect(PUB_ENDPOINT)
 
+    tj = init_turbojpeg()
+
     time.sleep(0.5)  # let pub connect
 
     print(f"Node B subscribed to {SUB_ENDPOINT} topic={SUB_TOPIC!r}")
     print(f"Node B publishing to {PUB_ENDPOINT} topic={PUB_TOPIC!r}")
-    print(f"JPEG_QUALITY_OUT={JPEG_QUALITY_OUT}")
-
-    while True:
-        topic, header_b, jpeg_in = sub.recv_multipart()
-        header = json.loads(header_b.decode("utf-8"))
+    print(f"JPEG_QUALITY_OUT={JPEG_QUALITY_OUT} GRAY_MODE={'lossless' if tj else 'reencode'}")
 
-        img = jpeg_bytes_to_pil(jpeg_in).convert("RGB")
-        gray = to_grayscale(img)
+    gray = None  # reusable decode buffer (GRAY_MODE=reencode)
 
-        jpeg_out = pil_to_jpeg_bytes(gray, quality=JPEG_QUALITY_OUT)
-
-        out_header = {
-            **header,
-            "processed": "grayscale",
-            "mode": gray.mode,  # "L"
-            "w": gray.width,
-            "h": gray.height,
-            "ts_processed": time.time(),
-        }
-
-        pub.send_multipart([PUB_TOPIC, json.dumps(out_header).encode("utf-8"), jpeg_out])
+    while True:
+        # copy=False: zmq Frames; the JPEGs are read through their buffers in place
+        topic, header_f, *jpeg_fs = sub.recv_multipart(copy=False)
+        headers = orjson.loads(header_f.buffer)
+        if isinstance(headers, dict):
+            headers = [headers]  # single-frame message (capturer BATCH_SIZE=1)
+
+        # Batched input is processed frame by frame and republished as
+        # single frames, so downstream consumers see the usual format.
+        for header, jpeg_f in zip(headers, jpeg_fs):
+            jpeg_in = jpeg_f.buffer
+
+            if tj is not None:
+                jpeg_out, w, h = jpeg_to_gray_lossless(tj, jpeg_in)
+            else:
+                gray = jpeg_bytes_to_gray(jpeg_in, gray)
+                jpeg_out = gray_to_jpeg_bytes(gray, quality=JPEG_QUALITY_OUT)
+                h, w = gray.shape[:2]
+
+            out_header = {
+                **header,
+                "processed": "grayscale",
+                "mode": "L",
+                "w": int(w),
+                "h": int(h),
+                "ts_processed": time.time(),
+            }
+
+            pub.send_multipart([PUB_TOPIC, orjson.dumps(out_header), jpeg_out], copy=False)
 
 
 if __name__ == "__main__":
@@ -20,12 +20,12 @@
 #   -e HTTP_THREADS=8 \
 #   web_server
 
-import json
 import os
 import threading
 import time
 from pathlib import Path
 
+import orjson
 import zmq
 from bottle import Bottle, static_file, response, HTTPResponse
 from waitress import serve
@@ -52,6 +52,8 @@ HTTP_PORT = getenv_int("HTTP_PORT", 8000)
 # Parallel request handling (multiple browser tabs / clients)
 HTTP_THREADS = getenv_int("HTTP_THREADS", 8)
 
+SOCK_BUF_BYTES = getenv_int("SOCK_BUF_BYTES", 4 * 1024 * 1024)
+
 SUB_ENDPOINT = f"tcp://{BROKER_HOST}:{SUB_PORT}"
 
 # -----------------------------
@@ -60,13 +62,18 @@ SUB_ENDPOINT = f"tcp://{BROKER_HOST}:{SUB_PORT}"
 STATIC_DIR = Path(__file__).parent / "static"
 INDEX_NAME = "index.html"
 
-latest_jpeg = None
-latest_meta = {}
-lock = threading.Lock()
+BOUNDARY = "frame"
+
+# Latest frame as one immutable tuple: (seq, jpeg, part, meta).
+# "part" is the complete multipart chunk (boundary header + JPEG + CRLF),
+# built once by the receiver and shared by every MJPEG client.
+# Only the receiver thread assigns LATEST; rebinding a global is atomic,
+# so readers just unpack it without taking a lock.
+LATEST = (0, None, None, {})
 
-# Used to notify MJPEG streamers when a new frame arrives
-frame_cond = threading.Condition(lock)
-latest_frame_seq = 0  # increments for each new frame
+# Wakes MJPEG streamers when a new frame arrives. The receiver swaps in a
+# fresh Event and sets the old one, so waiters never need clear().
+frame_event = threading.Event()
 
 app = Bottle()
 
@@ -77,8 +84,7 @@ def index():
 # Optional: keep the old single-frame endpoint (handy for testing)
 @app.get("/frame.jpg")
 def frame():
-    with lock:
-        data = latest_jpeg
+    data = LATEST[1]
     if not data:
         return HTTPResponse("No frame yet", status=503)
 
@@ -90,11 +96,10 @@ def frame():
 
 @app.get("/meta.json")
 def meta():
-    with lock:
-        m = dict(latest_meta) if latest_meta else {}
+    m = LATEST[3]
     response.content_type = "application/json"
     response.set_header("Cache-Control", "no-store")
-    return json.dumps(m)
+    return orjson.dumps(m)
 
 @app.get("/stream.mjpg")
 def stream_mjpg():
@@ -102,9 +107,7 @@ def stream_mjpg():
     MJPEG streaming endpoint.
     Browser loads: <img src="/stream.mjpg">
     """
-    boundary = "frame"
-
-    response.content_type = f"multipart/x-mixed-replace; boundary={boundary}"
+    response.content_type = f"multipart/x-mixed-replace; boundary={BOUNDARY}"
     response.set_header("Cache-Control", "no-store, no-cache, must-revalidate, max-age=0")
     response.set_header("Pragma", "no-cache")
     response.set_header("Expires", "0")
@@ -112,33 +115,23 @@ def stream_mjpg():
     response.set_header("X-Accel-Buffering", "no")
 
     def gen():
-        global latest_frame_seq
         last_sent_seq = -1
 
         try:
             while True:
-                with frame_cond:
+                # Grab the event before reading LATEST so a frame published
+                # in between still wakes us up.
+                ev = frame_event
+                seq, _, part, _ = LATEST
+                if part is None or seq == last_sent_seq:
                     # Wait for a new frame (or wake up periodically)
-                    frame_cond.wait_for(
-                        lambda: latest_jpeg is not None and latest_frame_seq != last_sent_seq,
-                        timeout=2.0,
-                    )
-                    if latest_jpeg is None:
-                        continue
-
-                    jpeg = latest_jpeg
-                    last_sent_seq = latest_frame_seq
-
-                part_header = (
-                    f"--{boundary}\r\n"
-                    f"Content-Type: image/jpeg\r\n"
-                    f"Content-Length: {len(jpeg)}\r\n"
-                    f"\r\n"
-                ).encode("utf-8")
-
-                yield part_header
-                yield jpeg
-                yield b"\r\n"
+                    ev.wait(timeout=2.0)
+                    continue
+
+                last_sent_seq = seq
+
+                # One shared, immutable chunk -> one write per frame per client
+                yield part
         except GeneratorExit:
             # client disconnected
             return
@@ -148,40 +141,57 @@ def stream_mjpg():
 
     return gen()
 
+def build_part(jpeg: bytes) -> bytes:
+    part_header = (
+        f"--{BOUNDARY}\r\n"
+        f"Content-Type: image/jpeg\r\n"
+        f"Content-Length: {len(jpeg)}\r\n"
+        f"\r\n"
+    ).encode("utf-8")
+    return b"".join((part_header, jpeg, b"\r\n"))
+
 def zmq_receiver():
-    global latest_jpeg, latest_meta, latest_frame_seq
+    global LATEST, frame_event
 
     ctx = zmq.Context.instance()
     sub = ctx.socket(zmq.SUB)
+    # Real-time: keep queues tiny (prefer drop over latency growth).
+    # Set before connect() so the option applies to the broker pipe.
+    # (CONFLATE would be ideal but libzmq does not support it for
+    # multipart messages.)
+    sub.setsockopt(zmq.RCVHWM, 2)
+    sub.setsockopt(zmq.RCVBUF, SOCK_BUF_BYTES)
+    sub.setsockopt(zmq.TCP_KEEPALIVE, 1)
+    sub.setsockopt(zmq.LINGER, 0)
     sub.connect(SUB_ENDPOINT)
     sub.setsockopt(zmq.SUBSCRIBE, SUB_TOPIC)
 
-    # Real-time: keep queues tiny (prefer drop over latency growth)
-    sub.setsockopt(zmq.RCVHWM, 2)
-
     print(f"Node C subscribed to {SUB_ENDPOINT} topic={SUB_TOPIC!r}")
     print(f"HTTP bound to http://{HTTP_HOST}:{HTTP_PORT}/ (threads={HTTP_THREADS})")
 
     last_log = time.time()
     frames = 0
+    seq = 0
 
     while True:
         topic, header_b, jpeg_in = sub.recv_multipart()
-        header = json.loads(header_b.decode("utf-8"))
-
-        with frame_cond:
-            latest_jpeg = jpeg_in
-            latest_meta = {
-                "frame_id": header.get("frame_id"),
-                "w": header.get("w"),
-                "h": header.get("h"),
-                "mode": header.get("mode"),
-                "processed": header.get("processed"),
-                "ts": header.get("ts"),
-                "ts_processed": header.get("ts_processed"),
-            }
-            latest_frame_seq += 1
-            frame_cond.notify_all()
+        header = orjson.loads(header_b)
+        part = build_part(jpeg_in)
+
+        meta = {
+            "frame_id": header.get("frame_id"),
+            "w": header.get("w"),
+            "h": header.get("h"),
+            "mode": header.get("mode"),
+            "processed": header.get("processed"),
+            "ts": header.get("ts"),
+            "ts_processed": header.get("ts_processed"),
+        }
+
+        seq += 1
+        LATEST = (seq, jpeg_in, part, meta)
+        ev, frame_event = frame_event, threading.Event()
+        ev.set()
 
         frames += 1
         now = time.time()
@@ -25,7 +25,7 @@
 
 import os
 import sys
-import time
+import threading
 from pathlib import Path
 
 import zmq
@@ -42,14 +42,13 @@ if str(PROJECT_ROOT) not in sys.path:
 from shared.observability import (  # noqa: E402
     init as obs_init,
     SERVICE as OBS_SERVICE,
-    INSTANCE as OBS_INSTANCE,
     FRAMES_IN,
     FRAMES_OUT,
     BYTES_IN,
     BYTES_OUT,
-    STAGE_SECONDS,
     ERRORS,
 )
+from shared.zmq_tuning import tune_socket  # noqa: E402
 
 
 def getenv_str(name: str, default: str) -> str:
@@ -82,10 +81,78 @@ XPUB_VERBOSE = getenv_int("XPUB_VERBOSE", 0)
 # Prometheus metrics
 METRICS_PORT = validate_port(getenv_int("METRICS_PORT", 9102), "METRICS_PORT")
 
+# Frame/byte counters come from zmq.proxy's capture socket (1=yes, 0=no).
+# With 0 the broker is a pure C-level forwarder with no per-message Python.
+BROKER_CAPTURE = getenv_int("BROKER_CAPTURE", 1)
+CAPTURE_ENDPOINT = "inproc://broker-capture"
+
 PUB_BIND = f"tcp://{BROKER_BIND_HOST}:{PUB_PORT}"
 SUB_BIND = f"tcp://{BROKER_BIND_HOST}:{SUB_PORT}"
 
 
+TOPIC_XSUB = "xsub_in"
+TOPIC_XPUB = "xpub_out"
+TOPIC_SUBS = "subs"
+
+
+def capture_metrics(ctx: zmq.Context) -> None:
+    """
+    Count messages copied to the proxy's capture socket.
+
+    Runs off the data path: the capture PUB drops instead of blocking,
+    so a slow metrics thread never slows down forwarding.
+    """
+    sub = ctx.socket(zmq.SUB)
+    sub.setsockopt(zmq.LINGER, 0)
+    sub.setsockopt(zmq.SUBSCRIBE, b"")
+    sub.connect(CAPTURE_ENDPOINT)
+
+    # Labelled metric children, resolved once instead of per message
+    frames_in_xsub = FRAMES_IN.labels(OBS_SERVICE, TOPIC_XSUB)
+    bytes_in_xsub = BYTES_IN.labels(OBS_SERVICE, TOPIC_XSUB)
+    frames_out_xpub = FRAMES_OUT.labels(OBS_SERVICE, TOPIC_XPUB)
+    bytes_out_xpub = BYTES_OUT.labels(OBS_SERVICE, TOPIC_XPUB)
+    frames_in_subs = FRAMES_IN.labels(OBS_SERVICE, TOPIC_SUBS)
+    bytes_in_subs = BYTES_IN.labels(OBS_SERVICE, TOPIC_SUBS)
+    frames_out_subs = FRAMES_OUT.labels(OBS_SERVICE, TOPIC_SUBS)
+    bytes_out_subs = BYTES_OUT.labels(OBS_SERVICE, TOPIC_SUBS)
+
+    try:
+        while True:
+            msg = sub.recv_multipart(copy=False)
+            # zmq.Frame length is read straight from the libzmq message;
+            # data messages are always [topic, header, payload].
+            if len(msg) == 3:
+                total_bytes = len(msg[0]) + len(msg[1]) + len(msg[2])
+            else:
+                total_bytes = sum(len(f) for f in msg)
+
+            # Subscription frames (XPUB -> XSUB) are a single part starting
+            # with 0x01 (subscribe) or 0x00 (unsubscribe); all else is data.
+            first = msg[0].bytes if len(msg) == 1 else b""
+            if first[:1] in (b"\x00", b"\x01"):
+                frames_in_subs.inc()
+                bytes_in_subs.inc(total_bytes)
+                frames_out_subs.inc()
+                bytes_out_subs.inc(total_bytes)
+
+                if XPUB_VERBOSE:
+                    action = "SUB" if first[0] == 1 else "UNSUB"
+                    topic = first[1:].decode("utf-8", errors="replace")
+                    print(f"[{action}] topic='{topic}'")
+            else:
+                frames_in_xsub.inc()
+                bytes_in_xsub.inc(total_bytes)
+                frames_out_xpub.inc()
+                bytes_out_xpub.inc(total_bytes)
+    except zmq.ContextTerminated:
+        pass
+    except Exception as e:
+        ERRORS.labels(OBS_SERVICE, "broker_capture", type(e).__name__).inc()
+    finally:
+        sub.close()
+
+
 def main() -> int:
     # Start metrics endpoint
     obs_init(service="broker", metrics_port=METRICS_PORT)
@@ -94,87 +161,50 @@ def main() -> int:
 
     xsub = ctx.socket(zmq.XSUB)
     xsub.setsockopt(zmq.LINGER, 0)
+    tune_socket(xsub)
     xsub.bind(PUB_BIND)
 
     xpub = ctx.socket(zmq.XPUB)
     xpub.setsockopt(zmq.LINGER, 0)
+    tune_socket(xpub)
     if XPUB_VERBOSE:
         xpub.setsockopt(zmq.XPUB_VERBOSE, 1)
     xpub.bind(SUB_BIND)
 
+    capture = None
+    if BROKER_CAPTURE:
+        capture = ctx.socket(zmq.PUB)
+        capture.setsockopt(zmq.LINGER, 0)
+        capture.bind(CAPTURE_ENDPOINT)
+        threading.Thread(target=capture_metrics, args=(ctx,), daemon=True).start()
+
     print("Broker running:")
     print(f"  PUB -> {PUB_BIND}  (publishers connect here)")
     print(f"  SUB -> {SUB_BIND}  (subscribers connect here)")
-    print(f"  METRICS -> 0.0.0.0:{METRICS_PORT}/metrics")
+    print(f"  METRICS -> 0.0.0.0:{METRICS_PORT}/metrics (capture={'on' if capture else 'off'})")
     if XPUB_VERBOSE:
         print("  XPUB_VERBOSE=1 (subscription logging enabled)")
 
-    poller = zmq.Poller()
-    poller.register(xsub, zmq.POLLIN)
-    poller.register(xpub, zmq.POLLIN)
-
-    TOPIC_XSUB = "xsub_in"
-    TOPIC_XPUB = "xpub_out"
-    TOPIC_SUBS = "subs"
-
     try:
-        while True:
-            events = dict(poller.poll(250))
-
-            # Publisher -> Subscriber (data frames)
-            if xsub in events:
-                t0 = time.time()
-                msg = xsub.recv_multipart()
-                STAGE_SECONDS.labels(OBS_SERVICE, OBS_INSTANCE, "broker_recv_xsub").observe(time.time() - t0)
-
-                total_bytes = sum(len(p) for p in msg) if msg else 0
-                FRAMES_IN.labels(OBS_SERVICE, OBS_INSTANCE, TOPIC_XSUB).inc()
-                BYTES_IN.labels(OBS_SERVICE, OBS_INSTANCE, TOPIC_XSUB).inc(total_bytes)
-
-                t1 = time.time()
-                xpub.send_multipart(msg)
-                STAGE_SECONDS.labels(OBS_SERVICE, OBS_INSTANCE, "broker_send_xpub").observe(time.time() - t1)
-
-                FRAMES_OUT.labels(OBS_SERVICE, OBS_INSTANCE, TOPIC_XPUB).inc()
-                BYTES_OUT.labels(OBS_SERVICE, OBS_INSTANCE, TOPIC_XPUB).inc(total_bytes)
-
-            # Subscriber subscription frames -> Publisher side (topic subscriptions)
-            if xpub in events:
-                t2 = time.time()
-                sub_msg = xpub.recv_multipart()
-                STAGE_SECONDS.labels(OBS_SERVICE, OBS_INSTANCE, "broker_recv_xpub").observe(time.time() - t2)
-
-                sub_bytes = sum(len(p) for p in sub_msg) if sub_msg else 0
-                FRAMES_IN.labels(OBS_SERVICE, OBS_INSTANCE, TOPIC_SUBS).inc()
-                BYTES_IN.labels(OBS_SERVICE, OBS_INSTANCE, TOPIC_SUBS).inc(sub_bytes)
-
-                t3 = time.time()
-                xsub.send_multipart(sub_msg)
-                STAGE_SECONDS.labels(OBS_SERVICE, OBS_INSTANCE, "broker_send_xsub").observe(time.time() - t3)
-
-                FRAMES_OUT.labels(OBS_SERVICE, OBS_INSTANCE, TOPIC_SUBS).inc()
-                BYTES_OUT.labels(OBS_SERVICE, OBS_INSTANCE, TOPIC_SUBS).inc(sub_bytes)
-
-                if XPUB_VERBOSE and sub_msg and sub_msg[0] and len(sub_msg[0]) >= 1:
-                    action = "SUB" if sub_msg[0][0] == 1 else "UNSUB"
-                    topic = sub_msg[0][1:].decode("utf-8", errors="replace")
-                    print(f"[{action}] topic='{topic}'")
+        # libzmq forwards both directions (data and subscriptions) in C;
+        # no per-message Python on the data path.
+        zmq.proxy(xsub, xpub, capture)
 
     except KeyboardInterrupt:
         print("Broker stopping (KeyboardInterrupt).")
         return 0
+    except zmq.ContextTerminated:
+        return 0
     except Exception as e:
-        ERRORS.labels(OBS_SERVICE, OBS_INSTANCE, "broker_main", type(e).__name__).inc()
+        ERRORS.labels(OBS_SERVICE, "broker_main", type(e).__name__).inc()
         raise
     finally:
-        try:
-            xsub.close()
-        except Exception:
-            pass
-        try:
-            xpub.close()
-        except Exception:
-            pass
+        for sock in (xsub, xpub, capture):
+            try:
+                if sock is not None:
+                    sock.close()
+            except Exception:
+                pass
         try:
             ctx.term()
         except Exception:
@@ -3,15 +3,23 @@
 # Capturer: reads video and publishes JPEG frames to ZMQ broker
 # ------------------------------------------------------------
 
-import json
 import os
+import queue
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import cv2
+import orjson
 import zmq
 
+try:
+    import av  # PyAV, only needed for RAW_MJPEG_PASSTHROUGH
+except Exception:  # pragma: no cover
+    av = None  # type: ignore
+
 # ------------------------------------------------------------
 # Ensure project root is on PYTHONPATH
 # ------------------------------------------------------------
@@ -22,15 +30,17 @@ if str(PROJECT_ROOT) not in sys.path:
 
 # Now it's safe to import from shared.*
 from shared.crypto import encrypt_bytes  # noqa: E402
+from shared.zmq_tuning import tune_socket  # noqa: E402
 from shared.observability import (  # noqa: E402
     init as obs_init,
     SERVICE as OBS_SERVICE,
-    INSTANCE as OBS_INSTANCE,
     FRAMES_OUT,
     BYTES_OUT,
     JPEG_BYTES,
-    STAGE_SECONDS,
+    stage_histogram,
     ERRORS,
+    STAGE_SAMPLE_EVERY,
+    DETAILED_METRICS,
 )
 
 
@@ -78,11 +88,77 @@ JPEG_QUALITY = getenv_int("JPEG_QUALITY", 80)
 LOOP = getenv_bool("LOOP", True)
 FALLBACK_FPS = getenv_float("FALLBACK_FPS", 25.0)
 
+# FFmpeg hardware decode for OpenCV: any | none | vaapi | mfx | d3d11
+# ("any" silently falls back to software decoding when no device exists)
+VIDEO_HW_ACCEL = getenv_str("VIDEO_HW_ACCEL", "any").strip().upper()
+
+# MJPEG sources: publish the stored JPEG frames as-is (no decode, no
+# cv2.imencode). Other codecs keep the OpenCV path.
+RAW_MJPEG_PASSTHROUGH = getenv_bool("RAW_MJPEG_PASSTHROUGH", False)
+
+# Skipped frames between publishes are grab()bed (no BGR conversion); from
+# this many on, the capturer seeks instead (FFmpeg still decodes from the
+# previous keyframe, so short gaps are cheaper to grab). 0 = never seek.
+SEEK_MIN_FRAMES = getenv_int("SEEK_MIN_FRAMES", 50)
+
 METRICS_PORT = validate_port(getenv_int("METRICS_PORT", 9101), "METRICS_PORT")
 
+# JPEG encode + encrypt workers (cv2.imencode and AES-GCM release the GIL)
+ENCODE_WORKERS = max(1, getenv_int("ENCODE_WORKERS", 2))
+
 PUB_ENDPOINT = f"tcp://{BROKER_HOST}:{PUB_PORT}"
 
 
+class MjpegPassthrough:
+    """
+    Compressed frames of an MJPEG video via PyAV demuxing.
+    Each packet is already a complete JPEG, so read() returns bytes.
+    """
+
+    def __init__(self, path: str):
+        self.container = av.open(path)
+        self.stream = self.container.streams.video[0]
+        self.codec = self.stream.codec_context.name
+        self.w = int(self.stream.codec_context.width)
+        self.h = int(self.stream.codec_context.height)
+        self.fps = float(self.stream.average_rate or 0)
+        self._packets = self.container.demux(self.stream)
+
+    def read(self):
+        for packet in self._packets:
+            if packet.size:  # demux ends with an empty flush packet
+                return True, bytes(packet)
+        return False, None
+
+    def grab(self) -> bool:
+        ok, _ = self.read()
+        return ok
+
+    def rewind(self) -> None:
+        self.container.seek(0)
+        self._packets = self.container.demux(self.stream)
+
+    def release(self) -> None:
+        self.container.close()
+
+
+def open_video():
+    """Return (source, passthrough). Prefers MJPEG passthrough when enabled."""
+    if RAW_MJPEG_PASSTHROUGH:
+        if av is None:
+            print("[capturer] PyAV not installed, RAW_MJPEG_PASSTHROUGH disabled")
+        else:
+            src = MjpegPassthrough(VIDEO_PATH)
+            if src.codec == "mjpeg":
+                return src, True
+            print(f"[capturer] Video codec is {src.codec}, not mjpeg; decoding with OpenCV")
+            src.release()
+
+    accel = getattr(cv2, f"VIDEO_ACCELERATION_{VIDEO_HW_ACCEL}", cv2.VIDEO_ACCELERATION_ANY)
+    cap = cv2.VideoCapture(VIDEO_PATH, cv2.CAP_FFMPEG, [cv2.CAP_PROP_HW_ACCELERATION, accel])
+    return cap, False
+
+
 def main() -> int:
     # Start Prometheus metrics
     obs_init(service="capturer", metrics_port=METRICS_PORT)
@@ -90,99 +166,185 @@ def main() -> int:
     ctx = zmq.Context.instance()
     pub = ctx.socket(zmq.PUB)
     pub.setsockopt(zmq.LINGER, 0)
+    tune_socket(pub, immediate=True)
     pub.connect(PUB_ENDPOINT)
 
-    cap = cv2.VideoCapture(VIDEO_PATH)
-    if not cap.isOpened():
-        ERRORS.labels(OBS_SERVICE, OBS_INSTANCE, "capturer", "video_open_fail").inc()
+    try:
+        cap, passthrough = open_video()
+    except Exception:
+        ERRORS.labels(OBS_SERVICE, "capturer", "video_open_fail").inc()
+        raise
+    if not passthrough and not cap.isOpened():
+        ERRORS.labels(OBS_SERVICE, "capturer", "video_open_fail").inc()
         raise RuntimeError(f"Cannot open {VIDEO_PATH}")
 
-    video_fps = cap.get(cv2.CAP_PROP_FPS)
+    video_fps = cap.fps if passthrough else cap.get(cv2.CAP_PROP_FPS)
     if not video_fps or video_fps <= 0:
         video_fps = FALLBACK_FPS
 
-    period = 1.0 / video_fps
     encode_params = [cv2.IMWRITE_JPEG_QUALITY, int(JPEG_QUALITY)]
 
     frame_id = 0
-    next_publish_time = time.time()
     time.sleep(0.5)  # PUB/SUB slow joiner
 
     topic_str = TOPIC.decode("utf-8", "ignore")
 
+    # Labelled metric children, resolved once instead of per frame
+    total_seconds = stage_histogram("capturer_total", OBS_SERVICE)
+    encode_seconds = stage_histogram("capturer_encode_jpeg", OBS_SERVICE) if DETAILED_METRICS else None
+    jpeg_bytes_out = JPEG_BYTES.labels(OBS_SERVICE, "out")
+    frames_out = FRAMES_OUT.labels(OBS_SERVICE, topic_str)
+    bytes_out = BYTES_OUT.labels(OBS_SERVICE, topic_str)
+    imencode_errors = ERRORS.labels(OBS_SERVICE, "capturer", "imencode_fail")
+
+    def encode_frame(frame_id: int, ts_capture: float, frame):
+        """Worker: BGR frame (or passthrough JPEG) -> encrypted (header, payload)."""
+        t_start = time.perf_counter()
+        if passthrough:
+            # frame is already a JPEG
+            payload = frame
+            w, h = cap.w, cap.h
+        else:
+            h, w = frame.shape[:2]
+
+            ok2, jpg = cv2.imencode(".jpg", frame, encode_params)
+            if DETAILED_METRICS:
+                encode_seconds.observe(time.perf_counter() - t_start)
+            if not ok2:
+                return None
+            payload = jpg  # encrypted straight from the numpy buffer
+
+        jpeg_bytes_out.observe(len(payload))
+
+        header = {
+            "frame_id": frame_id,
+            "ts_capture": ts_capture,
+            "encoding": "jpeg",
+            "mode": "BGR",
+            "w": int(w),
+            "h": int(h),
+            "src": "video",
+            "video": VIDEO_PATH,
+            "video_fps": float(video_fps),
+            "publish_every_sec": float(PUBLISH_EVERY_SEC),
+            "jpeg_quality": None if passthrough else int(JPEG_QUALITY),
+        }
+
+        # -----------------------------------------
+        # DevSecOps "Sec": encrypt content, keep TOPIC plaintext
+        # -----------------------------------------
+        enc_header = encrypt_bytes(orjson.dumps(header))
+        enc_payload = encrypt_bytes(payload)
+
+        # One sampled per-frame observation (encode + encrypt)
+        if frame_id % STAGE_SAMPLE_EVERY == 0:
+            total_seconds.observe(time.perf_counter() - t_start)
+        return enc_header, enc_payload
+
+    def send_loop():
+        """Sender: waits on futures in submission order, so frames stay ordered."""
+        while True:
+            fut = pending.get()
+            if fut is None:
+                return
+            try:
+                result = fut.result()
+            except Exception as e:
+                ERRORS.labels(OBS_SERVICE, "capturer_encode", type(e).__name__).inc()
+                continue
+            if result is None:
+                imencode_errors.inc()
+                continue
+
+            enc_header, enc_payload = result
+
+            # copy=False: libzmq sends straight from the token's
+            # buffer (pyzmq keeps the object alive until sent).
+            # Parts under zmq.COPY_THRESHOLD are still copied,
+            # which is cheaper for small frames like the header.
+            pub.send_multipart([TOPIC, enc_header, enc_payload], copy=False)
+
+            frames_out.inc()
+
+            wire_bytes = len(enc_header) + len(enc_payload)
+            bytes_out.inc(wire_bytes)
+
+    # Pipeline: this thread reads/paces the video, a pool encodes and
+    # encrypts in parallel, and one sender thread owns the PUB socket.
+    # The bounded FIFO of futures applies backpressure to the reader.
+    pool = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="encode")
+    pending: queue.Queue = queue.Queue(maxsize=ENCODE_WORKERS * 2)
+    sender = threading.Thread(target=send_loop, daemon=True)
+    sender.start()
+
     print(f"[capturer] Video={VIDEO_PATH} FPS≈{video_fps:.2f}")
+    if passthrough:
+        print("[capturer] MJPEG passthrough: publishing stored JPEG frames (no re-encode)")
+    else:
+        hw = int(cap.get(cv2.CAP_PROP_HW_ACCELERATION))
+        print(f"[capturer] Decode: OpenCV/FFmpeg hw_accel={'on' if hw else 'off'} (VIDEO_HW_ACCEL={VIDEO_HW_ACCEL.lower()})")
     print(f"[capturer] Publish every {PUBLISH_EVERY_SEC:.3f}s → {PUB_ENDPOINT} topic={topic_str}")
+    print(f"[capturer] Encode workers={ENCODE_WORKERS}")
     print(f"[capturer] Metrics on :{METRICS_PORT}/metrics")
 
+    # Deadline scheduling on the monotonic clock (integer ns): publish k
+    # happens at deadline_ns, and the video plays in real time from
+    # video_start_ns, so each publish takes the frame that is "on screen"
+    # at its deadline. Only that frame is decoded to BGR.
+    publish_ns = max(1, int(PUBLISH_EVERY_SEC * 1e9))
+    deadline_ns = time.monotonic_ns()
+    video_start_ns = deadline_ns
+    pos = 0  # index of the next frame the source will return
+
     try:
         while True:
-            t_loop = time.time()
+            target = int((deadline_ns - video_start_ns) * video_fps / 1e9)
+            skip = target - pos
+            if skip > 0:
+                if SEEK_MIN_FRAMES and skip >= SEEK_MIN_FRAMES and not passthrough:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+                else:
+                    for _ in range(skip):
+                        if not cap.grab():
+                            break
+                pos = target
 
             ok, frame = cap.read()
             if not ok:
                 if LOOP:
-                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    if passthrough:
+                        cap.rewind()
+                    else:
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    video_start_ns = deadline_ns
+                    pos = 0
                     continue
                 print("[capturer] End of video")
                 break
-
-            now = time.time()
-            if now >= next_publish_time:
-                h, w = frame.shape[:2]
-
-                t_enc = time.time()
-                ok2, jpg = cv2.imencode(".jpg", frame, encode_params)
-                STAGE_SECONDS.labels(
-                    OBS_SERVICE, OBS_INSTANCE, "capturer_encode_jpeg"
-                ).observe(time.time() - t_enc)
-
-                if ok2:
-                    payload = jpg.tobytes()
-                    JPEG_BYTES.labels(OBS_SERVICE, OBS_INSTANCE, "out").observe(len(payload))
-
-                    header = {
-                        "frame_id": frame_id,
-                        "ts_capture": now,
-                        "encoding": "jpeg",
-                        "mode": "BGR",
-                        "w": int(w),
-                        "h": int(h),
-                        "src": "video",
-                        "video": VIDEO_PATH,
-                        "video_fps": float(video_fps),
-                        "publish_every_sec": float(PUBLISH_EVERY_SEC),
-                        "jpeg_quality": int(JPEG_QUALITY),
-                    }
-
-                    # -----------------------------------------
-                    # DevSecOps "Sec": encrypt content, keep TOPIC plaintext
-                    # -----------------------------------------
-                    header_bytes = json.dumps(header).encode("utf-8")
-                    enc_header = encrypt_bytes(header_bytes)
-                    enc_payload = encrypt_bytes(payload)
-
-                    pub.send_multipart([TOPIC, enc_header, enc_payload])
-
-                    FRAMES_OUT.labels(OBS_SERVICE, OBS_INSTANCE, topic_str).inc()
-
-                    wire_bytes = len(enc_header) + len(enc_payload)
-                    BYTES_OUT.labels(OBS_SERVICE, OBS_INSTANCE, topic_str).inc(wire_bytes)
-
-                    frame_id += 1
-                else:
-                    ERRORS.labels(OBS_SERVICE, OBS_INSTANCE, "capturer", "imencode_fail").inc()
-
-                next_publish_time += PUBLISH_EVERY_SEC
-                if now - next_publish_time > PUBLISH_EVERY_SEC * 5:
-                    next_publish_time = now + PUBLISH_EVERY_SEC
-
-            elapsed = time.time() - t_loop
-            if elapsed < period:
-                time.sleep(period - elapsed)
+            pos += 1
+
+            # cap.read() returns a fresh array each call, so the
+            # worker can own `frame` without a copy
+            pending.put(pool.submit(encode_frame, frame_id, time.time(), frame))
+            frame_id += 1
+
+            deadline_ns += publish_ns
+            now_ns = time.monotonic_ns()
+            if now_ns - deadline_ns > publish_ns * 5:
+                # Far behind (e.g. stalled): resync instead of bursting
+                deadline_ns = now_ns + publish_ns
+            delay_ns = deadline_ns - now_ns
+            if delay_ns > 0:
+                time.sleep(delay_ns / 1e9)
+
+        # drain: send everything already submitted
+        pending.put(None)
+        sender.join()
 
     except KeyboardInterrupt:
         print("[capturer] Stopped")
     finally:
+        pool.shutdown(wait=False, cancel_futures=True)
         cap.release()
         pub.close()
         ctx.term()
@@ -2,7 +2,7 @@
 Docstring for shared.crypto
 Run this to generate a key:
 
-python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"
+python -c "import base64, os; print(base64.urlsafe_b64encode(os.urandom(32)).decode())"
 
 and copy paste it into every node that you want to use encryption. For example:
 
@@ -15,21 +15,48 @@ services:
     ...
     environment:
     - PAYLOAD_KEY=RmTnzrS0_DwulCzF6tj8qSOQpCmnOkRmKeezZcZA4T4=
+
+Payloads are sealed with AES-256-GCM (one pass, AES-NI + PCLMUL in
+OpenSSL) as nonce(12) || ciphertext || tag(16), without base64.
+Existing Fernet keys keep working: a Fernet key is the same urlsafe
+base64 encoding of 32 random bytes. A 64-char hex key is accepted too.
+The wire format changed, so upgrade all nodes together.
 '''
 
+import base64
+import binascii
+import functools
 import os
-from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
 _KEY_ENV = "PAYLOAD_KEY"
+_NONCE_SIZE = 12
 
 def _get_key() -> bytes:
     k = os.getenv(_KEY_ENV, "").encode()
     if not k:
-        raise RuntimeError(f"Missing env var {_KEY_ENV}. Generate with: python -c \"from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())\"")
+        raise RuntimeError(f"Missing env var {_KEY_ENV}. Generate with: python -c \"import base64, os; print(base64.urlsafe_b64encode(os.urandom(32)).decode())\"")
     return k
 
-def encrypt_bytes(data: bytes) -> bytes:
-    return Fernet(_get_key()).encrypt(data)
-
-def decrypt_bytes(token: bytes) -> bytes:
-    return Fernet(_get_key()).decrypt(token)
+def _decode_key(k: bytes) -> bytes:
+    try:
+        raw = bytes.fromhex(k.decode()) if len(k) == 64 else base64.urlsafe_b64decode(k)
+    except (ValueError, binascii.Error) as e:
+        raise RuntimeError(f"{_KEY_ENV} is not valid hex or urlsafe base64: {e}") from e
+    if len(raw) not in (16, 24, 32):
+        raise RuntimeError(f"{_KEY_ENV} must decode to 16, 24 or 32 bytes, got {len(raw)}")
+    return raw
+
+@functools.lru_cache(maxsize=1)
+def _aesgcm(key: bytes) -> AESGCM:
+    # Keyed by the env value, so a changed PAYLOAD_KEY builds a new instance
+    return AESGCM(_decode_key(key))
+
+def encrypt_bytes(data) -> bytes:
+    # data: any bytes-like object (bytes, memoryview, numpy buffer)
+    nonce = os.urandom(_NONCE_SIZE)
+    return nonce + _aesgcm(_get_key()).encrypt(nonce, data, None)
+
+def decrypt_bytes(token) -> bytes:
+    view = memoryview(token)
+    return _aesgcm(_get_key()).decrypt(view[:_NONCE_SIZE], view[_NONCE_SIZE:], None)
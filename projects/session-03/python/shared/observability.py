@@ -9,7 +9,11 @@ Usage (in each service):
 
 Env vars (optional):
   METRICS_PORT=9101
-  INSTANCE=<name>   (defaults to HOSTNAME or "local")
+  INSTANCE=<name>   (defaults to HOSTNAME or "local"; not a metric label,
+                    Prometheus adds "instance" from the scrape target)
+  STAGE_SAMPLE_EVERY=16   observe per-frame stage latency for 1 frame in N
+  DETAILED_METRICS=0      1 = also record the per-sub-stage histograms
+  HEARTBEAT_SECS=1.0      process cpu%/rss refresh interval
 """
 
 from __future__ import annotations
@@ -34,51 +38,79 @@ SERVICE: str = os.getenv("SERVICE", "unknown")
 INSTANCE: str = os.getenv("INSTANCE", os.getenv("HOSTNAME", "local"))
 METRICS_PORT: int = int(os.getenv("METRICS_PORT", "9100"))
 
+# Per-frame stage timing: one "<service>_total" histogram, sampled 1/N.
+# Sub-stage histograms (decrypt, decode, encode, ...) only for debugging.
+STAGE_SAMPLE_EVERY: int = max(1, int(os.getenv("STAGE_SAMPLE_EVERY", "16")))
+DETAILED_METRICS: bool = os.getenv("DETAILED_METRICS", "0").strip().lower() in ("1", "true", "yes", "on")
+
+HEARTBEAT_SECS: float = float(os.getenv("HEARTBEAT_SECS", "1.0"))
+
 _started = False
 
 
 # -----------------------------
 # Core metrics (shared)
 # -----------------------------
+# No "instance" label: the scrape target already provides one, and a
+# second copy only multiplies series (and clashes as exported_instance).
 FRAMES_IN = Counter(
     "frames_in_total",
     "Frames received (events/messages)",
-    ["service", "instance", "topic"],
+    ["service", "topic"],
 )
 FRAMES_OUT = Counter(
     "frames_out_total",
     "Frames sent (events/messages)",
-    ["service", "instance", "topic"],
+    ["service", "topic"],
 )
 
 BYTES_IN = Counter(
     "bytes_in_total",
     "Bytes received (payload bytes; best-effort)",
-    ["service", "instance", "topic"],
+    ["service", "topic"],
 )
 BYTES_OUT = Counter(
     "bytes_out_total",
     "Bytes sent (payload bytes; best-effort)",
-    ["service", "instance", "topic"],
+    ["service", "topic"],
 )
 
 ERRORS = Counter(
     "errors_total",
     "Errors (count)",
-    ["service", "instance", "where", "type"],
+    ["service", "where", "type"],
 )
 
-STAGE_SECONDS = Histogram(
-    "stage_seconds",
-    "Stage latency in seconds",
-    ["service", "instance", "stage"],
-    buckets=(0.001, 0.003, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5),
-)
+# Stage latency: one histogram per stage, "stage_<stage>_seconds", with
+# buckets sized for that stage (a single family must share one bucket set,
+# which was too coarse for sub-ms stages and too fine for codec ones).
+# Created on first use by stage_histogram().
+_WAIT_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)        # blocking recv
+_CODEC_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1)  # JPEG work
+_FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005)  # crypto, parsing
+STAGE_DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+
+STAGE_BUCKETS = {
+    "capturer_total": (0.002, 0.005, 0.01, 0.02, 0.05, 0.1),
+    "capturer_encode_jpeg": _CODEC_BUCKETS,
+    "transformer_total": _CODEC_BUCKETS,
+    "transformer_recv": _WAIT_BUCKETS,
+    "transformer_decrypt": _FAST_BUCKETS,
+    "transformer_parse_header": _FAST_BUCKETS,
+    "transformer_decode": _CODEC_BUCKETS,
+    "transformer_encode_jpeg": _CODEC_BUCKETS,
+    "transformer_gray_lossless": _CODEC_BUCKETS,
+    "transformer_encrypt": _FAST_BUCKETS,
+    "web_total": _FAST_BUCKETS,
+    "web_recv_zmq": _WAIT_BUCKETS,
+    "web_decrypt": _FAST_BUCKETS,
+    "web_parse_header": _FAST_BUCKETS,
+}
 
 JPEG_BYTES = Histogram(
     "jpeg_bytes",
     "JPEG payload size in bytes",
-    ["service", "instance", "direction"],  # direction: in|out
+    ["service", "direction"],  # direction: in|out
     buckets=(10_000, 30_000, 60_000, 120_000, 250_000, 500_000, 1_000_000, 2_000_000),
 )
 
@@ -86,7 +118,7 @@ JPEG_BYTES = Histogram(
 E2E_SECONDS = Histogram(
     "e2e_seconds",
     "End-to-end latency seconds (capture->node_c_ingest)",
-    ["service", "instance"],
+    ["service"],
     buckets=(0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5),
 )
 
@@ -94,19 +126,19 @@ E2E_SECONDS = Histogram(
 MJPEG_CLIENTS = Gauge(
     "mjpeg_clients",
     "Active MJPEG clients",
-    ["service", "instance"],
+    ["service"],
 )
 
 # Process stats (optional)
 PROC_RSS_BYTES = Gauge(
     "process_rss_bytes",
     "Process RSS bytes",
-    ["service", "instance"],
+    ["service"],
 )
 PROC_CPU_PERCENT = Gauge(
     "process_cpu_percent",
     "Process CPU percent",
-    ["service", "instance"],
+    ["service"],
 )
 
 
@@ -130,6 +162,9 @@ def init(
     if metrics_port is not None:
         METRICS_PORT = int(metrics_port)
 
+    _stage_cache.clear()
+    _err_cache.clear()
+
     if _started:
         return
 
@@ -147,15 +182,21 @@ def _start_process_heartbeat() -> None:
     def run():
         try:
             p = psutil.Process()
+            rss_bytes = PROC_RSS_BYTES.labels(SERVICE)
+            cpu_percent = PROC_CPU_PERCENT.labels(SERVICE)
             # prime cpu measurement
             p.cpu_percent(interval=None)
             while True:
                 try:
-                    PROC_RSS_BYTES.labels(SERVICE, INSTANCE).set(p.memory_info().rss)
-                    PROC_CPU_PERCENT.labels(SERVICE, INSTANCE).set(p.cpu_percent(interval=None))
+                    # oneshot(): both values come from one /proc read
+                    with p.oneshot():
+                        rss = p.memory_info().rss
+                        cpu = p.cpu_percent(interval=None)
+                    rss_bytes.set(rss)
+                    cpu_percent.set(cpu)
                 except Exception:
                     pass
-                time.sleep(1.0)
+                time.sleep(HEARTBEAT_SECS)
         except Exception:
             return
 
@@ -166,15 +207,97 @@ def _start_process_heartbeat() -> None:
 # -----------------------------
 # Convenience helpers (optional)
 # -----------------------------
+class CounterBatch:
+    """
+    Per-frame counter increments summed locally and pushed to the
+    Counter children every `every_n` adds or `every_sec` seconds, so the
+    hot loop takes the metric locks ~1/every_n as often.
+
+    One batch per thread (not thread-safe); call flush() on shutdown, and
+    when the stream goes idle (due_in() says how long a wait may last
+    before pending counts would be late).
+    """
+
+    def __init__(self, *children, every_n: int = 100, every_sec: float = 0.1):
+        self.children = children
+        self.every_n = every_n
+        self.every_ns = int(every_sec * 1e9)
+        self.pending = [0] * len(children)
+        self.count = 0
+        self.last_flush_ns = time.monotonic_ns()
+
+    def add(self, *amounts) -> None:
+        pending = self.pending
+        for i, amount in enumerate(amounts):
+            pending[i] += amount
+        self.count += 1
+        if self.count >= self.every_n or time.monotonic_ns() - self.last_flush_ns >= self.every_ns:
+            self.flush()
+
+    def due_in(self) -> float:
+        """Seconds until pending counts are due (0 when already due)."""
+        left_ns = self.every_ns - (time.monotonic_ns() - self.last_flush_ns)
+        return max(0, left_ns) / 1e9
+
+    def flush(self) -> None:
+        for i, child in enumerate(self.children):
+            if self.pending[i]:
+                child.inc(self.pending[i])
+                self.pending[i] = 0
+        self.count = 0
+        self.last_flush_ns = time.monotonic_ns()
+
+
+_topic_cache: dict[bytes, str] = {}
+
+
 def topic_str(topic: bytes | str) -> str:
+    # Topics are a handful of constants; decode each one only once
     if isinstance(topic, bytes):
-        return topic.decode("utf-8", "ignore")
+        s = _topic_cache.get(topic)
+        if s is None:
+            s = _topic_cache[topic] = topic.decode("utf-8", "ignore")
+        return s
     return topic
 
 
+# Label children resolved once per stage / error kind (cleared by init(),
+# since they are bound to the current SERVICE).
+_stage_hists: dict[str, Histogram] = {}
+_stage_lock = threading.Lock()
+_stage_cache: dict = {}
+_err_cache: dict = {}
+
+
+def stage_histogram(stage: str, service: Optional[str] = None):
+    """
+    Child of the "stage_<stage>_seconds" histogram for `service`
+    (default: SERVICE). Bind it once outside hot loops, then call
+    .observe(seconds).
+    """
+    service = SERVICE if service is None else service
+    child = _stage_cache.get((stage, service))
+    if child is None:
+        with _stage_lock:
+            hist = _stage_hists.get(stage)
+            if hist is None:
+                hist = _stage_hists[stage] = Histogram(
+                    f"stage_{stage}_seconds",
+                    f"Stage latency in seconds ({stage})",
+                    ["service"],
+                    buckets=STAGE_BUCKETS.get(stage, STAGE_DEFAULT_BUCKETS),
+                )
+            child = _stage_cache[(stage, service)] = hist.labels(service)
+    return child
+
+
 def observe_stage(stage: str, seconds: float) -> None:
-    STAGE_SECONDS.labels(SERVICE, INSTANCE, stage).observe(seconds)
+    stage_histogram(stage).observe(seconds)
 
 
 def inc_error(where: str, err_type: str, n: int = 1) -> None:
-    ERRORS.labels(SERVICE, INSTANCE, where, err_type).inc(n)
+    key = (where, err_type)
+    child = _err_cache.get(key)
+    if child is None:
+        child = _err_cache[key] = ERRORS.labels(SERVICE, where, err_type)
+    child.inc(n)
@@ -0,0 +1,83 @@
+# zmq_tuning.py
+"""
+Socket options shared by the hot ZMQ sockets of the pipeline.
+
+Env vars (optional):
+  ZMQ_SNDHWM=8      send queue limit (messages) on PUB/XPUB sockets
+  ZMQ_RCVHWM=8      receive queue limit (messages) on SUB/XSUB sockets
+  ZMQ_BUSY_POLL=0   1 = spin on non-blocking recv instead of sleeping in
+                    the kernel; lower wake-up latency, one core at 100%
+
+Video frames are only useful while they are fresh, so the queues are kept
+short: a full PUB queue drops frames instead of building up latency.
+HWM options only apply to connections made after they are set, so call
+tune_socket() before bind()/connect().
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from typing import Optional
+
+import zmq
+
+
+def _getenv_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+SNDHWM: int = _getenv_int("ZMQ_SNDHWM", 8)
+RCVHWM: int = _getenv_int("ZMQ_RCVHWM", 8)
+BUSY_POLL: bool = _getenv_int("ZMQ_BUSY_POLL", 0) == 1
+
+
+def tune_socket(
+    sock: zmq.Socket,
+    *,
+    sndhwm: Optional[int] = None,
+    rcvhwm: Optional[int] = None,
+    immediate: bool = False,
+) -> zmq.Socket:
+    """Apply keepalive + explicit HWMs (env defaults unless given)."""
+    sock.setsockopt(zmq.TCP_KEEPALIVE, 1)
+    sock.setsockopt(zmq.SNDHWM, SNDHWM if sndhwm is None else sndhwm)
+    sock.setsockopt(zmq.RCVHWM, RCVHWM if rcvhwm is None else rcvhwm)
+    if immediate:
+        # Only queue to completed connections: while the broker is
+        # unreachable, frames are dropped rather than buffered.
+        sock.setsockopt(zmq.IMMEDIATE, 1)
+    return sock
+
+
+def poll_in(sock: zmq.Socket, timeout_s: float) -> bool:
+    """
+    True when a message can be received within timeout_s (spinning, like
+    recv_multipart(), when ZMQ_BUSY_POLL=1).
+    """
+    if not BUSY_POLL:
+        return bool(sock.poll(int(timeout_s * 1000)))
+    deadline = time.monotonic() + timeout_s
+    while not sock.poll(0):
+        if time.monotonic() >= deadline:
+            return False
+    return True
+
+
+def recv_multipart(sock: zmq.Socket, copy: bool = True) -> list:
+    """
+    recv_multipart() that busy-polls when ZMQ_BUSY_POLL=1.
+
+    Spinning skips the sleep/wake-up through the scheduler on every
+    message at the cost of a fully used core; leave it off on shared hosts.
+    """
+    if not BUSY_POLL:
+        return sock.recv_multipart(copy=copy)
+    while True:
+        try:
+            return sock.recv_multipart(zmq.NOBLOCK, copy=copy)
+        except zmq.Again:
+            continue
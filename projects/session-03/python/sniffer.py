@@ -6,9 +6,14 @@
 #!/usr/bin/env python3
 import os
 import time
-import binascii
+import json
 import zmq
 
+try:
+    import orjson  # lebih cepat, opsional
+except Exception:  # pragma: no cover
+    orjson = None  # type: ignore
+
 BROKER_HOST = os.getenv("BROKER_HOST", "broker-session03")  # nama service di docker-compose
 SUB_PORT = int(os.getenv("SUB_PORT", "5556"))  # port SUB side (xpub bind)
 TOPIC = os.getenv("TOPIC", "")                 # "" = semua topic
@@ -16,8 +21,10 @@ N = int(os.getenv("N", "10"))                  # berapa message
 
 ENDPOINT = f"tcp://{BROKER_HOST}:{SUB_PORT}"
 
+JPEG_SOI = b"\xff\xd8\xff"
+
 def is_probably_jpeg(b: bytes) -> bool:
-    return len(b) >= 3 and b[0] == 0xFF and b[1] == 0xD8 and b[2] == 0xFF
+    return b[:3] == JPEG_SOI
 
 def preview_utf8(b: bytes, limit: int = 120) -> str:
     try:
@@ -26,6 +33,20 @@ def preview_utf8(b: bytes, limit: int = 120) -> str:
     except Exception:
         return "<not utf8>"
 
+def looks_like_json(b: bytes) -> bool:
+    # cek 1 byte pertama dulu; parse penuh hanya kalau mungkin JSON object
+    if b[:1] != b"{":
+        return False
+    # parse langsung dari bytes (tanpa decode + repr)
+    try:
+        if orjson is not None:
+            orjson.loads(b)
+        else:
+            json.loads(b)
+        return True
+    except Exception:
+        return False
+
 def main():
     ctx = zmq.Context.instance()
     s = ctx.socket(zmq.SUB)
@@ -43,14 +64,14 @@ def main():
         print(f"--- msg {i} parts={len(parts)} ---")
 
         for idx, p in enumerate(parts):
-            head_hex = binascii.hexlify(p[:16]).decode()
+            head_hex = p[:16].hex()
             print(f"  part[{idx}] len={len(p)} hex16={head_hex} utf8={preview_utf8(p)}")
 
         # quick heuristics for the common 3-part pattern: [topic, header, jpeg]
         if len(parts) >= 3:
             header_part = parts[1]
             payload_part = parts[2]
-            looks_json = preview_utf8(header_part).startswith("'{'") or preview_utf8(header_part).startswith('"{')
+            looks_json = looks_like_json(header_part)
             looks_jpeg = is_probably_jpeg(payload_part)
 
             if looks_json:
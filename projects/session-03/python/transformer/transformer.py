@@ -3,15 +3,23 @@
 # Transformer: subscribes to raw frames, processes, republishes
 # ------------------------------------------------------------
 
-import io
-import json
+import heapq
 import os
+import queue
 import sys
+import threading
 import time
 from pathlib import Path
 
+import numpy as np
+import orjson
+import simplejpeg
 import zmq
-from PIL import Image
+
+try:
+    from turbojpeg import TurboJPEG  # needs libturbojpeg on the system
+except Exception:  # pragma: no cover
+    TurboJPEG = None  # type: ignore
 
 # ------------------------------------------------------------
 # Ensure project root is on PYTHONPATH
@@ -22,17 +30,20 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 from shared.crypto import decrypt_bytes, encrypt_bytes  # noqa: E402
+from shared.zmq_tuning import BUSY_POLL, poll_in, recv_multipart, tune_socket  # noqa: E402
 from shared.observability import (  # noqa: E402
     init as obs_init,
     SERVICE as OBS_SERVICE,
-    INSTANCE as OBS_INSTANCE,
     FRAMES_IN,
     FRAMES_OUT,
     BYTES_IN,
     BYTES_OUT,
     JPEG_BYTES,
-    STAGE_SECONDS,
+    stage_histogram,
     ERRORS,
+    STAGE_SAMPLE_EVERY,
+    DETAILED_METRICS,
+    CounterBatch,
 )
 
 
@@ -66,24 +77,71 @@ PUB_TOPIC = getenv_str("PUB_TOPIC", "processed").encode("utf-8")
 
 JPEG_QUALITY_OUT = getenv_int("JPEG_QUALITY_OUT", 85)
 
+# Grayscale strategy:
+#   lossless: strip Cb/Cr at the DCT-coefficient level (no decode/encode,
+#             no requantization); needs PyTurboJPEG + libturbojpeg
+#   reencode: decode Y plane, re-encode at JPEG_QUALITY_OUT
+# lossless falls back to reencode when libturbojpeg is unavailable.
+GRAY_MODE = getenv_str("GRAY_MODE", "lossless").strip().lower()
+
 METRICS_PORT = validate_port(getenv_int("METRICS_PORT", 9103), "METRICS_PORT")
 
+# recv thread -> TRANSFORM_WORKERS -> send thread, joined by bounded queues
+# of PIPELINE_QUEUE_SIZE frames (the oldest frame is dropped when full)
+TRANSFORM_WORKERS = max(1, getenv_int("TRANSFORM_WORKERS", 2))
+PIPELINE_QUEUE_SIZE = max(1, getenv_int("PIPELINE_QUEUE_SIZE", 4))
+
+# After each blocking recv, drain up to this many already-queued messages
+# without blocking, so a burst is handled in one pass
+RECV_BATCH = max(1, getenv_int("RECV_BATCH", 8))
+
 SUB_ENDPOINT = f"tcp://{BROKER_HOST}:{SUB_PORT}"
 PUB_ENDPOINT = f"tcp://{BROKER_HOST}:{PUB_PORT}"
 
 
-def jpeg_bytes_to_pil(b: bytes) -> Image.Image:
-    return Image.open(io.BytesIO(b))
+def jpeg_bytes_to_gray(b: bytes) -> np.ndarray:
+    # libjpeg-turbo (SIMD) decodes only the Y plane: no RGB intermediate
+    # and no separate RGB -> L pass. Shape is (h, w, 1).
+    return simplejpeg.decode_jpeg(b, colorspace="GRAY")
+
+
+def gray_to_jpeg_bytes(gray: np.ndarray, quality: int = 85) -> bytes:
+    # Single-component JPEG, no Huffman optimize pass
+    return simplejpeg.encode_jpeg(gray, quality=quality, colorspace="GRAY")
 
 
-def pil_to_jpeg_bytes(img: Image.Image, quality: int = 85) -> bytes:
-    buf = io.BytesIO()
-    img.save(buf, format="JPEG", quality=quality, optimize=True)
-    return buf.getvalue()
+def jpeg_to_gray_lossless(tj, b: bytes) -> tuple[bytes, int, int]:
+    # Same as `jpegtran -grayscale`: the Y DC/AC coefficients are copied
+    # untouched and Cb/Cr are stripped, so neither IDCT nor FDCT runs.
+    w, h, _, _ = tj.decode_header(b)
+    return tj.crop(b, 0, 0, w, h, gray=True, copynone=True), w, h
 
 
-def to_grayscale(img_rgb: Image.Image) -> Image.Image:
-    return img_rgb.convert("L")  # grayscale
+def init_turbojpeg():
+    if GRAY_MODE != "lossless":
+        return None
+    if TurboJPEG is None:
+        print("[transformer] PyTurboJPEG not installed, falling back to GRAY_MODE=reencode")
+        return None
+    try:
+        return TurboJPEG()
+    except Exception as e:
+        print(f"[transformer] libturbojpeg not available ({e}), falling back to GRAY_MODE=reencode")
+        return None
+
+
+def put_drop_oldest(q: queue.Queue, item):
+    """Put without blocking; if the queue is full, evict and return the oldest item."""
+    dropped = None
+    while True:
+        try:
+            q.put_nowait(item)
+            return dropped
+        except queue.Full:
+            try:
+                dropped = q.get_nowait()
+            except queue.Empty:
+                pass
 
 
 def main() -> int:
@@ -94,122 +152,251 @@ def main() -> int:
 
     sub = ctx.socket(zmq.SUB)
     sub.setsockopt(zmq.LINGER, 0)
+    tune_socket(sub)
     sub.connect(SUB_ENDPOINT)
     sub.setsockopt(zmq.SUBSCRIBE, SUB_TOPIC)
 
     pub = ctx.socket(zmq.PUB)
     pub.setsockopt(zmq.LINGER, 0)
+    tune_socket(pub, immediate=True)
     pub.connect(PUB_ENDPOINT)
 
+    tj = init_turbojpeg()
+
     time.sleep(0.5)  # PUB/SUB slow joiner
 
     sub_topic_str = SUB_TOPIC.decode("utf-8", "ignore")
     pub_topic_str = PUB_TOPIC.decode("utf-8", "ignore")
 
-    print(f"[transformer] Subscribed to {SUB_ENDPOINT} topic={sub_topic_str}")
-    print(f"[transformer] Publishing to {PUB_ENDPOINT} topic={pub_topic_str}")
-    print(f"[transformer] JPEG_QUALITY_OUT={JPEG_QUALITY_OUT}")
-    print(f"[transformer] Metrics on :{METRICS_PORT}/metrics")
-
-    try:
-        while True:
+    # Labelled metric children, resolved once instead of per frame
+    # (sub-stage series only exist with DETAILED_METRICS)
+    def stage(name: str, detailed: bool = True):
+        if detailed and not DETAILED_METRICS:
+            return None
+        return stage_histogram(name, OBS_SERVICE)
+
+    total_seconds = stage("transformer_total", detailed=False)
+    recv_seconds = stage("transformer_recv")
+    decrypt_seconds = stage("transformer_decrypt")
+    parse_header_seconds = stage("transformer_parse_header")
+    decode_seconds = stage("transformer_decode")
+    encode_seconds = stage("transformer_encode_jpeg")
+    gray_lossless_seconds = stage("transformer_gray_lossless")
+    encrypt_seconds = stage("transformer_encrypt")
+    frames_in = FRAMES_IN.labels(OBS_SERVICE, sub_topic_str)
+    bytes_in = BYTES_IN.labels(OBS_SERVICE, sub_topic_str)
+    frames_out = FRAMES_OUT.labels(OBS_SERVICE, pub_topic_str)
+    bytes_out = BYTES_OUT.labels(OBS_SERVICE, pub_topic_str)
+    jpeg_bytes_in = JPEG_BYTES.labels(OBS_SERVICE, "in")
+    jpeg_bytes_out = JPEG_BYTES.labels(OBS_SERVICE, "out")
+    # frames/bytes counters are batched per thread (recv / send)
+    in_counts = CounterBatch(frames_in, bytes_in)
+    out_counts = CounterBatch(frames_out, bytes_out)
+    frames_dropped = ERRORS.labels(OBS_SERVICE, "transformer_recv_queue", "dropped")
+
+    # Items are (seq, ...). seq is assigned on receive; the send thread
+    # restores that order, since workers may finish out of order.
+    # (seq, None) on send_q means "nothing to send for seq" (dropped/failed);
+    # a bare None stops the send thread.
+    recv_q: queue.Queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    send_q: queue.Queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+
+    def transform(enc_header_f, enc_jpeg_f, sampled: bool):
+        """Encrypted raw frame -> encrypted grayscale (header, payload)."""
+        # By default only one "transformer_total" observation is made, for
+        # 1 frame in STAGE_SAMPLE_EVERY. With DETAILED_METRICS the stage
+        # timers are chained: each stage boundary is a single
+        # perf_counter() read that ends one stage and starts the next.
+        detailed = DETAILED_METRICS
+        t1 = time.perf_counter()
+
+        # -------------------------
+        # Decrypt header + payload
+        # -------------------------
+        # Decrypted straight from libzmq's buffers (frames were received
+        # with copy=False)
+        header_b = decrypt_bytes(enc_header_f.buffer)
+        jpeg_in = decrypt_bytes(enc_jpeg_f.buffer)
+        if detailed:
+            t2 = time.perf_counter()
+            decrypt_seconds.observe(t2 - t1)
+
+        jpeg_bytes_in.observe(len(jpeg_in))
+
+        # -------------------------
+        # Parse header
+        # -------------------------
+        header = orjson.loads(header_b)
+        if detailed:
+            t3 = time.perf_counter()
+            parse_header_seconds.observe(t3 - t2)
+
+        if tj is not None:
             # -------------------------
-            # Receive (encrypted parts)
+            # Grayscale in the DCT domain (fast path)
             # -------------------------
-            t_recv = time.time()
-            topic, enc_header_b, enc_jpeg_in = sub.recv_multipart()
-            STAGE_SECONDS.labels(
-                OBS_SERVICE, OBS_INSTANCE, "transformer_recv"
-            ).observe(time.time() - t_recv)
-
-            FRAMES_IN.labels(OBS_SERVICE, OBS_INSTANCE, sub_topic_str).inc()
-            wire_in_bytes = len(enc_header_b) + len(enc_jpeg_in)
-            BYTES_IN.labels(OBS_SERVICE, OBS_INSTANCE, sub_topic_str).inc(wire_in_bytes)
-
+            jpeg_out, w, h = jpeg_to_gray_lossless(tj, jpeg_in)
+            if detailed:
+                t4 = time.perf_counter()
+                gray_lossless_seconds.observe(t4 - t3)
+        else:
             # -------------------------
-            # Decrypt header + payload
+            # Decode (straight to grayscale)
             # -------------------------
-            t_decsec = time.time()
-            header_b = decrypt_bytes(enc_header_b)
-            jpeg_in = decrypt_bytes(enc_jpeg_in)
-            STAGE_SECONDS.labels(
-                OBS_SERVICE, OBS_INSTANCE, "transformer_decrypt"
-            ).observe(time.time() - t_decsec)
-
-            JPEG_BYTES.labels(OBS_SERVICE, OBS_INSTANCE, "in").observe(len(jpeg_in))
-
-            # -------------------------
-            # Parse header
-            # -------------------------
-            t_hdr = time.time()
-            header = json.loads(header_b.decode("utf-8"))
-            STAGE_SECONDS.labels(
-                OBS_SERVICE, OBS_INSTANCE, "transformer_parse_header"
-            ).observe(time.time() - t_hdr)
-
-            # -------------------------
-            # Decode
-            # -------------------------
-            t_dec = time.time()
-            img = jpeg_bytes_to_pil(jpeg_in).convert("RGB")
-            STAGE_SECONDS.labels(
-                OBS_SERVICE, OBS_INSTANCE, "transformer_decode"
-            ).observe(time.time() - t_dec)
-
-            # -------------------------
-            # Transform
-            # -------------------------
-            t_tr = time.time()
-            gray = to_grayscale(img)
-            STAGE_SECONDS.labels(
-                OBS_SERVICE, OBS_INSTANCE, "transformer_grayscale"
-            ).observe(time.time() - t_tr)
+            gray = jpeg_bytes_to_gray(jpeg_in)
+            if detailed:
+                t_dec = time.perf_counter()
+                decode_seconds.observe(t_dec - t3)
+            h, w = gray.shape[:2]
 
             # -------------------------
             # Encode
             # -------------------------
-            t_enc = time.time()
-            jpeg_out = pil_to_jpeg_bytes(gray, quality=JPEG_QUALITY_OUT)
-            STAGE_SECONDS.labels(
-                OBS_SERVICE, OBS_INSTANCE, "transformer_encode_jpeg"
-            ).observe(time.time() - t_enc)
+            jpeg_out = gray_to_jpeg_bytes(gray, quality=JPEG_QUALITY_OUT)
+            if detailed:
+                t4 = time.perf_counter()
+                encode_seconds.observe(t4 - t_dec)
+
+        jpeg_bytes_out.observe(len(jpeg_out))
+
+        # -------------------------
+        # Encrypt header + payload
+        # -------------------------
+        out_header = {
+            **header,
+            "processed": "grayscale",
+            "mode": "L",
+            "w": int(w),
+            "h": int(h),
+            "ts_processed": time.time(),
+        }
+
+        out_header_b = orjson.dumps(out_header)
+
+        enc_out_header = encrypt_bytes(out_header_b)
+        enc_jpeg_out = encrypt_bytes(jpeg_out)
+        if detailed or sampled:
+            t5 = time.perf_counter()
+            if detailed:
+                encrypt_seconds.observe(t5 - t4)
+            if sampled:
+                total_seconds.observe(t5 - t1)
+        return enc_out_header, enc_jpeg_out
+
+    def worker_loop():
+        # Codec and AES-GCM calls are in C and release the GIL, so the
+        # workers run in parallel with each other and with recv/send.
+        while True:
+            seq, enc_header_f, enc_jpeg_f = recv_q.get()
+            try:
+                out = transform(enc_header_f, enc_jpeg_f, seq % STAGE_SAMPLE_EVERY == 0)
+            except Exception as e:
+                ERRORS.labels(OBS_SERVICE, "transformer_worker", type(e).__name__).inc()
+                out = None
+            send_q.put((seq, out))
+
+    def send_loop():
+        next_seq = 0
+        ready: list = []  # min-heap of (seq, out) that arrived early
+        while True:
+            try:
+                # Block for as long as pending out-counts may wait
+                item = send_q.get(timeout=out_counts.due_in() if out_counts.count else None)
+            except queue.Empty:
+                out_counts.flush()  # idle: publish what was sent
+                continue
+            if item is None:
+                out_counts.flush()
+                return
+            heapq.heappush(ready, item)
+            while ready and ready[0][0] == next_seq:
+                _, out = heapq.heappop(ready)
+                next_seq += 1
+                if out is None:
+                    continue
+
+                enc_out_header, enc_jpeg_out = out
+
+                # -------------------------
+                # Publish
+                # -------------------------
+                # Zero-copy for the (large) payload; see capturer for details
+                pub.send_multipart([PUB_TOPIC, enc_out_header, enc_jpeg_out], copy=False)
+
+                wire_out_bytes = len(enc_out_header) + len(enc_jpeg_out)
+                out_counts.add(1, wire_out_bytes)
+
+    for i in range(TRANSFORM_WORKERS):
+        threading.Thread(target=worker_loop, name=f"transform-{i}", daemon=True).start()
+    send_thread = threading.Thread(target=send_loop, name="send", daemon=True)
+    send_thread.start()
 
-            JPEG_BYTES.labels(OBS_SERVICE, OBS_INSTANCE, "out").observe(len(jpeg_out))
+    print(f"[transformer] Subscribed to {SUB_ENDPOINT} topic={sub_topic_str}")
+    print(f"[transformer] Publishing to {PUB_ENDPOINT} topic={pub_topic_str}")
+    print(f"[transformer] JPEG_QUALITY_OUT={JPEG_QUALITY_OUT} GRAY_MODE={'lossless' if tj else 'reencode'}")
+    print(f"[transformer] Workers={TRANSFORM_WORKERS} queue={PIPELINE_QUEUE_SIZE} recv_batch={RECV_BATCH}")
+    if BUSY_POLL:
+        print("[transformer] ZMQ_BUSY_POLL=1 (spinning on recv)")
+    print(f"[transformer] Metrics on :{METRICS_PORT}/metrics")
 
+    seq = 0
+    try:
+        while True:
             # -------------------------
-            # Publish (encrypt header + payload)
+            # Receive (encrypted parts)
             # -------------------------
-            out_header = {
-                **header,
-                "processed": "grayscale",
-                "mode": gray.mode,  # "L"
-                "w": gray.width,
-                "h": gray.height,
-                "ts_processed": time.time(),
-            }
-
-            out_header_b = json.dumps(out_header).encode("utf-8")
-
-            t_encsec = time.time()
-            enc_out_header = encrypt_bytes(out_header_b)
-            enc_jpeg_out = encrypt_bytes(jpeg_out)
-            STAGE_SECONDS.labels(
-                OBS_SERVICE, OBS_INSTANCE, "transformer_encrypt"
-            ).observe(time.time() - t_encsec)
-
-            pub.send_multipart([PUB_TOPIC, enc_out_header, enc_jpeg_out])
-
-            FRAMES_OUT.labels(OBS_SERVICE, OBS_INSTANCE, pub_topic_str).inc()
-            wire_out_bytes = len(enc_out_header) + len(enc_jpeg_out)
-            BYTES_OUT.labels(OBS_SERVICE, OBS_INSTANCE, pub_topic_str).inc(wire_out_bytes)
+            t0 = time.perf_counter()
+            # Idle: publish pending in-counts once due instead of holding
+            # them until the next frame
+            if in_counts.count and not poll_in(sub, in_counts.due_in()):
+                in_counts.flush()
+                continue
+
+            # copy=False: zmq Frames; the ciphertexts are decrypted straight
+            # from libzmq's buffers without first copying them into bytes
+            batch = [recv_multipart(sub, copy=False)]
+            if DETAILED_METRICS:
+                recv_seconds.observe(time.perf_counter() - t0)
+
+            # Burst: take whatever else is already queued in libzmq
+            while len(batch) < RECV_BATCH:
+                try:
+                    batch.append(sub.recv_multipart(zmq.NOBLOCK, copy=False))
+                except zmq.Again:
+                    break
+
+            # Only the newest PIPELINE_QUEUE_SIZE frames of a burst could
+            # survive the drop-oldest queue; skip the rest up front
+            stale = len(batch) - PIPELINE_QUEUE_SIZE
+            for i, (topic_f, enc_header_f, enc_jpeg_f) in enumerate(batch):
+                wire_in_bytes = len(enc_header_f) + len(enc_jpeg_f)
+                in_counts.add(1, wire_in_bytes)
+                if i < stale:
+                    frames_dropped.inc()
+                    continue
+
+                # Real-time: when the workers fall behind, drop the oldest
+                # queued frame rather than let latency grow
+                dropped = put_drop_oldest(recv_q, (seq, enc_header_f, enc_jpeg_f))
+                if dropped is not None:
+                    frames_dropped.inc()
+                    send_q.put((dropped[0], None))
+                seq += 1
 
     except KeyboardInterrupt:
         print("[transformer] Stopped")
         return 0
     except Exception as e:
-        ERRORS.labels(OBS_SERVICE, OBS_INSTANCE, "transformer_main", type(e).__name__).inc()
+        ERRORS.labels(OBS_SERVICE, "transformer_main", type(e).__name__).inc()
         raise
     finally:
+        in_counts.flush()
+        # Stop the send thread so it flushes its out-counts too
+        try:
+            send_q.put(None, timeout=1.0)
+            send_thread.join(timeout=1.0)
+        except queue.Full:
+            pass
         try:
             sub.close()
         except Exception:
@@ -8,16 +8,16 @@
 # Exposes Prometheus metrics via shared/observability.py
 # ------------------------------------------------------------
 
-import json
+import asyncio
 import os
 import sys
-import threading
 import time
 from pathlib import Path
 
+import orjson
 import zmq
-from bottle import Bottle, HTTPResponse, response, static_file
-from waitress import serve
+import zmq.asyncio
+from aiohttp import web
 
 # ------------------------------------------------------------
 # Ensure project root is on PYTHONPATH so shared/* works
@@ -28,17 +28,19 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
 from shared.crypto import decrypt_bytes  # noqa: E402
+from shared.zmq_tuning import tune_socket  # noqa: E402
 from shared.observability import (  # noqa: E402
     init as obs_init,
     SERVICE as OBS_SERVICE,
-    INSTANCE as OBS_INSTANCE,
     BYTES_IN,
     E2E_SECONDS,
     ERRORS,
     FRAMES_IN,
     JPEG_BYTES,
     MJPEG_CLIENTS,
-    STAGE_SECONDS,
+    stage_histogram,
+    STAGE_SAMPLE_EVERY,
+    DETAILED_METRICS,
 )
 
 
@@ -69,8 +71,6 @@ SUB_TOPIC = getenv_str("SUB_TOPIC", "processed").encode("utf-8")
 HTTP_HOST = getenv_str("HTTP_HOST", "0.0.0.0")
 HTTP_PORT = validate_port(getenv_int("HTTP_PORT", 8000), "HTTP_PORT")
 
-HTTP_THREADS = getenv_int("HTTP_THREADS", 8)
-
 # Prometheus metrics
 METRICS_PORT = validate_port(getenv_int("METRICS_PORT", 9104), "METRICS_PORT")
 
@@ -83,154 +83,188 @@ SUB_TOPIC_STR = SUB_TOPIC.decode("utf-8", "ignore")
 STATIC_DIR = Path(__file__).parent / "static"
 INDEX_NAME = "index.html"
 
+BOUNDARY = "frame"
+
+NO_CACHE_HEADERS = {
+    "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
+    "Pragma": "no-cache",
+    "Expires": "0",
+}
+
+# Everything runs on one asyncio loop (ZMQ receiver + HTTP handlers), so
+# the shared state below needs no locks.
 latest_jpeg = None
+# Complete multipart chunk (boundary header + JPEG + CRLF) for the latest
+# frame. Built once by the receiver and shared by every MJPEG client.
+latest_part = None
 latest_meta = {}
-lock = threading.Lock()
-
-# Used to notify MJPEG streamers when a new frame arrives
-frame_cond = threading.Condition(lock)
 latest_frame_seq = 0  # increments for each new frame
 
-app = Bottle()
+# One asyncio.Event per MJPEG streamer, set by the receiver when a new
+# frame arrives. Clients that have not consumed the previous wakeup yet
+# are skipped.
+clients: set[asyncio.Event] = set()
+mjpeg_clients = None  # MJPEG_CLIENTS child, resolved in main()
 
 
-@app.get("/")
-def index():
-    return static_file(INDEX_NAME, root=str(STATIC_DIR))
+async def index(request: web.Request) -> web.StreamResponse:
+    return web.FileResponse(STATIC_DIR / INDEX_NAME)
 
 
-@app.get("/frame.jpg")
-def frame():
-    with lock:
-        data = latest_jpeg
+async def frame(request: web.Request) -> web.Response:
+    data = latest_jpeg
     if not data:
-        return HTTPResponse("No frame yet", status=503)
+        return web.Response(status=503, text="No frame yet")
 
-    response.content_type = "image/jpeg"
-    response.set_header("Cache-Control", "no-store, no-cache, must-revalidate, max-age=0")
-    response.set_header("Pragma", "no-cache")
-    response.set_header("Expires", "0")
-    return data
+    return web.Response(body=data, content_type="image/jpeg", headers=NO_CACHE_HEADERS)
 
 
-@app.get("/meta.json")
-def meta():
-    with lock:
-        m = dict(latest_meta) if latest_meta else {}
-    response.content_type = "application/json"
-    response.set_header("Cache-Control", "no-store")
-    return json.dumps(m)
+async def meta(request: web.Request) -> web.Response:
+    return web.Response(
+        body=orjson.dumps(latest_meta),
+        content_type="application/json",
+        headers={"Cache-Control": "no-store"},
+    )
 
 
-@app.get("/stream.mjpg")
-def stream_mjpg():
+async def stream_mjpg(request: web.Request) -> web.StreamResponse:
     """
     MJPEG streaming endpoint.
     Browser loads: <img src="/stream.mjpg">
+
+    Each client is a coroutine rather than a server thread, so the number
+    of concurrent streams is not capped by a thread pool.
     """
-    boundary = "frame"
-
-    response.content_type = f"multipart/x-mixed-replace; boundary={boundary}"
-    response.set_header("Cache-Control", "no-store, no-cache, must-revalidate, max-age=0")
-    response.set_header("Pragma", "no-cache")
-    response.set_header("Expires", "0")
-    response.set_header("X-Accel-Buffering", "no")  # reverse proxies should not buffer
-
-    def gen():
-        global latest_frame_seq
-        last_sent_seq = -1
-
-        MJPEG_CLIENTS.labels(OBS_SERVICE, OBS_INSTANCE).inc()
-        try:
-            while True:
-                with frame_cond:
-                    frame_cond.wait_for(
-                        lambda: latest_jpeg is not None and latest_frame_seq != last_sent_seq,
-                        timeout=2.0,
-                    )
-                    if latest_jpeg is None:
-                        continue
-
-                    jpeg = latest_jpeg
-                    last_sent_seq = latest_frame_seq
-
-                part_header = (
-                    f"--{boundary}\r\n"
-                    f"Content-Type: image/jpeg\r\n"
-                    f"Content-Length: {len(jpeg)}\r\n"
-                    f"\r\n"
-                ).encode("utf-8")
-
-                yield part_header
-                yield jpeg
-                yield b"\r\n"
-
-        except GeneratorExit:
-            return
-        except Exception:
-            return
-        finally:
-            MJPEG_CLIENTS.labels(OBS_SERVICE, OBS_INSTANCE).dec()
-
-    return gen()
-
-
-def zmq_receiver():
-    global latest_jpeg, latest_meta, latest_frame_seq
-
-    ctx = zmq.Context.instance()
+    resp = web.StreamResponse(
+        headers={
+            "Content-Type": f"multipart/x-mixed-replace; boundary={BOUNDARY}",
+            **NO_CACHE_HEADERS,
+            "X-Accel-Buffering": "no",  # reverse proxies should not buffer
+        }
+    )
+    await resp.prepare(request)
+
+    last_sent_seq = -1
+    my_evt = asyncio.Event()
+    my_evt.set()  # send the current frame right away
+    clients.add(my_evt)
+
+    mjpeg_clients.inc()
+    try:
+        while True:
+            await my_evt.wait()
+            my_evt.clear()
+
+            part = latest_part
+            if part is None or latest_frame_seq == last_sent_seq:
+                continue
+            last_sent_seq = latest_frame_seq
+
+            # One pre-joined chunk -> one write per frame per client;
+            # write() waits for this client's socket only, and frames
+            # published meanwhile are skipped, not queued
+            await resp.write(part)
+
+    except ConnectionResetError:
+        # Client went away mid-write; cancellation (disconnect seen by
+        # aiohttp, shutdown) propagates so the handler task ends cancelled
+        pass
+    finally:
+        clients.discard(my_evt)
+        mjpeg_clients.dec()
+
+    return resp
+
+
+def build_part(jpeg: bytes) -> bytes:
+    part_header = (
+        f"--{BOUNDARY}\r\n"
+        f"Content-Type: image/jpeg\r\n"
+        f"Content-Length: {len(jpeg)}\r\n"
+        f"\r\n"
+    ).encode("utf-8")
+    return b"".join((part_header, jpeg, b"\r\n"))
+
+
+async def zmq_receiver():
+    global latest_jpeg, latest_part, latest_meta, latest_frame_seq
+
+    ctx = zmq.asyncio.Context.instance()
     sub = ctx.socket(zmq.SUB)
     sub.setsockopt(zmq.LINGER, 0)
+    # Real-time: keep queues tiny (prefer drop over latency growth).
+    # Set before connect() so the HWM applies to the broker pipe.
+    tune_socket(sub, rcvhwm=2)
     sub.connect(SUB_ENDPOINT)
     sub.setsockopt(zmq.SUBSCRIBE, SUB_TOPIC)
 
-    # Real-time: keep queues tiny (prefer drop over latency growth)
-    sub.setsockopt(zmq.RCVHWM, 2)
-
     print(f"[web_server] Subscribed to {SUB_ENDPOINT} topic={SUB_TOPIC_STR}")
-    print(f"[web_server] HTTP bound to http://{HTTP_HOST}:{HTTP_PORT}/ (threads={HTTP_THREADS})")
+    print(f"[web_server] HTTP bound to http://{HTTP_HOST}:{HTTP_PORT}/")
     print(f"[web_server] Metrics on :{METRICS_PORT}/metrics")
 
-    while True:
-        try:
-            # -------------------------
-            # Receive (encrypted parts)
-            # -------------------------
-            t_recv = time.time()
-            topic, enc_header_b, enc_jpeg_in = sub.recv_multipart()
-            STAGE_SECONDS.labels(OBS_SERVICE, OBS_INSTANCE, "web_recv_zmq").observe(time.time() - t_recv)
-
-            FRAMES_IN.labels(OBS_SERVICE, OBS_INSTANCE, SUB_TOPIC_STR).inc()
-            wire_in_bytes = len(enc_header_b) + len(enc_jpeg_in)
-            BYTES_IN.labels(OBS_SERVICE, OBS_INSTANCE, SUB_TOPIC_STR).inc(wire_in_bytes)
-
-            # -------------------------
-            # Decrypt
-            # -------------------------
-            t_decsec = time.time()
-            header_b = decrypt_bytes(enc_header_b)
-            jpeg_in = decrypt_bytes(enc_jpeg_in)
-            STAGE_SECONDS.labels(OBS_SERVICE, OBS_INSTANCE, "web_decrypt").observe(time.time() - t_decsec)
-
-            JPEG_BYTES.labels(OBS_SERVICE, OBS_INSTANCE, "in").observe(len(jpeg_in))
-
-            # -------------------------
-            # Parse header
-            # -------------------------
-            t_hdr = time.time()
-            header = json.loads(header_b.decode("utf-8"))
-            STAGE_SECONDS.labels(OBS_SERVICE, OBS_INSTANCE, "web_parse_header").observe(time.time() - t_hdr)
-
-            # End-to-end latency: capture (Node A) -> ingest here (Node C)
-            ts_cap = header.get("ts_capture") or header.get("ts")
-            if ts_cap is not None:
-                try:
-                    E2E_SECONDS.labels(OBS_SERVICE, OBS_INSTANCE).observe(time.time() - float(ts_cap))
-                except Exception:
-                    pass
-
-            with frame_cond:
+    # Labelled metric children, resolved once instead of per frame
+    # (sub-stage series only exist with DETAILED_METRICS)
+    def stage(name: str, detailed: bool = True):
+        if detailed and not DETAILED_METRICS:
+            return None
+        return stage_histogram(name, OBS_SERVICE)
+
+    total_seconds = stage("web_total", detailed=False)
+    recv_seconds = stage("web_recv_zmq")
+    decrypt_seconds = stage("web_decrypt")
+    parse_header_seconds = stage("web_parse_header")
+    frames_in = FRAMES_IN.labels(OBS_SERVICE, SUB_TOPIC_STR)
+    bytes_in = BYTES_IN.labels(OBS_SERVICE, SUB_TOPIC_STR)
+    jpeg_bytes_in = JPEG_BYTES.labels(OBS_SERVICE, "in")
+    e2e_seconds = E2E_SECONDS.labels(OBS_SERVICE)
+
+    try:
+        while True:
+            try:
+                # -------------------------
+                # Receive (encrypted parts)
+                # -------------------------
+                # One sampled "web_total" observation per frame (ingest
+                # work, excluding the wait for the next message); chained
+                # sub-stage timers only with DETAILED_METRICS.
+                t0 = time.perf_counter()
+                topic, enc_header_b, enc_jpeg_in = await sub.recv_multipart()
+                t1 = time.perf_counter()
+                if DETAILED_METRICS:
+                    recv_seconds.observe(t1 - t0)
+
+                frames_in.inc()
+                wire_in_bytes = len(enc_header_b) + len(enc_jpeg_in)
+                bytes_in.inc(wire_in_bytes)
+
+                # -------------------------
+                # Decrypt
+                # -------------------------
+                header_b = decrypt_bytes(enc_header_b)
+                jpeg_in = decrypt_bytes(enc_jpeg_in)
+                if DETAILED_METRICS:
+                    t2 = time.perf_counter()
+                    decrypt_seconds.observe(t2 - t1)
+
+                jpeg_bytes_in.observe(len(jpeg_in))
+
+                # -------------------------
+                # Parse header
+                # -------------------------
+                header = orjson.loads(header_b)
+                if DETAILED_METRICS:
+                    parse_header_seconds.observe(time.perf_counter() - t2)
+
+                # End-to-end latency: capture (Node A) -> ingest here (Node C)
+                ts_cap = header.get("ts_capture") or header.get("ts")
+                if ts_cap is not None:
+                    try:
+                        e2e_seconds.observe(time.time() - float(ts_cap))
+                    except Exception:
+                        pass
+
                 latest_jpeg = jpeg_in
+                latest_part = build_part(jpeg_in)
                 latest_meta = {
                     "frame_id": header.get("frame_id"),
                     "w": header.get("w"),
@@ -241,26 +275,56 @@ def zmq_receiver():
                     "ts_processed": header.get("ts_processed"),
                 }
                 latest_frame_seq += 1
-                frame_cond.notify_all()
 
-        except Exception as e:
-            ERRORS.labels(OBS_SERVICE, OBS_INSTANCE, "web_zmq_receiver", type(e).__name__).inc()
-            continue
+                for evt in clients:
+                    if not evt.is_set():
+                        evt.set()
+
+                if latest_frame_seq % STAGE_SAMPLE_EVERY == 0:
+                    total_seconds.observe(time.perf_counter() - t1)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                ERRORS.labels(OBS_SERVICE, "web_zmq_receiver", type(e).__name__).inc()
+                continue
+    finally:
+        sub.close()
+
+
+async def receiver_ctx(app: web.Application):
+    task = asyncio.create_task(zmq_receiver())
+    yield
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+def build_app() -> web.Application:
+    app = web.Application()
+    app.router.add_get("/", index)
+    app.router.add_get("/frame.jpg", frame)
+    app.router.add_get("/meta.json", meta)
+    app.router.add_get("/stream.mjpg", stream_mjpg)
+    app.cleanup_ctx.append(receiver_ctx)
+    return app
 
 
 def main():
-    obs_init(service="web_server", metrics_port=METRICS_PORT)
+    global mjpeg_clients
 
-    t = threading.Thread(target=zmq_receiver, daemon=True)
-    t.start()
+    obs_init(service="web_server", metrics_port=METRICS_PORT)
+    mjpeg_clients = MJPEG_CLIENTS.labels(OBS_SERVICE)
 
     print(f"[web_server] Serving static from: {STATIC_DIR}")
     print(f"[web_server] Open UI:     http://{HTTP_HOST}:{HTTP_PORT}/")
     print(f"[web_server] MJPEG:       http://{HTTP_HOST}:{HTTP_PORT}/stream.mjpg")
     print(f"[web_server] ZMQ connect: {SUB_ENDPOINT} topic={SUB_TOPIC_STR}")
-    print(f"[web_server] Waitress:    threads={HTTP_THREADS}")
+    print("[web_server] Server:      aiohttp (asyncio)")
 
-    serve(app, host=HTTP_HOST, port=HTTP_PORT, threads=HTTP_THREADS)
+    web.run_app(build_app(), host=HTTP_HOST, port=HTTP_PORT, print=None)
 
 
 if __name__ == "__main__":
@@ -3,17 +3,21 @@ import pytest
 
 def pytest_addoption(parser):
     parser.addoption("--base-url", action="store", default=os.getenv("BASE_URL", "http://localhost:8088"))
-    parser.addoption("--api-url", action="store", default=os.getenv("API_URL", "http://localhost:8000"))
-    parser.addoption("--web-url", action="store", default=os.getenv("WEB_URL", "http://localhost:8080"))
+    parser.addoption("--api-url", action="store", default=os.getenv("API_URL", ""))  # optional override
+    parser.addoption("--web-url", action="store", default=os.getenv("WEB_URL", ""))  # optional override
 
-@pytest.fixture
-def base_url(request):
+@pytest.fixture(scope="session")
+def base_url(request) -> str:
     return request.config.getoption("--base-url").rstrip("/")
 
-@pytest.fixture
-def api_url(request):
-    return request.config.getoption("--api-url").rstrip("/")
+@pytest.fixture(scope="session")
+def api_url(request, base_url: str) -> str:
+    v = (request.config.getoption("--api-url") or "").strip()
+    # default: via gateway /api
+    return (v.rstrip("/") if v else f"{base_url}/api")
 
-@pytest.fixture
-def web_url(request):
-    return request.config.getoption("--web-url").rstrip("/")
+@pytest.fixture(scope="session")
+def web_url(request, base_url: str) -> str:
+    v = (request.config.getoption("--web-url") or "").strip()
+    # default: via gateway root
+    return (v.rstrip("/") if v else base_url)
@@ -11,41 +11,15 @@
 #
 # Notes:
 # - This test assumes you use the nginx gateway so the API is reachable at /api/*
+# - Options/URL fixtures live in tests/conftest.py
 # - If you don't use gateway, run with:
 #     --api-url http://localhost:8000 --web-url http://localhost:8080
 
 from __future__ import annotations
 
-import os
 import time
 import requests
 from tenacity import retry, stop_after_delay, wait_fixed
-import pytest
-
-
-def pytest_addoption(parser):
-    parser.addoption("--base-url", action="store", default=os.getenv("BASE_URL", "http://localhost:8088"))
-    parser.addoption("--api-url", action="store", default=os.getenv("API_URL", ""))  # optional override
-    parser.addoption("--web-url", action="store", default=os.getenv("WEB_URL", ""))  # optional override
-
-
-@pytest.fixture
-def base_url(request) -> str:
-    return request.config.getoption("--base-url").rstrip("/")
-
-
-@pytest.fixture
-def api_url(request, base_url: str) -> str:
-    v = (request.config.getoption("--api-url") or "").strip()
-    # default: via gateway /api
-    return (v.rstrip("/") if v else f"{base_url}/api")
-
-
-@pytest.fixture
-def web_url(request, base_url: str) -> str:
-    v = (request.config.getoption("--web-url") or "").strip()
-    # default: via gateway root
-    return (v.rstrip("/") if v else base_url)
 
 
 def _create_job(api_url: str, text: str) -> str:
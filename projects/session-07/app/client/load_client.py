@@ -3,12 +3,15 @@
 TTS load client for the FastAPI + Redis queue case study.
 
 Usage:
+  pip install -r client/requirements.txt
   python client/load_client.py --base-url http://tts.local --concurrency 20 --jobs 200
 
 Notes:
 - Calls API via {base-url}/api (because your Ingress routes /api -> api service).
-- Creates jobs via POST /api/jobs
-- Polls GET /api/jobs/{job_id} until DONE/FAILED or timeout
+- Creates jobs via POST /api/jobs, or in groups via POST /api/jobs:batch
+  with --batch-size > 1 (falls back to single POSTs if the API lacks it)
+- Waits on GET /api/jobs/{job_id}/wait (server-side long-poll) until DONE/FAILED
+  or timeout; falls back to polling GET /api/jobs/{job_id} if the API lacks it
 - Optionally verifies MP3 endpoint by sending a HEAD request to {base-url}{mp3_url}
 """
 
@@ -18,13 +21,21 @@ import argparse
 import asyncio
 import json
 import random
-import statistics
 import string
 import time
 from dataclasses import dataclass
 from typing import Optional, List, Dict, Any, Tuple
 
 import aiohttp
+import numpy as np
+
+
+# Columnar copy of Result for the summary (one pass over the results)
+RESULT_DTYPE = np.dtype([("ok", "?"), ("status", "U16"), ("create_ms", "f8"), ("total_ms", "f8"), ("polls", "i4")])
+
+# Shortest /wait timeout sent (sent with 0.1 s resolution; "0.0" would
+# return at once and turn the long-poll loop into a busy loop)
+LONG_POLL_MIN_S = 0.1
 
 
 @dataclass
@@ -39,26 +50,18 @@ class Result:
     error: Optional[str]
 
 
+_VOCAB = (
+    "hello", "this", "is", "a", "real", "synthesised", "mp3", "scalability",
+    "test", "for", "advanced", "software", "engineering", "and", "devops",
+    "kubernetes", "autoscaling", "worker", "queue", "redis", "minio", "fastapi",
+)
+
+
 def _rand_text(min_words: int = 10, max_words: int = 40) -> str:
-    words = random.randint(min_words, max_words)
-    vocab = [
-        "hello", "this", "is", "a", "real", "synthesised", "mp3", "scalability",
-        "test", "for", "advanced", "software", "engineering", "and", "devops",
-        "kubernetes", "autoscaling", "worker", "queue", "redis", "minio", "fastapi"
-    ]
-    return " ".join(random.choice(vocab) for _ in range(words)).capitalize() + "."
-
-
-def _percentile(xs: List[float], p: float) -> float:
-    if not xs:
-        return float("nan")
-    xs_sorted = sorted(xs)
-    k = (len(xs_sorted) - 1) * (p / 100.0)
-    f = int(k)
-    c = min(f + 1, len(xs_sorted) - 1)
-    if f == c:
-        return xs_sorted[f]
-    return xs_sorted[f] + (xs_sorted[c] - xs_sorted[f]) * (k - f)
+    k = random.randint(min_words, max_words)
+    # one random.choices() call instead of a random.choice() per word
+    s = " ".join(random.choices(_VOCAB, k=k))
+    return s[:1].upper() + s[1:] + "."
 
 
 async def create_job(session: aiohttp.ClientSession, api_base: str, text: str, voice: str, speed: float) -> Tuple[str, float]:
@@ -74,27 +77,81 @@ async def create_job(session: aiohttp.ClientSession, api_base: str, text: str, v
         return data["job_id"], dt
 
 
-async def poll_job(session: aiohttp.ClientSession, api_base: str, job_id: str, poll_interval: float, timeout_s: float) -> Tuple[Dict[str, Any], int, float]:
-    url = f"{api_base}/jobs/{job_id}"
+class BulkUnsupported(Exception):
+    """The API has no POST /jobs:batch (404/405)."""
+
+
+async def create_jobs_bulk(
+    session: aiohttp.ClientSession, api_base: str, texts: List[str], voice: str, speed: float
+) -> Tuple[List[str], float]:
+    url = f"{api_base}/jobs:batch"
+    payload = {"jobs": [{"text": t, "voice": voice, "speed": speed} for t in texts]}
     t0 = time.perf_counter()
+    async with session.post(url, json=payload) as resp:
+        body = await resp.text()
+        dt = (time.perf_counter() - t0) * 1000.0
+        if resp.status in (404, 405):
+            raise BulkUnsupported(f"{resp.status}: {body[:200]}")
+        if resp.status != 200:
+            raise RuntimeError(f"BULK CREATE failed {resp.status}: {body}")
+        data = json.loads(body)
+        return data["job_ids"], dt
+
+
+async def poll_job(
+    session: aiohttp.ClientSession,
+    api_base: str,
+    job_id: str,
+    poll_interval: float,
+    timeout_s: float,
+    long_poll_s: float = 0.0,
+    t0: Optional[float] = None,
+    poll_interval_max: Optional[float] = None,
+) -> Tuple[Dict[str, Any], int, float]:
+    # t0: start of the latency/timeout clock (default: now)
+    url = f"{api_base}/jobs/{job_id}"
+    t0 = time.perf_counter() if t0 is None else t0
     polls = 0
     while True:
         polls += 1
-        async with session.get(url) as resp:
-            data = await resp.json(content_type=None)
-            if resp.status != 200:
-                raise RuntimeError(f"GET job failed {resp.status}: {data}")
+        if long_poll_s > 0:
+            # Server holds the request until DONE/FAILED (or wait elapses)
+            wait_s = max(LONG_POLL_MIN_S, min(long_poll_s, timeout_s - (time.perf_counter() - t0)))
+            async with session.get(f"{url}/wait", params={"timeout": f"{wait_s:.1f}"}) as resp:
+                status = resp.status
+                try:
+                    data = await resp.json(content_type=None)
+                except ValueError:  # e.g. HTML 404 from the ingress
+                    data = {}
+            if status in (404, 405) and data.get("detail") != "job_id not found":
+                # Older API without /wait: plain polling from now on
+                long_poll_s = 0.0
+                polls -= 1
+                continue
+        else:
+            async with session.get(url) as resp:
+                data = await resp.json(content_type=None)
+                status = resp.status
+        if status != 200:
+            raise RuntimeError(f"GET job failed {status}: {data}")
         st = data.get("status")
         if st in ("DONE", "FAILED"):
             total_ms = (time.perf_counter() - t0) * 1000.0
             return data, polls, total_ms
 
-        if (time.perf_counter() - t0) > timeout_s:
+        # Long-poll: stop once less than one minimal wait is left
+        if timeout_s - (time.perf_counter() - t0) < (LONG_POLL_MIN_S if long_poll_s > 0 else 0.0):
             total_ms = (time.perf_counter() - t0) * 1000.0
             data["status"] = "TIMEOUT"
             return data, polls, total_ms
 
-        await asyncio.sleep(poll_interval)
+        if long_poll_s <= 0:
+            # Exponential backoff (x1.5 per poll, capped, +-20% jitter):
+            # most early polls of a multi-second job would see RUNNING
+            delay = poll_interval * (1.5 ** (polls - 1))
+            if poll_interval_max is not None:
+                delay = min(delay, poll_interval_max)
+            await asyncio.sleep(delay * random.uniform(0.8, 1.2))
 
 
 async def verify_mp3(session: aiohttp.ClientSession, base_url: str, mp3_url: str, method: str = "HEAD") -> bool:
@@ -104,44 +161,108 @@ async def verify_mp3(session: aiohttp.ClientSession, base_url: str, mp3_url: str
         return 200 <= resp.status < 300
 
 
-async def one_job(
-    sem: asyncio.Semaphore,
+def _create_failed(error: str) -> Result:
+    return Result(
+        ok=False, status="CREATE_FAILED", job_id="-", create_ms=0.0, total_ms=0.0, polls=0,
+        mp3_ok=None, error=error
+    )
+
+
+async def track_job(
     session: aiohttp.ClientSession,
     base_url: str,
     api_base: str,
-    voice: str,
-    speed: float,
+    job_id: str,
+    create_ms: float,
     poll_interval: float,
     timeout_s: float,
+    long_poll_s: float,
     check_mp3: bool,
     mp3_method: str,
+    poll_interval_max: Optional[float] = None,
+    t0: Optional[float] = None,
+) -> Result:
+    try:
+        data, polls, total_ms = await poll_job(
+            session, api_base, job_id, poll_interval, timeout_s, long_poll_s, t0, poll_interval_max
+        )
+        st = data.get("status", "UNKNOWN")
+        mp3_ok: Optional[bool] = None
+        if check_mp3 and st == "DONE":
+            mp3_url = data.get("mp3_url") or f"/mp3/{job_id}.mp3"
+            mp3_ok = await verify_mp3(session, base_url, mp3_url, method=mp3_method)
+        ok = (st == "DONE") and (mp3_ok is not False)
+        print(
+            f"[job] FINISHED job_id={job_id} "
+            f"status={st} total_ms={total_ms:.1f} polls={polls}"
+        )
+        return Result(ok=ok, status=st, job_id=job_id, create_ms=create_ms, total_ms=total_ms, polls=polls, mp3_ok=mp3_ok, error=data.get("error"))
+    except Exception as e:
+        return Result(ok=False, status="POLL_FAILED", job_id=job_id, create_ms=create_ms, total_ms=0.0, polls=0, mp3_ok=None, error=str(e))
+
+
+async def one_job(
+    sem: asyncio.Semaphore,
+    session: aiohttp.ClientSession,
+    text: str,
+    base_url: str,
+    api_base: str,
+    voice: str,
+    speed: float,
+    **track_kw: Any,
 ) -> Result:
     async with sem:
-        text = _rand_text()
         try:
             job_id, create_ms = await create_job(session, api_base, text, voice, speed)
             print(f"[job] CREATED job_id={job_id} create_ms={create_ms:.1f}")
         except Exception as e:
-            return Result(
-                ok=False, status="CREATE_FAILED", job_id="-", create_ms=0.0, total_ms=0.0, polls=0,
-                mp3_ok=None, error=str(e)
-            )
+            return _create_failed(str(e))
 
-        try:
-            data, polls, total_ms = await poll_job(session, api_base, job_id, poll_interval, timeout_s)
-            st = data.get("status", "UNKNOWN")
-            mp3_ok: Optional[bool] = None
-            if check_mp3 and st == "DONE":
-                mp3_url = data.get("mp3_url") or f"/mp3/{job_id}.mp3"
-                mp3_ok = await verify_mp3(session, base_url, mp3_url, method=mp3_method)
-            ok = (st == "DONE") and (mp3_ok is not False)
-            print(
-                f"[job] FINISHED job_id={job_id} "
-                f"status={st} total_ms={total_ms:.1f} polls={polls}"
-            )
-            return Result(ok=ok, status=st, job_id=job_id, create_ms=create_ms, total_ms=total_ms, polls=polls, mp3_ok=mp3_ok, error=data.get("error"))
-        except Exception as e:
-            return Result(ok=False, status="POLL_FAILED", job_id=job_id, create_ms=create_ms, total_ms=0.0, polls=0, mp3_ok=None, error=str(e))
+        return await track_job(session, base_url, api_base, job_id, create_ms, **track_kw)
+
+
+async def bulk_jobs(
+    sem: asyncio.Semaphore,
+    session: aiohttp.ClientSession,
+    texts: List[str],
+    batch_size: int,
+    base_url: str,
+    api_base: str,
+    voice: str,
+    speed: float,
+    **track_kw: Any,
+) -> Optional[List[Result]]:
+    """
+    Create all jobs in groups of `batch_size` (one POST each), then track
+    them with at most `concurrency` in flight. Latency and job timeout count
+    from the group's creation, so queueing behind earlier jobs is included.
+    Returns None if the API has no bulk endpoint.
+    """
+    async def submit(chunk: List[str]) -> Tuple[List[str], float, float]:
+        async with sem:
+            job_ids, create_ms = await create_jobs_bulk(session, api_base, chunk, voice, speed)
+            print(f"[bulk] CREATED {len(job_ids)} jobs create_ms={create_ms:.1f}")
+            return job_ids, create_ms, time.perf_counter()
+
+    chunks = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    created = await asyncio.gather(*(submit(c) for c in chunks), return_exceptions=True)
+    if all(isinstance(c, BulkUnsupported) for c in created):
+        return None
+
+    async def track(job_id: str, create_ms: float, t0: float) -> Result:
+        async with sem:
+            return await track_job(session, base_url, api_base, job_id, create_ms, t0=t0, **track_kw)
+
+    results: List[Result] = []
+    tasks = []
+    for chunk, c in zip(chunks, created):
+        if isinstance(c, BaseException):
+            results.extend(_create_failed(str(c)) for _ in chunk)
+            continue
+        job_ids, create_ms, t0 = c
+        tasks.extend(asyncio.create_task(track(job_id, create_ms, t0)) for job_id in job_ids)
+    results.extend(await asyncio.gather(*tasks))
+    return results
 
 
 async def main_async(args: argparse.Namespace) -> int:
@@ -149,23 +270,33 @@ async def main_async(args: argparse.Namespace) -> int:
     api_base = base_url + "/api"  # IMPORTANT: because ingress exposes API under /api
 
     timeout = aiohttp.ClientTimeout(total=args.http_timeout)
-    connector = aiohttp.TCPConnector(limit=0, ttl_dns_cache=30)
+    # Bounded keep-alive pool: ~concurrency sockets to the API, reused for
+    # every POST/GET/HEAD instead of new connections piling up
+    connector = aiohttp.TCPConnector(
+        limit=args.concurrency * 4,
+        limit_per_host=args.concurrency,
+        ttl_dns_cache=300,
+        keepalive_timeout=60,
+        enable_cleanup_closed=True,
+    )
 
     sem = asyncio.Semaphore(args.concurrency)
 
-    headers = {"Accept": "application/json"}
+    headers = {"Connection": "keep-alive", "Accept": "application/json"}
 
     print(f"[info] base_url   = {base_url}")
     print(f"[info] api_base   = {api_base}")
     print(f"[info] jobs       = {args.jobs}")
     print(f"[info] concurrency= {args.concurrency}")
-    print(f"[info] poll_intvl = {args.poll_interval}s, job_timeout={args.job_timeout}s")
+    print(f"[info] batch_size = {args.batch_size}")
+    print(f"[info] poll_intvl = {args.poll_interval}s..{args.poll_interval_max}s, job_timeout={args.job_timeout}s")
+    print(f"[info] long_poll  = {args.long_poll}s" if args.long_poll > 0 else "[info] long_poll  = disabled")
     if args.check_mp3:
         print(f"[info] mp3_check  = enabled ({args.mp3_method})")
 
     t_start = time.perf_counter()
 
-    async with aiohttp.ClientSession(timeout=timeout, connector=connector, headers=headers) as session:
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector, headers=headers, trust_env=False) as session:
         # quick health check
         try:
             async with session.get(f"{api_base}/healthz") as resp:
@@ -174,35 +305,44 @@ async def main_async(args: argparse.Namespace) -> int:
         except Exception as e:
             print(f"[warn] healthz failed: {e}")
 
-        tasks = [
-            asyncio.create_task(
-                one_job(
-                    sem, session,
-                    base_url=base_url,
-                    api_base=api_base,
-                    voice=args.voice,
-                    speed=args.speed,
-                    poll_interval=args.poll_interval,
-                    timeout_s=args.job_timeout,
-                    check_mp3=args.check_mp3,
-                    mp3_method=args.mp3_method,
-                )
-            )
-            for _ in range(args.jobs)
-        ]
-
-        results: List[Result] = await asyncio.gather(*tasks)
+        texts = [_rand_text() for _ in range(args.jobs)]
+        common = dict(
+            base_url=base_url,
+            api_base=api_base,
+            voice=args.voice,
+            speed=args.speed,
+            poll_interval=args.poll_interval,
+            poll_interval_max=max(args.poll_interval, args.poll_interval_max),
+            timeout_s=args.job_timeout,
+            long_poll_s=args.long_poll,
+            check_mp3=args.check_mp3,
+            mp3_method=args.mp3_method,
+        )
+
+        results: Optional[List[Result]] = None
+        if args.batch_size > 1:
+            results = await bulk_jobs(sem, session, texts, args.batch_size, **common)
+            if results is None:
+                print("[warn] POST /jobs:batch not available; creating jobs one by one")
+
+        if results is None:
+            tasks = [asyncio.create_task(one_job(sem, session, text, **common)) for text in texts]
+            results = await asyncio.gather(*tasks)
 
     elapsed_s = time.perf_counter() - t_start
 
-    ok = [r for r in results if r.ok]
-    failed = [r for r in results if not r.ok]
+    arr = np.fromiter(
+        ((r.ok, r.status, r.create_ms, r.total_ms, r.polls) for r in results),
+        dtype=RESULT_DTYPE,
+        count=len(results),
+    )
+    failed_idx = np.flatnonzero(~arr["ok"])
 
-    create_lat = [r.create_ms for r in results if r.create_ms > 0]
-    total_lat = [r.total_ms for r in results if r.total_ms > 0]
+    create_lat = arr["create_ms"][arr["create_ms"] > 0]
+    total_lat = arr["total_ms"][arr["total_ms"] > 0]
 
-    done = sum(1 for r in results if r.status == "DONE")
-    timeout_n = sum(1 for r in results if r.status == "TIMEOUT")
+    done = int((arr["status"] == "DONE").sum())
+    timeout_n = int((arr["status"] == "TIMEOUT").sum())
     failed_n = len(results) - done - timeout_n
 
     rps = (len(results) / elapsed_s) if elapsed_s > 0 else 0.0
@@ -215,29 +355,33 @@ async def main_async(args: argparse.Namespace) -> int:
     print(f"wall_time_s    : {elapsed_s:.2f}")
     print(f"submit_rate_rps: {rps:.2f}")
 
-    if create_lat:
+    if create_lat.size:
         print("\n-- Create latency (ms) --")
-        print(f"avg  : {statistics.mean(create_lat):.1f}")
-        print(f"p50  : {_percentile(create_lat, 50):.1f}")
-        print(f"p90  : {_percentile(create_lat, 90):.1f}")
-        print(f"p95  : {_percentile(create_lat, 95):.1f}")
-        print(f"p99  : {_percentile(create_lat, 99):.1f}")
-
-    if total_lat:
+        # one sort for all percentiles (linear interpolation, as before)
+        p50, p90, p95, p99 = np.quantile(create_lat, [0.5, 0.9, 0.95, 0.99])
+        print(f"avg  : {create_lat.mean():.1f}")
+        print(f"p50  : {p50:.1f}")
+        print(f"p90  : {p90:.1f}")
+        print(f"p95  : {p95:.1f}")
+        print(f"p99  : {p99:.1f}")
+
+    if total_lat.size:
         print("\n-- Total latency until DONE/FAILED/TIMEOUT (ms) --")
-        print(f"avg  : {statistics.mean(total_lat):.1f}")
-        print(f"p50  : {_percentile(total_lat, 50):.1f}")
-        print(f"p90  : {_percentile(total_lat, 90):.1f}")
-        print(f"p95  : {_percentile(total_lat, 95):.1f}")
-        print(f"p99  : {_percentile(total_lat, 99):.1f}")
-
-    if args.show_failures and failed:
+        p50, p90, p95, p99 = np.quantile(total_lat, [0.5, 0.9, 0.95, 0.99])
+        print(f"avg  : {total_lat.mean():.1f}")
+        print(f"p50  : {p50:.1f}")
+        print(f"p90  : {p90:.1f}")
+        print(f"p95  : {p95:.1f}")
+        print(f"p99  : {p99:.1f}")
+
+    if args.show_failures and failed_idx.size:
         print("\n-- Failures (first 20) --")
-        for r in failed[:20]:
+        for i in failed_idx[:20]:
+            r = results[i]
             print(f"{r.status:12} job={r.job_id} err={r.error}")
 
     # exit code
-    return 0 if done > 0 and (len(failed) / max(1, len(results))) < 0.5 else 2
+    return 0 if done > 0 and (failed_idx.size / max(1, len(results))) < 0.5 else 2
 
 
 def parse_args() -> argparse.Namespace:
@@ -245,9 +389,12 @@ def parse_args() -> argparse.Namespace:
     ap.add_argument("--base-url", required=True, help="Base URL for ingress (e.g. http://tts.local)")
     ap.add_argument("--jobs", type=int, default=200, help="Total jobs to submit")
     ap.add_argument("--concurrency", type=int, default=20, help="Concurrent in-flight jobs")
+    ap.add_argument("--batch-size", type=int, default=32, help="Jobs per POST /jobs:batch (1 = one POST per job)")
     ap.add_argument("--voice", type=str, default="en_US", help="Voice name")
     ap.add_argument("--speed", type=float, default=1.0, help="TTS speed")
-    ap.add_argument("--poll-interval", type=float, default=0.5, help="Seconds between polling job status")
+    ap.add_argument("--poll-interval", type=float, default=0.5, help="Seconds before the first re-poll of job status")
+    ap.add_argument("--poll-interval-max", type=float, default=2.0, help="Cap for the backed-off polling interval")
+    ap.add_argument("--long-poll", type=float, default=30.0, help="Seconds per GET /jobs/{id}/wait (0 = plain polling)")
     ap.add_argument("--job-timeout", type=float, default=120.0, help="Seconds to wait for a job to finish")
     ap.add_argument("--http-timeout", type=float, default=300.0, help="Total HTTP timeout per request")
     ap.add_argument("--check-mp3", action="store_true", help="Verify MP3 endpoint after DONE")
@@ -259,6 +406,12 @@ def parse_args() -> argparse.Namespace:
 def main() -> None:
     args = parse_args()
     random.seed(42)
+    try:
+        # libuv event loop: cheaper per-request overhead at high concurrency
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
     rc = asyncio.run(main_async(args))
     raise SystemExit(rc)
 
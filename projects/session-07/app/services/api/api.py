@@ -1,20 +1,31 @@
-from fastapi import FastAPI, HTTPException, Header, Response
+from fastapi import FastAPI, HTTPException, Header, Query, Response
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
-from typing import Optional, Literal, Dict, Any
-import os, uuid, json
+from typing import Optional, Literal, Dict, Any, List, Tuple
+import os, time, secrets
+import orjson
 import redis
+import redis.asyncio as aioredis
 
 APP_ENV = os.getenv("APP_ENV", "dev")
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 BUCKET = os.getenv("MP3_BUCKET", f"tts-{APP_ENV}")
 PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "")  # e.g. https://tts-dev.example.com
 INTERNAL_TOKEN = os.getenv("INTERNAL_TOKEN", "changeme")  # simple protection for class demo
+WAIT_MAX_S = float(os.getenv("WAIT_MAX_S", "60"))  # cap for GET /jobs/{id}/wait
+MAX_BATCH_JOBS = int(os.getenv("MAX_BATCH_JOBS", "100"))  # cap for POST /jobs:batch
 
 r = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+# Async client for long-polls: a waiting request holds a pubsub
+# subscription, not a threadpool thread
+ar = aioredis.Redis.from_url(REDIS_URL, decode_responses=True)
 
-app = FastAPI(title="TTS Case Study API", version="0.1")
+# orjson-backed responses: faster than the stdlib-json default on every
+# JSON endpoint
+app = FastAPI(title="TTS Case Study API", version="0.1", default_response_class=ORJSONResponse)
 
 JobStatus = Literal["QUEUED", "RUNNING", "DONE", "FAILED"]
+FINAL_STATUSES = ("DONE", "FAILED")
 
 class CreateJobReq(BaseModel):
     text: str = Field(min_length=1, max_length=2000)
@@ -25,15 +36,45 @@ class CreateJobRes(BaseModel):
     job_id: str
     status: JobStatus
 
+class CreateJobsReq(BaseModel):
+    jobs: List[CreateJobReq] = Field(min_length=1, max_length=MAX_BATCH_JOBS)
+
+class CreateJobsRes(BaseModel):
+    job_ids: List[str]
+    status: JobStatus
+
 class JobState(BaseModel):
     job_id: str
     status: JobStatus
     mp3_url: Optional[str] = None
     error: Optional[str] = None
 
+# HSET only if the job hash exists: existence check + write in one round-trip,
+# then PUBLISH the new status (ARGV[2]) on the channel named like the key,
+# for GET /jobs/{id}/wait. Returns 1 when updated, 0 when the job is unknown.
+UPDATE_IF_EXISTS_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+redis.call('HSET', KEYS[1], unpack(ARGV))
+redis.call('PUBLISH', KEYS[1], ARGV[2])
+return 1
+"""
+_update_script = None
+
+def update_if_exists_script():
+    # Registered lazily (and again if `r` is swapped), so the script is
+    # bound to the current client; redis-py runs it via EVALSHA.
+    global _update_script
+    if _update_script is None or _update_script.registered_client is not r:
+        _update_script = r.register_script(UPDATE_IF_EXISTS_LUA)
+    return _update_script
+
 def job_key(job_id: str) -> str:
     return f"job:{job_id}"
 
+def job_channel(job_id: str) -> str:
+    # Pub/Sub channels do not share the key namespace
+    return job_key(job_id)
+
 def jobs_queue_key() -> str:
     return f"jobs:queue:{APP_ENV}"
 
@@ -45,39 +86,92 @@ def build_mp3_url(job_id: str) -> str:
 def healthz():
     return {"ok": True, "env": APP_ENV}
 
-@app.post("/jobs", response_model=CreateJobRes)
-def create_job(req: CreateJobReq):
-    job_id = str(uuid.uuid4())
+def new_job(req: CreateJobReq) -> Tuple[str, Dict[str, Any], bytes]:
+    """Returns (job_id, state hash, encoded work item) for a new job."""
+    # Opaque 32-hex-char id, generated directly as a string
+    job_id = secrets.token_hex(16)
 
-    # Store state
-    state = {
+    # Fields shared by the state hash and the work item, built once
+    common = {
         "job_id": job_id,
-        "status": "QUEUED",
         "voice": req.voice,
         "speed": req.speed,
         "bucket": BUCKET,
         "mp3_key": f"{job_id}.mp3",
-        "error": "",
     }
-    r.hset(job_key(job_id), mapping=state)
-
+    state = {**common, "status": "QUEUED", "error": ""}
     # Enqueue work item (simple JSON)
-    work = {"job_id": job_id, "text": req.text, "voice": req.voice, "speed": req.speed, "bucket": BUCKET, "mp3_key": state["mp3_key"]}
-    r.rpush(jobs_queue_key(), json.dumps(work))
-
-    return {"job_id": job_id, "status": "QUEUED"}
-
-@app.get("/jobs/{job_id}", response_model=JobState)
-def get_job(job_id: str):
-    if not r.exists(job_key(job_id)):
-        raise HTTPException(status_code=404, detail="job_id not found")
+    work = {**common, "text": req.text}
+    return job_id, state, orjson.dumps(work)
 
-    h = r.hgetall(job_key(job_id))
+@app.post("/jobs", response_model=CreateJobRes)
+def create_job(req: CreateJobReq):
+    job_id, state, work = new_job(req)
+
+    # State + enqueue in one round-trip (state is written first, so the
+    # worker never sees a job without its hash)
+    with r.pipeline(transaction=False) as pipe:
+        pipe.hset(job_key(job_id), mapping=state)
+        pipe.rpush(jobs_queue_key(), work)
+        pipe.execute()
+
+    # Returning a Response skips response_model validation and
+    # jsonable_encoder; the model still documents the schema
+    return ORJSONResponse({"job_id": job_id, "status": "QUEUED"})
+
+@app.post("/jobs:batch", response_model=CreateJobsRes)
+def create_jobs(req: CreateJobsReq):
+    # Many jobs, still one round-trip: all hashes, then a single RPUSH
+    new = [new_job(j) for j in req.jobs]
+    with r.pipeline(transaction=False) as pipe:
+        for job_id, state, _ in new:
+            pipe.hset(job_key(job_id), mapping=state)
+        pipe.rpush(jobs_queue_key(), *(work for _, _, work in new))
+        pipe.execute()
+
+    return ORJSONResponse({"job_ids": [job_id for job_id, _, _ in new], "status": "QUEUED"})
+
+def job_state(job_id: str, h: Dict[str, str]) -> Dict[str, Any]:
     st = h.get("status", "QUEUED")
     mp3_url = build_mp3_url(job_id) if st == "DONE" else None
     err = h.get("error") or None
     return {"job_id": job_id, "status": st, "mp3_url": mp3_url, "error": err}
 
+@app.get("/jobs/{job_id}", response_model=JobState)
+def get_job(job_id: str):
+    # A missing hash reads as {}: one HGETALL instead of EXISTS + HGETALL
+    h = r.hgetall(job_key(job_id))
+    if not h:
+        raise HTTPException(status_code=404, detail="job_id not found")
+    return job_state(job_id, h)
+
+@app.get("/jobs/{job_id}/wait", response_model=JobState)
+async def wait_job(job_id: str, timeout: float = Query(default=30.0, ge=0)):
+    """
+    Long-poll: respond once the job is DONE/FAILED, or with the current
+    state after `timeout` seconds (capped at WAIT_MAX_S). Replaces a
+    client polling loop with one request per `timeout`.
+    """
+    timeout = min(timeout, WAIT_MAX_S)
+    key = job_key(job_id)
+    async with ar.pubsub() as ps:
+        # Subscribe before reading the state, so a transition in between
+        # is not missed
+        await ps.subscribe(job_channel(job_id))
+        h = await ar.hgetall(key)
+        if not h:
+            raise HTTPException(status_code=404, detail="job_id not found")
+
+        deadline = time.monotonic() + timeout
+        while h.get("status") not in FINAL_STATUSES:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            msg = await ps.get_message(ignore_subscribe_messages=True, timeout=remaining)
+            if msg is not None and msg["data"] in FINAL_STATUSES:
+                h = await ar.hgetall(key)
+    return job_state(job_id, h)
+
 # Worker updates state (internal)
 class UpdateJobReq(BaseModel):
     status: JobStatus
@@ -88,14 +182,13 @@ def update_job(job_id: str, req: UpdateJobReq, x_internal_token: Optional[str] =
     if x_internal_token != INTERNAL_TOKEN:
         raise HTTPException(status_code=401, detail="unauthorized")
 
-    if not r.exists(job_key(job_id)):
-        raise HTTPException(status_code=404, detail="job_id not found")
-
     mapping: Dict[str, Any] = {"status": req.status}
     if req.error is not None:
         mapping["error"] = req.error
-    r.hset(job_key(job_id), mapping=mapping)
-    return {"ok": True}
+    argv = [x for kv in mapping.items() for x in kv]
+    if not update_if_exists_script()(keys=[job_key(job_id)], args=argv):
+        raise HTTPException(status_code=404, detail="job_id not found")
+    return ORJSONResponse({"ok": True})
 
 @app.get("/mp3/{job_id}.mp3")
 def get_mp3(job_id: str):
@@ -104,9 +197,9 @@ def get_mp3(job_id: str):
     # - redirect to presigned URL (recommended)
     #
     # Here we signal DONE-only; actual MP3 serving can be done by web service.
-    if not r.exists(job_key(job_id)):
-        raise HTTPException(status_code=404, detail="job_id not found")
     h = r.hgetall(job_key(job_id))
+    if not h:
+        raise HTTPException(status_code=404, detail="job_id not found")
     if h.get("status") != "DONE":
         raise HTTPException(status_code=409, detail="mp3 not ready")
 
@@ -1,6 +1,6 @@
 import os
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
 import boto3
 from botocore.config import Config
 from botocore.exceptions import ClientError
@@ -13,6 +13,16 @@ S3_SECRET_KEY = os.getenv("S3_SECRET_KEY", "minioadmin")
 S3_REGION = os.getenv("S3_REGION", "us-east-1")
 S3_BUCKET = os.getenv("MP3_BUCKET", f"tts-{APP_ENV}")
 
+# S3/MinIO endpoint as reachable by browsers (e.g. http://localhost:9000).
+# When set, /mp3/* answers with a 302 to a pre-signed URL there, so the
+# object store serves the bytes instead of this service proxying them.
+# Empty = proxy through this service (S3_ENDPOINT is usually internal).
+S3_PUBLIC_ENDPOINT = os.getenv("S3_PUBLIC_ENDPOINT", "")
+MP3_URL_EXPIRES = int(os.getenv("MP3_URL_EXPIRES", "300"))
+# Proxy mode read size. Iterating a botocore StreamingBody directly yields
+# 1 KiB chunks, i.e. one socket read + one ASGI send per KiB.
+MP3_CHUNK_SIZE = int(os.getenv("MP3_CHUNK_SIZE", str(64 << 10)))
+
 BASE_DIR = os.path.dirname(__file__)
 STATIC_DIR = os.path.join(BASE_DIR, "static")
 
@@ -25,6 +35,17 @@ s3 = boto3.client(
     config=Config(signature_version="s3v4"),
 )
 
+# Pre-signing only (no requests are sent): the signature covers the host,
+# so URLs must be signed for the public endpoint.
+s3_public = boto3.client(
+    "s3",
+    endpoint_url=S3_PUBLIC_ENDPOINT,
+    aws_access_key_id=S3_ACCESS_KEY,
+    aws_secret_access_key=S3_SECRET_KEY,
+    region_name=S3_REGION,
+    config=Config(signature_version="s3v4"),
+) if S3_PUBLIC_ENDPOINT else None
+
 app = FastAPI(title="TTS Web Player", version="0.1")
 
 
@@ -38,19 +59,40 @@ def index():
     return FileResponse(os.path.join(STATIC_DIR, "index.html"))
 
 
+def storage_http_error(e: ClientError) -> HTTPException:
+    code = e.response.get("Error", {}).get("Code", "")
+    if code in ("NoSuchKey", "404"):
+        return HTTPException(status_code=404, detail="mp3 not found")
+    return HTTPException(status_code=502, detail="storage error")
+
+
 @app.get("/mp3/{job_id}.mp3")
 def serve_mp3(job_id: str):
     key = f"{job_id}.mp3"
 
+    if s3_public is not None:
+        # Cheap HEAD keeps the 404/502 behaviour, then redirect
+        try:
+            s3.head_object(Bucket=S3_BUCKET, Key=key)
+        except ClientError as e:
+            raise storage_http_error(e)
+        url = s3_public.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": S3_BUCKET, "Key": key},
+            ExpiresIn=MP3_URL_EXPIRES,
+        )
+        return RedirectResponse(url, status_code=302)
+
     try:
         obj = s3.get_object(Bucket=S3_BUCKET, Key=key)
     except ClientError as e:
-        code = e.response.get("Error", {}).get("Code", "")
-        if code in ("NoSuchKey", "404"):
-            raise HTTPException(status_code=404, detail="mp3 not found")
-        raise HTTPException(status_code=502, detail="storage error")
+        raise storage_http_error(e)
 
+    headers = {}
+    if obj.get("ContentLength") is not None:
+        headers["Content-Length"] = str(obj["ContentLength"])
     return StreamingResponse(
-        obj["Body"],
-        media_type="audio/mpeg"
+        obj["Body"].iter_chunks(chunk_size=MP3_CHUNK_SIZE),
+        media_type="audio/mpeg",
+        headers=headers,
     )
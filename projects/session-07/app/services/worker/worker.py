@@ -4,11 +4,15 @@
 # - Piper CLI flags differ across releases; this tries common variants safely
 # - Logs more helpful info if piper invocation fails
 
-import os, json, time, tempfile, subprocess, traceback, shutil
+import os, re, json, time, tempfile, subprocess, traceback, shutil, signal, sys, select, threading, uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import redis
-import boto3
 from botocore.config import Config
+from botocore.session import Session as BotoSession
 from botocore.exceptions import BotoCoreError, ClientError
 
 # ---- Env ----
@@ -16,6 +20,16 @@ APP_ENV = os.getenv("APP_ENV", "dev")
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 QUEUE_KEY = os.getenv("QUEUE_KEY", f"jobs:queue:{APP_ENV}")
+# In-flight jobs are parked on a per-worker processing list until acked, so a
+# crash does not lose them. On SIGTERM a worker requeues its own list; each
+# live worker holds a lease key, and lists whose lease expired (killed pod,
+# hostname never reused) are requeued by any other worker, at startup and
+# every WORKER_LEASE_S.
+WORKER_ID = os.getenv("WORKER_ID", os.getenv("HOSTNAME", "worker"))
+PROCESSING_PREFIX = f"{QUEUE_KEY}:processing:"
+PROCESSING_KEY = os.getenv("PROCESSING_KEY", f"{PROCESSING_PREFIX}{WORKER_ID}")
+# Renewed between jobs: must outlast one synthesis + upload
+WORKER_LEASE_S = int(os.getenv("WORKER_LEASE_S", "180"))
 
 API_BASE_URL = os.getenv("API_BASE_URL", "http://api:8000")
 INTERNAL_TOKEN = os.getenv("INTERNAL_TOKEN", "changeme")
@@ -35,111 +49,387 @@ PIPER_MODEL_PATH = os.getenv("PIPER_MODEL_PATH", "/models/en_GB-alan-medium.onnx
 # We'll keep length_scale optional.
 PIPER_LENGTH_SCALE = float(os.getenv("PIPER_LENGTH_SCALE", "1.0"))  # higher = slower speech
 
+PIPER_MODEL_CONFIG_PATH = os.getenv("PIPER_MODEL_CONFIG_PATH", f"{PIPER_MODEL_PATH}.json")
+
+
+def _model_sample_rate(config_path: str, default: int = 22050) -> int:
+    # Piper's raw output has no header; the rate comes from the model config
+    try:
+        with open(config_path, "rb") as f:
+            return int(json.load(f)["audio"]["sample_rate"])
+    except Exception:
+        return default
+
+
+PIPER_SAMPLE_RATE = int(os.getenv("PIPER_SAMPLE_RATE", "0")) or _model_sample_rate(PIPER_MODEL_CONFIG_PATH)
+
+# Keep one piper process (model loaded once) fed with JSON lines, instead of
+# one process + model load per job. Its WAVs go to PIPER_WAV_DIR (tmpfs when
+# available). Falls back to per-job piper after repeated failures.
+PIPER_RESIDENT = os.getenv("PIPER_RESIDENT", "1") == "1"
+PIPER_WAV_DIR = os.getenv("PIPER_WAV_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+PIPER_TIMEOUT_S = float(os.getenv("PIPER_TIMEOUT_S", "60"))
+PIPER_RESIDENT_MAX_FAILURES = 3
+
+MP3_BITRATE = os.getenv("MP3_BITRATE", "96k")
+
 # Worker
 POLL_TIMEOUT_S = int(os.getenv("POLL_TIMEOUT_S", "5"))
 MAX_TEXT_LEN = int(os.getenv("MAX_TEXT_LEN", "2000"))
+# Work items longer than this (in characters of the decoded item) cannot hold
+# a valid text: rejected before json.loads. Worst case per text character is
+# a 6-char \u00XX escape (control characters); +512 covers the metadata.
+MAX_RAW = int(os.getenv("MAX_RAW_CHARS", str(MAX_TEXT_LEN * 6 + 512)))
+# Jobs taken per Redis round-trip once the blocking pop returns
+QUEUE_BATCH = max(1, int(os.getenv("QUEUE_BATCH", "32")))
+# Upload + DONE run on IO_WORKERS threads while the next job synthesizes;
+# at most IO_MAX_PENDING finished MP3s wait for upload (bounds memory)
+IO_WORKERS = max(1, int(os.getenv("IO_WORKERS", "2")))
+IO_MAX_PENDING = max(1, int(os.getenv("IO_MAX_PENDING", str(2 * IO_WORKERS))))
 
 # ---- Clients ----
 r = redis.Redis.from_url(REDIS_URL, decode_responses=True)
 
-s3 = boto3.client(
+# Plain botocore client (no boto3 resource/transfer layer): keep-alive pool
+# shared by the upload threads, adaptive retries
+s3 = BotoSession().create_client(
     "s3",
     endpoint_url=S3_ENDPOINT,
     aws_access_key_id=S3_ACCESS_KEY,
     aws_secret_access_key=S3_SECRET_KEY,
     region_name=S3_REGION,
-    config=Config(signature_version="s3v4"),
+    config=Config(
+        signature_version="s3v4",
+        tcp_keepalive=True,
+        max_pool_connections=16,
+        retries={"mode": "adaptive", "max_attempts": 3},
+    ),
+)
+
+# One pooled, keep-alive session for all status updates (RUNNING/DONE/FAILED)
+# instead of a new TCP connection per call. Retries only cover gateway errors
+# while the API restarts.
+_api_session = requests.Session()
+_api_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504]),
 )
+_api_session.mount("http://", _api_adapter)
+_api_session.mount("https://", _api_adapter)
+_api_session.headers.update({"X-Internal-Token": INTERNAL_TOKEN})
+
+# Encoded MP3 stays in memory up to this size, then spills to a temp file
+MP3_SPOOL_MAX = 4 << 20
+
+# Buckets verified by this process; jobs almost always use S3_BUCKET, so
+# this skips the head_bucket round-trip after the first job
+_known_buckets: set[str] = set()
+
+_io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="s3io")
 
 def ensure_bucket(bucket: str):
     """Idempotent bucket creation for MinIO."""
+    if bucket in _known_buckets:
+        return
     try:
         s3.head_bucket(Bucket=bucket)
+        _known_buckets.add(bucket)
         return
     except Exception:
         pass
     try:
         s3.create_bucket(Bucket=bucket)
+        _known_buckets.add(bucket)
+    except ClientError as e:
+        # race with another worker: the bucket exists now
+        if e.response.get("Error", {}).get("Code") in ("BucketAlreadyOwnedByYou", "BucketAlreadyExists"):
+            _known_buckets.add(bucket)
     except Exception:
-        pass  # ignore race / already-exists
+        pass  # not cached: retried on the next job
 
 
 def api_update(job_id: str, status: str, error: str | None = None):
     url = f"{API_BASE_URL}/internal/jobs/{job_id}"
-    headers = {"X-Internal-Token": INTERNAL_TOKEN}
     payload = {"status": status}
     if error is not None:
         payload["error"] = error[:500]
-    resp = requests.put(url, json=payload, headers=headers, timeout=10)
+    resp = _api_session.put(url, json=payload, timeout=(2, 10))
     resp.raise_for_status()
 
 
-def _run(cmd: list[str], stdin_text: str):
-    return subprocess.run(
-        cmd,
-        input=stdin_text.encode("utf-8"),
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        check=False,
-    )
+def ffmpeg_mp3_cmd(input_args: list[str]) -> list[str]:
+    """ffmpeg reading `input_args`, writing MP3 to stdout."""
+    return [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel", "error",
+        *input_args,
+        "-vn",
+        # Fixed CBR mono at piper's own rate: no resampling or channel
+        # mixing, and one encoder thread (jobs already run in parallel)
+        "-codec:a", "libmp3lame",
+        "-b:a", MP3_BITRATE,
+        "-ac", "1",
+        "-ar", str(PIPER_SAMPLE_RATE),
+        "-threads", "1",
+        "-f", "mp3",
+        "pipe:1",
+    ]
+
+
+def _run_ffmpeg(ffmpeg_cmd: list[str], out):
+    """Run ffmpeg, copying its stdout into `out`. Returns (rc, stderr)."""
+    ff = subprocess.Popen(ffmpeg_cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    shutil.copyfileobj(ff.stdout, out, 1 << 16)
+    ff.stdout.close()
+    ff_err = ff.stderr.read()
+    ff.stderr.close()
+    ff.wait()
+    return ff.returncode, ff_err
 
 
-def run_piper_to_wav(text: str, wav_path: str):
+def _run_pipeline(piper_cmd: list[str], ffmpeg_cmd: list[str], stdin_text: str, out):
+    """
+    piper stdout -> ffmpeg stdin through an OS pipe (no intermediate WAV);
+    ffmpeg stdout is copied into the writable file object `out`.
+    Returns (piper_rc, piper_stderr, ffmpeg_rc, ffmpeg_stderr).
+    """
+    piper = subprocess.Popen(piper_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        ff = subprocess.Popen(ffmpeg_cmd, stdin=piper.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except Exception:
+        piper.kill()
+        piper.wait()
+        raise
+    # Only ffmpeg holds the read end now, so it sees EOF when piper exits
+    piper.stdout.close()
+    try:
+        piper.stdin.write(stdin_text.encode("utf-8"))
+        piper.stdin.close()
+    except BrokenPipeError:
+        pass
+    # ffmpeg runs with -loglevel error, so its stderr cannot fill the pipe
+    # while stdout is drained here
+    shutil.copyfileobj(ff.stdout, out, 1 << 16)
+    ff.stdout.close()
+    ff_err = ff.stderr.read()
+    ff.stderr.close()
+    ff.wait()
+    piper_err = piper.stderr.read()
+    piper.stderr.close()
+    piper.wait()
+    return piper.returncode, piper_err, ff.returncode, ff_err
+
+
+def piper_candidates() -> list[list[str]]:
     """
     Piper CLI differences across releases:
-    - Some use: piper --model M --output_file out.wav
-    - Others use: piper -m M -f out.wav
-    We'll attempt a small set of common variants.
+    - Some use: piper --model M --output_raw
+    - Others use: piper -m M --output_raw
+    Candidate command variants, most likely first.
     """
+    return [
+        ["piper", "--model", PIPER_MODEL_PATH, "--output_raw", "--length_scale", str(PIPER_LENGTH_SCALE)],
+        ["piper", "--model", PIPER_MODEL_PATH, "--output_raw"],
+        ["piper", "-m", PIPER_MODEL_PATH, "--output_raw", "--length_scale", str(PIPER_LENGTH_SCALE)],
+        ["piper", "-m", PIPER_MODEL_PATH, "--output_raw"],
+    ]
+
+
+# Working piper command, found once by detect_piper_cmd() (or by the first
+# successful job); later jobs spawn only this one
+_PIPER_CMD: list[str] | None = None
+PIPER_PROBE_TEXT = "Hello there, world."
+
+
+def detect_piper_cmd() -> list[str]:
+    """Run each candidate once on a short probe; cache the first one that speaks."""
+    global _PIPER_CMD
     if shutil.which("piper") is None:
         raise RuntimeError("piper binary not found in PATH")
 
-    # Candidate command variants (most likely first)
-    candidates = [
-        ["piper", "--model", PIPER_MODEL_PATH, "--output_file", wav_path, "--length_scale", str(PIPER_LENGTH_SCALE)],
-        ["piper", "--model", PIPER_MODEL_PATH, "--output_file", wav_path],
-        ["piper", "-m", PIPER_MODEL_PATH, "-f", wav_path, "--length_scale", str(PIPER_LENGTH_SCALE)],
-        ["piper", "-m", PIPER_MODEL_PATH, "-f", wav_path],
-    ]
-
     last_err = None
-    for cmd in candidates:
-        p = _run(cmd, text)
-        if p.returncode == 0 and os.path.exists(wav_path) and os.path.getsize(wav_path) > 1000:
-            return
+    for cmd in piper_candidates():
+        p = subprocess.run(
+            cmd,
+            input=PIPER_PROBE_TEXT.encode("utf-8"),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=False,
+        )
+        if p.returncode == 0 and len(p.stdout) > 1000:
+            _PIPER_CMD = cmd
+            return cmd
         last_err = p.stderr.decode("utf-8", errors="ignore")[:400]
 
     raise RuntimeError(f"piper failed for all known CLI variants. stderr={last_err}")
 
 
-def wav_to_mp3(wav_path: str, mp3_path: str):
-    cmd = [
-        "ffmpeg",
-        "-y",
-        "-i", wav_path,
-        "-vn",
-        "-codec:a", "libmp3lame",
-        "-q:a", "4",
-        mp3_path,
-    ]
-    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
-    if p.returncode != 0:
-        raise RuntimeError(f"ffmpeg failed: {p.stderr.decode('utf-8', errors='ignore')[:400]}")
+def synthesize_to_mp3(text: str):
+    """
+    Piper (raw 16-bit mono PCM on stdout) piped straight into ffmpeg.
+    Returns the MP3 in a SpooledTemporaryFile, rewound for reading.
+
+    Uses the detected piper command; until there is one, tries every
+    candidate variant and caches the first that works.
+    """
+    global _PIPER_CMD
+    if shutil.which("piper") is None:
+        raise RuntimeError("piper binary not found in PATH")
+
+    if _resident is not None:
+        mp3 = _synthesize_resident(text)
+        if mp3 is not None:
+            return mp3
+
+    candidates = [_PIPER_CMD] if _PIPER_CMD is not None else piper_candidates()
+    ffmpeg_cmd = ffmpeg_mp3_cmd(["-f", "s16le", "-ar", str(PIPER_SAMPLE_RATE), "-ac", "1", "-i", "pipe:0"])
+
+    spool = tempfile.SpooledTemporaryFile(max_size=MP3_SPOOL_MAX)
+    last_err = None
+    for cmd in candidates:
+        spool.seek(0)
+        spool.truncate()
+        piper_rc, piper_err, ff_rc, ff_err = _run_pipeline(cmd, ffmpeg_cmd, text, spool)
+        if piper_rc != 0:
+            last_err = piper_err.decode("utf-8", errors="ignore")[:400]
+            continue
+        if ff_rc != 0:
+            spool.close()
+            raise RuntimeError(f"ffmpeg failed: {ff_err.decode('utf-8', errors='ignore')[:400]}")
+        if spool.tell() > 0:
+            _PIPER_CMD = cmd
+            spool.seek(0)
+            return spool
+        last_err = "empty output"
+
+    spool.close()
+    raise RuntimeError(f"piper failed for all known CLI variants. stderr={last_err}")
 
 
-def upload_mp3(bucket: str, key: str, mp3_path: str):
+class ResidentPiper:
+    """
+    One long-lived `piper --json-input` process. Each job is one JSON line
+    {"text", "output_file"}; piper writes that WAV and prints its path on
+    stdout when done. Restarted on the next call if it exits.
+    """
+
+    def __init__(self, cmd: list[str]):
+        self.cmd = cmd
+        self.proc: subprocess.Popen | None = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        if self.proc is None or self.proc.poll() is not None:
+            # stderr inherited: piper's log lines go to the worker log
+            self.proc = subprocess.Popen(self.cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, bufsize=0)
+
+    def close(self):
+        proc, self.proc = self.proc, None
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+    def synthesize(self, text: str, wav_path: str):
+        with self.lock:
+            self.start()
+            proc = self.proc
+            line = json.dumps({"text": text, "output_file": wav_path}) + "\n"
+            try:
+                proc.stdin.write(line.encode("utf-8"))
+            except BrokenPipeError:
+                self.close()
+                raise RuntimeError("resident piper exited")
+            ready, _, _ = select.select([proc.stdout], [], [], PIPER_TIMEOUT_S)
+            if not ready:
+                self.close()
+                raise RuntimeError(f"resident piper timed out after {PIPER_TIMEOUT_S}s")
+            done = proc.stdout.readline()
+            if not done:
+                self.close()
+                raise RuntimeError("resident piper exited")
+        if not os.path.exists(wav_path) or os.path.getsize(wav_path) <= 44:
+            raise RuntimeError("resident piper produced no audio")
+
+
+_resident: ResidentPiper | None = None
+_resident_failures = 0
+
+
+def start_resident_piper(cmd: list[str]):
+    """Launch the resident piper from a working one-shot command."""
+    global _resident
+    resident_cmd = [c for c in cmd if c != "--output_raw"] + ["--json-input", "--output_dir", PIPER_WAV_DIR]
+    _resident = ResidentPiper(resident_cmd)
+    _resident.start()
+    return resident_cmd
+
+
+def _synthesize_resident(text: str):
+    """
+    Resident piper -> WAV on PIPER_WAV_DIR -> ffmpeg -> spooled MP3.
+    Returns None (caller uses the per-job pipeline) if piper failed.
+    """
+    global _resident, _resident_failures
+    wav_path = os.path.join(PIPER_WAV_DIR, f"tts_{uuid.uuid4().hex}.wav")
     try:
-        s3.upload_file(
-            Filename=mp3_path,
+        try:
+            _resident.synthesize(text, wav_path)
+        except Exception as e:
+            _resident_failures += 1
+            print(f"[PIPER] resident synthesis failed ({_resident_failures}):", e)
+            if _resident_failures >= PIPER_RESIDENT_MAX_FAILURES:
+                print("[PIPER] disabling resident piper; spawning per job")
+                _resident.close()
+                _resident = None
+            return None
+        _resident_failures = 0
+
+        spool = tempfile.SpooledTemporaryFile(max_size=MP3_SPOOL_MAX)
+        ff_rc, ff_err = _run_ffmpeg(ffmpeg_mp3_cmd(["-i", wav_path]), spool)
+        if ff_rc != 0:
+            spool.close()
+            raise RuntimeError(f"ffmpeg failed: {ff_err.decode('utf-8', errors='ignore')[:400]}")
+        spool.seek(0)
+        return spool
+    finally:
+        try:
+            os.unlink(wav_path)
+        except FileNotFoundError:
+            pass
+
+
+def upload_mp3(bucket: str, key: str, fileobj):
+    try:
+        # MP3s are a few hundred KB: one PUT, streamed from the spool
+        s3.put_object(
+            Body=fileobj,
             Bucket=bucket,
             Key=key,
-            ExtraArgs={"ContentType": "audio/mpeg"},
+            ContentType="audio/mpeg",
         )
     except (BotoCoreError, ClientError) as e:
         raise RuntimeError(f"s3 upload failed: {e}")
 
 
-def process_job(raw: str):
+# The API serializes job_id first; enough to report an oversized item
+_JOB_ID_PREFIX = re.compile(r'\{\s*"job_id"\s*:\s*"([^"]{1,64})"')
+
+
+def synth_job(raw: str):
+    """
+    Validate + synthesize. Returns (job_id, bucket, mp3_key, mp3, t0) for
+    publish_job(), or None when the job was already marked FAILED.
+    """
+    if len(raw) > MAX_RAW:
+        m = _JOB_ID_PREFIX.match(raw, 0, 128)
+        if m is None:
+            print(f"[DROP] oversized work item without job_id ({len(raw)} chars)")
+            return None
+        api_update(m.group(1), "FAILED", "payload too large")
+        return None
+
     job = json.loads(raw)
     job_id = job["job_id"]
     text = job.get("text", "")
@@ -148,31 +438,154 @@ def process_job(raw: str):
 
     if not isinstance(text, str) or not text.strip():
         api_update(job_id, "FAILED", "empty text")
-        return
+        return None
 
     if len(text) > MAX_TEXT_LEN:
         api_update(job_id, "FAILED", f"text too long (> {MAX_TEXT_LEN})")
-        return
+        return None
 
     api_update(job_id, "RUNNING")
 
     t0 = time.time()
-    with tempfile.TemporaryDirectory(prefix="tts_worker_") as d:
-        wav_path = os.path.join(d, f"{job_id}.wav")
-        mp3_path = os.path.join(d, f"{job_id}.mp3")
+    return job_id, bucket, mp3_key, synthesize_to_mp3(text), t0
 
-        run_piper_to_wav(text, wav_path)
-        wav_to_mp3(wav_path, mp3_path)
 
+def publish_job(job_id: str, bucket: str, mp3_key: str, mp3, t0: float):
+    """Upload the synthesized MP3 and mark the job DONE."""
+    with mp3:
         ensure_bucket(bucket)
-        upload_mp3(bucket, mp3_key, mp3_path)
+        upload_mp3(bucket, mp3_key, mp3)
 
     dt = time.time() - t0
     api_update(job_id, "DONE")
     print(f"[DONE] job_id={job_id} in {dt:.2f}s bucket={bucket} key={mp3_key}")
 
 
+def process_job(raw: str):
+    """Whole job inline (synthesize, then publish)."""
+    synthesized = synth_job(raw)
+    if synthesized is not None:
+        publish_job(*synthesized)
+
+
+def fetch_batch() -> list[str]:
+    """
+    Block for one job, then drain up to QUEUE_BATCH-1 more in one pipelined
+    round-trip. Every job is moved (not popped) onto PROCESSING_KEY; FIFO
+    order matches the API's RPUSH.
+    """
+    first = r.blmove(QUEUE_KEY, PROCESSING_KEY, POLL_TIMEOUT_S, "LEFT", "RIGHT")
+    if first is None:
+        return []
+    if QUEUE_BATCH == 1:
+        return [first]
+    pipe = r.pipeline(transaction=False)
+    for _ in range(QUEUE_BATCH - 1):
+        pipe.lmove(QUEUE_KEY, PROCESSING_KEY, "LEFT", "RIGHT")
+    return [first] + [raw for raw in pipe.execute() if raw is not None]
+
+
+def requeue_in_flight(processing_key: str | None = None) -> int:
+    """
+    Put jobs parked on a processing list (default: this worker's) back at
+    the queue head, oldest first. Returns how many were moved.
+    """
+    processing_key = processing_key or PROCESSING_KEY
+    n = 0
+    while r.lmove(processing_key, QUEUE_KEY, "RIGHT", "LEFT") is not None:
+        n += 1
+    if n:
+        print(f"[RECOVER] requeued {n} in-flight job(s) from {processing_key}")
+    return n
+
+
+def lease_key(processing_key: str) -> str:
+    return f"{QUEUE_KEY}:lease:{processing_key}"
+
+
+_lease_renewed = float("-inf")
+
+
+def renew_lease(force: bool = False):
+    """Mark this worker alive (at most one SET per WORKER_LEASE_S/3)."""
+    global _lease_renewed
+    now = time.monotonic()
+    if force or now - _lease_renewed >= WORKER_LEASE_S / 3:
+        r.set(lease_key(PROCESSING_KEY), WORKER_ID, ex=WORKER_LEASE_S)
+        _lease_renewed = now
+
+
+def recover_orphans() -> int:
+    """Requeue the processing lists of workers whose lease has expired."""
+    n = 0
+    for key in r.scan_iter(match=f"{PROCESSING_PREFIX}*", count=100):
+        if key != PROCESSING_KEY and not r.exists(lease_key(key)):
+            n += requeue_in_flight(key)
+    return n
+
+
+def _report_failure(raw: str, e: Exception):
+    # Try to mark FAILED if possible
+    try:
+        job = json.loads(raw)
+        jid = job.get("job_id", "unknown")
+        api_update(jid, "FAILED", f"{type(e).__name__}: {str(e)[:300]}")
+    except Exception:
+        pass
+    print("[ERROR]", e)
+    print(traceback.format_exc(limit=3))
+
+
+def _ack(raw: str):
+    # The job reached a final state (or was reported FAILED)
+    r.lrem(PROCESSING_KEY, 1, raw)
+
+
+def _publish_and_ack(raw: str, synthesized: tuple):
+    try:
+        publish_job(*synthesized)
+    except Exception as e:
+        _report_failure(raw, e)
+    finally:
+        _ack(raw)
+
+
+def handle_job(raw: str):
+    """
+    Synthesize on the calling thread, then hand upload + DONE to _io_pool.
+    Returns the publish future, or None if the job already finished.
+    """
+    try:
+        synthesized = synth_job(raw)
+    except Exception as e:
+        _report_failure(raw, e)
+        _ack(raw)
+        return None
+    if synthesized is None:
+        _ack(raw)
+        return None
+    return _io_pool.submit(_publish_and_ack, raw, synthesized)
+
+
+def _on_sigterm(signum, frame):
+    # Let queued uploads finish (and ack) before the session goes away
+    _io_pool.shutdown(wait=True)
+    # What is still parked was fetched but never finished (not started yet,
+    # or interrupted mid-synthesis): hand it back to the other workers
+    try:
+        requeue_in_flight()
+        r.delete(lease_key(PROCESSING_KEY))
+    except Exception as e:
+        print("[RECOVER] requeue on shutdown failed:", e)
+    _api_session.close()
+    if _resident is not None:
+        _resident.close()
+    sys.exit(0)
+
+
 def main():
+    signal.signal(signal.SIGTERM, _on_sigterm)
+
     print("Worker starting...")
     print("ENV:", APP_ENV)
     print("QUEUE:", QUEUE_KEY)
@@ -180,25 +593,48 @@ def main():
     print("S3:", S3_ENDPOINT, "BUCKET:", S3_BUCKET)
     print("PIPER_MODEL:", PIPER_MODEL_PATH)
     print("PIPER_LENGTH_SCALE:", PIPER_LENGTH_SCALE)
+    print("PIPER_SAMPLE_RATE:", PIPER_SAMPLE_RATE)
+    print("PROCESSING:", PROCESSING_KEY, "BATCH:", QUEUE_BATCH, "LEASE_S:", WORKER_LEASE_S)
+    print("IO_WORKERS:", IO_WORKERS, "IO_MAX_PENDING:", IO_MAX_PENDING)
 
+    try:
+        piper_cmd = detect_piper_cmd()
+        print("PIPER_CMD:", " ".join(piper_cmd))
+        if PIPER_RESIDENT:
+            print("PIPER_RESIDENT:", " ".join(start_resident_piper(piper_cmd)))
+    except Exception as e:
+        print("[PIPER] probe failed, will try all variants per job:", e)
+
+    try:
+        ensure_bucket(S3_BUCKET)
+    except Exception as e:
+        print("[S3] bucket check failed:", e)
+
+    last_recover = time.monotonic()
+    try:
+        renew_lease(force=True)
+        requeue_in_flight()
+        recover_orphans()
+    except Exception as e:
+        print("[RECOVER] failed:", e)
+
+    pending = deque()
     while True:
         try:
-            item = r.blpop(QUEUE_KEY, timeout=POLL_TIMEOUT_S)
-            if item is None:
-                continue
-            _, raw = item
-            try:
-                process_job(raw)
-            except Exception as e:
-                # Try to mark FAILED if possible
-                try:
-                    job = json.loads(raw)
-                    jid = job.get("job_id", "unknown")
-                    api_update(jid, "FAILED", f"{type(e).__name__}: {str(e)[:300]}")
-                except Exception:
-                    pass
-                print("[ERROR]", e)
-                print(traceback.format_exc(limit=3))
+            renew_lease()
+            if time.monotonic() - last_recover >= WORKER_LEASE_S:
+                last_recover = time.monotonic()
+                recover_orphans()
+            for raw in fetch_batch():
+                # Bounded pipeline: wait for the oldest upload when full
+                while len(pending) >= IO_MAX_PENDING:
+                    pending.popleft().result()
+                renew_lease()
+                fut = handle_job(raw)
+                if fut is not None:
+                    pending.append(fut)
+            while pending and pending[0].done():
+                pending.popleft()
         except Exception as outer:
             print("[FATAL LOOP ERROR]", outer)
             time.sleep(1)
@@ -10,7 +10,11 @@
 #   pytest -q tests/integration/test_e2e.py --base-url http://localhost:8088
 #
 # Notes:
+# - Completion is awaited on the Redis Pub/Sub channel job:<id> (the API
+#   publishes every status change there); REDIS_URL defaults to the compose
+#   port. Without a reachable Redis it falls back to polling the API.
 # - This test assumes you use the nginx gateway so the API is reachable at /api/*
+# - Options/URL fixtures live in tests/conftest.py
 # - If you don't use gateway, run with:
 #     --api-url http://localhost:8000 --web-url http://localhost:8080
 
@@ -18,34 +22,23 @@ from __future__ import annotations
 
 import os
 import time
+import redis
 import requests
 from tenacity import retry, stop_after_delay, wait_fixed
 import pytest
 
 
-def pytest_addoption(parser):
-    parser.addoption("--base-url", action="store", default=os.getenv("BASE_URL", "http://localhost:8088"))
-    parser.addoption("--api-url", action="store", default=os.getenv("API_URL", ""))  # optional override
-    parser.addoption("--web-url", action="store", default=os.getenv("WEB_URL", ""))  # optional override
-
-
-@pytest.fixture
-def base_url(request) -> str:
-    return request.config.getoption("--base-url").rstrip("/")
-
-
-@pytest.fixture
-def api_url(request, base_url: str) -> str:
-    v = (request.config.getoption("--api-url") or "").strip()
-    # default: via gateway /api
-    return (v.rstrip("/") if v else f"{base_url}/api")
-
-
-@pytest.fixture
-def web_url(request, base_url: str) -> str:
-    v = (request.config.getoption("--web-url") or "").strip()
-    # default: via gateway root
-    return (v.rstrip("/") if v else base_url)
+@pytest.fixture(scope="session")
+def redis_client():
+    client = redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+    try:
+        client.ping()
+    except redis.RedisError:
+        client.close()
+        yield None  # not reachable: tests poll the API instead
+        return
+    yield client
+    client.close()
 
 
 def _create_job(api_url: str, text: str) -> str:
@@ -78,12 +71,40 @@ def _wait_done(api_url: str, job_id: str) -> dict:
     raise AssertionError(f"Unexpected status value: {st}")
 
 
+def wait_for_job(redis_client, api_url: str, job_id: str, timeout: float = 180) -> dict:
+    """Block on job:<id> until DONE/FAILED; polls the API if Redis is unavailable."""
+    if redis_client is None:
+        return _wait_done(api_url, job_id)
+
+    ps = redis_client.pubsub(ignore_subscribe_messages=True)
+    try:
+        # Subscribe before reading the state, so a transition in between
+        # is not missed
+        ps.subscribe(f"job:{job_id}")
+        status = (_get_job(api_url, job_id).get("status") or "").upper()
+        deadline = time.monotonic() + timeout
+        while status not in ("DONE", "FAILED"):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise AssertionError(f"Job {job_id} not done after {timeout}s (last status {status})")
+            msg = ps.get_message(timeout=remaining)
+            if msg is not None:
+                status = str(msg["data"]).upper()
+    finally:
+        ps.close()
+
+    st = _get_job(api_url, job_id)
+    if (st.get("status") or "").upper() == "FAILED":
+        raise AssertionError(f"Job FAILED: {st}")
+    return st
+
+
 def _fetch_mp3(web_url: str, job_id: str) -> requests.Response:
     # Web service serves from MinIO at /mp3/{job_id}.mp3
     return requests.get(f"{web_url}/mp3/{job_id}.mp3", timeout=30)
 
 
-def test_e2e_compose_pipeline(api_url: str, web_url: str):
+def test_e2e_compose_pipeline(api_url: str, web_url: str, redis_client):
     """
     Creates a job via API, waits until worker finishes, then downloads MP3 from web.
     """
@@ -97,7 +118,7 @@ def test_e2e_compose_pipeline(api_url: str, web_url: str):
     job_id = _create_job(api_url, "Hello from e2e test. This should become an MP3.")
 
     # 2) wait until DONE (worker + minio)
-    st = _wait_done(api_url, job_id)
+    st = wait_for_job(redis_client, api_url, job_id)
     assert st["job_id"] == job_id
     assert st["status"] == "DONE"
 
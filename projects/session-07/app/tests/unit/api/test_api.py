@@ -7,13 +7,17 @@
 
 from __future__ import annotations
 
-import json
-from typing import Any, Dict, List, Optional
+import asyncio
+import threading
+import time
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Set, Tuple
 
+import orjson
 import pytest
-from fastapi.testclient import TestClient
 
-import services.api.api as api_mod  # type: ignore
+if TYPE_CHECKING:
+    from fastapi.testclient import TestClient
 
 
 class FakeRedis:
@@ -23,104 +27,253 @@ class FakeRedis:
     - hset(key, mapping=dict)
     - hgetall(key)
     - rpush(key, value)
+    - register_script(UPDATE_IF_EXISTS_LUA) (emulated in Python)
+    - pipeline() with hset/rpush/execute
+    - publish(channel, message) (delivered to FakePubSub subscribers)
     """
 
-    def __init__(self) -> None:
-        self._hashes: Dict[str, Dict[str, str]] = {}
+    def __init__(self, update_script: str) -> None:
+        # Source register_script() expects (the API's UPDATE_IF_EXISTS_LUA)
+        self._update_script = update_script
+        # Hash fields flat, keyed by (key, field); _hkeys indexes each key's fields
+        self._h: Dict[Tuple[str, str], str] = {}
+        self._hkeys: Dict[str, Set[str]] = {}
         self._lists: Dict[str, List[str]] = {}
+        self._subscribers: Dict[str, List["FakePubSub"]] = {}
 
     def exists(self, key: str) -> int:
-        return 1 if (key in self._hashes) else 0
+        return 1 if (key in self._hkeys) else 0
 
     def hset(self, key: str, mapping: Dict[str, Any]) -> int:
         # Redis stores strings; module uses decode_responses=True.
-        self._hashes.setdefault(key, {})
+        fields = self._hkeys.setdefault(key, set())
         for k, v in mapping.items():
-            self._hashes[key][str(k)] = "" if v is None else str(v)
+            fields.add(str(k))
+            self._h[(key, str(k))] = "" if v is None else str(v)
         return len(mapping)
 
     def hgetall(self, key: str) -> Dict[str, str]:
-        return dict(self._hashes.get(key, {}))
+        return {k: self._h[(key, k)] for k in self._hkeys.get(key, ())}
 
-    def rpush(self, key: str, value: str) -> int:
+    def rpush(self, key: str, *values: Any) -> int:
         self._lists.setdefault(key, [])
-        self._lists[key].append(value)
+        self._lists[key].extend(values)
         return len(self._lists[key])
 
+    def pipeline(self, transaction: bool = True) -> "FakePipeline":
+        return FakePipeline(self)
+
+    def register_script(self, script: str) -> "FakeScript":
+        assert script == self._update_script
+        return FakeScript(self)
+
+    def publish(self, channel: str, message: str) -> int:
+        subs = list(self._subscribers.get(channel, []))
+        for ps in subs:
+            ps._inbox.append({"type": "message", "channel": channel, "data": message})
+        return len(subs)
+
     # helpers for assertions
     def list_getall(self, key: str) -> List[str]:
         return list(self._lists.get(key, []))
 
 
-@pytest.fixture()
-def fake_redis(monkeypatch) -> FakeRedis:
-    fr = FakeRedis()
-    monkeypatch.setattr(api_mod, "r", fr, raising=True)
-    # Make globals deterministic for tests (module reads these at import time, but endpoints use them dynamically)
-    monkeypatch.setattr(api_mod, "APP_ENV", "dev", raising=True)
-    monkeypatch.setattr(api_mod, "BUCKET", "tts-dev", raising=True)
-    monkeypatch.setattr(api_mod, "PUBLIC_BASE_URL", "", raising=True)  # relative /mp3/...
-    monkeypatch.setattr(api_mod, "INTERNAL_TOKEN", "changeme", raising=True)
-    return fr
+class FakePipeline:
+    """Buffers commands and applies them to the FakeRedis on execute()."""
+
+    def __init__(self, client: FakeRedis) -> None:
+        self._client = client
+        self._calls: List[Any] = []
+
+    def __enter__(self) -> "FakePipeline":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._calls = []
+
+    def hset(self, key: str, mapping: Dict[str, Any]) -> "FakePipeline":
+        self._calls.append(lambda: self._client.hset(key, mapping=mapping))
+        return self
+
+    def rpush(self, key: str, *values: Any) -> "FakePipeline":
+        self._calls.append(lambda: self._client.rpush(key, *values))
+        return self
+
+    def execute(self) -> List[Any]:
+        results = [call() for call in self._calls]
+        self._calls = []
+        return results
+
+
+class FakeScript:
+    """Python stand-in for UPDATE_IF_EXISTS_LUA (HSET only if the key exists)."""
+
+    def __init__(self, client: FakeRedis) -> None:
+        self.registered_client = client
+
+    def __call__(self, keys: List[str], args: List[Any]) -> int:
+        key = keys[0]
+        if not self.registered_client.exists(key):
+            return 0
+        self.registered_client.hset(key, mapping=dict(zip(args[::2], args[1::2])))
+        self.registered_client.publish(key, args[1])
+        return 1
+
+
+class FakePubSub:
+    """Async pubsub over FakeRedis.publish(); get_message() polls its inbox."""
+
+    def __init__(self, client: FakeRedis) -> None:
+        self._client = client
+        self._inbox: List[Dict[str, Any]] = []
+        self._channels: List[str] = []
+
+    async def __aenter__(self) -> "FakePubSub":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        for ch in self._channels:
+            self._client._subscribers[ch].remove(self)
+
+    async def subscribe(self, channel: str) -> None:
+        self._channels.append(channel)
+        self._client._subscribers.setdefault(channel, []).append(self)
+
+    async def get_message(self, ignore_subscribe_messages: bool = False, timeout: float = 0.0):
+        deadline = time.monotonic() + timeout
+        while not self._inbox:
+            if time.monotonic() >= deadline:
+                return None
+            await asyncio.sleep(0.01)
+        return self._inbox.pop(0)
+
+
+class FakeAsyncRedis:
+    """redis.asyncio stand-in sharing state with a FakeRedis."""
+
+    def __init__(self, client: FakeRedis) -> None:
+        self._client = client
+
+    async def hgetall(self, key: str) -> Dict[str, str]:
+        return self._client.hgetall(key)
+
+    def pubsub(self) -> FakePubSub:
+        return FakePubSub(self._client)
+
+
+@pytest.fixture(scope="module")
+def api_mod() -> ModuleType:
+    # The app (FastAPI, redis clients) is imported on first use rather than at
+    # module top, so collecting this file only costs pytest + stdlib
+    import services.api.api as api_mod  # type: ignore
+
+    return api_mod
+
+
+@pytest.fixture(scope="module")
+def fake_redis(api_mod: ModuleType) -> Iterator[FakeRedis]:
+    # Installed once per module; reset_fake_redis clears its state per test
+    fr = FakeRedis(api_mod.UPDATE_IF_EXISTS_LUA)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(api_mod, "r", fr, raising=True)
+        mp.setattr(api_mod, "ar", FakeAsyncRedis(fr), raising=True)
+        # Make globals deterministic for tests (module reads these at import time, but endpoints use them dynamically)
+        mp.setattr(api_mod, "APP_ENV", "dev", raising=True)
+        mp.setattr(api_mod, "BUCKET", "tts-dev", raising=True)
+        mp.setattr(api_mod, "PUBLIC_BASE_URL", "", raising=True)  # relative /mp3/...
+        mp.setattr(api_mod, "INTERNAL_TOKEN", "changeme", raising=True)
+        yield fr
+
+
+@pytest.fixture(autouse=True)
+def reset_fake_redis(fake_redis: FakeRedis) -> None:
+    fake_redis._h.clear()
+    fake_redis._hkeys.clear()
+    fake_redis._lists.clear()
+    fake_redis._subscribers.clear()
+
 
+@pytest.fixture(scope="module")
+def client(api_mod: ModuleType, fake_redis: FakeRedis) -> TestClient:
+    # Endpoints read api_mod globals at call time, so per-test monkeypatches
+    # still apply to this shared client
+    from fastapi.testclient import TestClient
 
-@pytest.fixture()
-def client(fake_redis) -> TestClient:
     return TestClient(api_mod.app)
 
 
-def test_healthz_ok(client: TestClient):
+def test_healthz_ok(api_mod: ModuleType, client: TestClient):
     r = client.get("/healthz")
     assert r.status_code == 200
     assert r.headers.get("content-type", "").startswith("application/json")
     assert r.json() == {"ok": True, "env": api_mod.APP_ENV}
 
 
+def test_responses_are_orjson_encoded(api_mod: ModuleType, client: TestClient):
+    r = client.get("/healthz")
+    assert r.content == orjson.dumps({"ok": True, "env": api_mod.APP_ENV})
+
+
 def test_get_job_404_when_missing(client: TestClient):
     r = client.get("/jobs/not-found")
     assert r.status_code == 404
     assert r.json()["detail"] == "job_id not found"
 
 
-def test_create_job_stores_state_and_enqueues_work(client: TestClient, fake_redis: FakeRedis, monkeypatch):
-    # Force deterministic UUID
-    class _UUID:
-        def __init__(self, v: str):
-            self._v = v
-
-        def __str__(self) -> str:
-            return self._v
-
-    monkeypatch.setattr(api_mod.uuid, "uuid4", lambda: _UUID("00000000-0000-0000-0000-000000000000"))
+def test_create_job_stores_state_and_enqueues_work(api_mod: ModuleType, client: TestClient, fake_redis: FakeRedis, monkeypatch):
+    # Force a deterministic job id
+    monkeypatch.setattr(api_mod.secrets, "token_hex", lambda nbytes: "0" * (2 * nbytes))
 
     payload = {"text": "hello", "voice": "en_US", "speed": 1.0}
     r = client.post("/jobs", json=payload)
     assert r.status_code == 200
-    assert r.json() == {"job_id": "00000000-0000-0000-0000-000000000000", "status": "QUEUED"}
+    assert r.json() == {"job_id": "00000000000000000000000000000000", "status": "QUEUED"}
 
     # Verify state stored in Redis hash
-    state = fake_redis.hgetall(api_mod.job_key("00000000-0000-0000-0000-000000000000"))
-    assert state["job_id"] == "00000000-0000-0000-0000-000000000000"
+    state = fake_redis.hgetall(api_mod.job_key("00000000000000000000000000000000"))
+    assert state["job_id"] == "00000000000000000000000000000000"
     assert state["status"] == "QUEUED"
     assert state["voice"] == "en_US"
     assert state["speed"] == "1.0"  # stored as string
     assert state["bucket"] == api_mod.BUCKET
-    assert state["mp3_key"] == "00000000-0000-0000-0000-000000000000.mp3"
+    assert state["mp3_key"] == "00000000000000000000000000000000.mp3"
 
     # Verify work item pushed to queue
     qkey = api_mod.jobs_queue_key()
     items = fake_redis.list_getall(qkey)
     assert len(items) == 1
-    work = json.loads(items[0])
-    assert work["job_id"] == "00000000-0000-0000-0000-000000000000"
+    work = orjson.loads(items[0])
+    assert work["job_id"] == "00000000000000000000000000000000"
     assert work["text"] == "hello"
     assert work["voice"] == "en_US"
     assert work["speed"] == 1.0
     assert work["bucket"] == api_mod.BUCKET
-    assert work["mp3_key"] == "00000000-0000-0000-0000-000000000000.mp3"
+    assert work["mp3_key"] == "00000000000000000000000000000000.mp3"
+
+
+def test_create_jobs_batch_stores_all_and_enqueues_in_order(api_mod: ModuleType, client: TestClient, fake_redis: FakeRedis):
+    payload = {"jobs": [{"text": "one"}, {"text": "two", "voice": "en_GB", "speed": 1.5}]}
+    r = client.post("/jobs:batch", json=payload)
+    assert r.status_code == 200
+    data = r.json()
+    assert data["status"] == "QUEUED"
+    assert len(data["job_ids"]) == 2
+
+    items = [orjson.loads(x) for x in fake_redis.list_getall(api_mod.jobs_queue_key())]
+    assert [w["job_id"] for w in items] == data["job_ids"]
+    assert [w["text"] for w in items] == ["one", "two"]
+    assert items[1]["voice"] == "en_GB"
+    for job_id in data["job_ids"]:
+        assert fake_redis.hgetall(api_mod.job_key(job_id))["status"] == "QUEUED"
+
 
+def test_create_jobs_batch_rejects_empty_and_oversized(api_mod: ModuleType, client: TestClient):
+    assert client.post("/jobs:batch", json={"jobs": []}).status_code == 422
+    too_many = {"jobs": [{"text": "x"}] * (api_mod.MAX_BATCH_JOBS + 1)}
+    assert client.post("/jobs:batch", json=too_many).status_code == 422
 
-def test_get_job_returns_queued_and_no_mp3_url(client: TestClient, fake_redis: FakeRedis):
+
+def test_get_job_returns_queued_and_no_mp3_url(api_mod: ModuleType, client: TestClient, fake_redis: FakeRedis):
     job_id = "j1"
     fake_redis.hset(api_mod.job_key(job_id), mapping={"job_id": job_id, "status": "QUEUED", "error": ""})
 
@@ -133,7 +286,7 @@ def test_get_job_returns_queued_and_no_mp3_url(client: TestClient, fake_redis: F
     assert data["error"] is None  # empty string -> None per implementation
 
 
-def test_update_job_requires_token(client: TestClient, fake_redis: FakeRedis):
+def test_update_job_requires_token(api_mod: ModuleType, client: TestClient, fake_redis: FakeRedis):
     job_id = "j2"
     fake_redis.hset(api_mod.job_key(job_id), mapping={"job_id": job_id, "status": "QUEUED", "error": ""})
 
@@ -150,7 +303,7 @@ def test_update_job_requires_token(client: TestClient, fake_redis: FakeRedis):
     assert r2.json()["detail"] == "unauthorized"
 
 
-def test_update_job_404_if_missing(client: TestClient):
+def test_update_job_404_if_missing(api_mod: ModuleType, client: TestClient):
     r = client.put(
         "/internal/jobs/missing",
         json={"status": "RUNNING"},
@@ -160,7 +313,7 @@ def test_update_job_404_if_missing(client: TestClient):
     assert r.json()["detail"] == "job_id not found"
 
 
-def test_update_job_success_updates_hash(client: TestClient, fake_redis: FakeRedis):
+def test_update_job_success_updates_hash(api_mod: ModuleType, client: TestClient, fake_redis: FakeRedis):
     job_id = "j3"
     fake_redis.hset(api_mod.job_key(job_id), mapping={"job_id": job_id, "status": "QUEUED", "error": ""})
 
@@ -183,7 +336,7 @@ def test_get_mp3_404_when_missing(client: TestClient):
     assert r.json()["detail"] == "job_id not found"
 
 
-def test_get_mp3_409_when_not_ready(client: TestClient, fake_redis: FakeRedis):
+def test_get_mp3_409_when_not_ready(api_mod: ModuleType, client: TestClient, fake_redis: FakeRedis):
     job_id = "j4"
     fake_redis.hset(api_mod.job_key(job_id), mapping={"job_id": job_id, "status": "RUNNING", "error": ""})
 
@@ -192,7 +345,7 @@ def test_get_mp3_409_when_not_ready(client: TestClient, fake_redis: FakeRedis):
     assert r.json()["detail"] == "mp3 not ready"
 
 
-def test_get_mp3_redirects_302_when_done_relative(client: TestClient, fake_redis: FakeRedis, monkeypatch):
+def test_get_mp3_redirects_302_when_done_relative(api_mod: ModuleType, client: TestClient, fake_redis: FakeRedis, monkeypatch):
     job_id = "j5"
     fake_redis.hset(api_mod.job_key(job_id), mapping={"job_id": job_id, "status": "DONE", "error": ""})
     monkeypatch.setattr(api_mod, "PUBLIC_BASE_URL", "", raising=True)
@@ -202,7 +355,7 @@ def test_get_mp3_redirects_302_when_done_relative(client: TestClient, fake_redis
     assert r.headers["Location"] == f"/mp3/{job_id}.mp3"
 
 
-def test_get_mp3_redirects_302_when_done_with_public_base_url(client: TestClient, fake_redis: FakeRedis, monkeypatch):
+def test_get_mp3_redirects_302_when_done_with_public_base_url(api_mod: ModuleType, client: TestClient, fake_redis: FakeRedis, monkeypatch):
     job_id = "j6"
     fake_redis.hset(api_mod.job_key(job_id), mapping={"job_id": job_id, "status": "DONE", "error": ""})
     monkeypatch.setattr(api_mod, "PUBLIC_BASE_URL", "https://example.test", raising=True)
@@ -210,3 +363,51 @@ def test_get_mp3_redirects_302_when_done_with_public_base_url(client: TestClient
     r = client.get(f"/mp3/{job_id}.mp3", follow_redirects=False)
     assert r.status_code == 302
     assert r.headers["Location"] == f"https://example.test/mp3/{job_id}.mp3"
+
+
+def test_wait_job_404_when_missing(client: TestClient):
+    r = client.get("/jobs/nope/wait", params={"timeout": 0})
+    assert r.status_code == 404
+    assert r.json()["detail"] == "job_id not found"
+
+
+def test_wait_job_returns_immediately_when_final(api_mod: ModuleType, client: TestClient, fake_redis: FakeRedis):
+    job_id = "w1"
+    fake_redis.hset(api_mod.job_key(job_id), mapping={"job_id": job_id, "status": "DONE", "error": ""})
+
+    t0 = time.monotonic()
+    r = client.get(f"/jobs/{job_id}/wait", params={"timeout": 10})
+    assert time.monotonic() - t0 < 5
+    assert r.status_code == 200
+    assert r.json()["status"] == "DONE"
+    assert r.json()["mp3_url"] == f"/mp3/{job_id}.mp3"
+
+
+def test_wait_job_times_out_with_current_state(api_mod: ModuleType, client: TestClient, fake_redis: FakeRedis):
+    job_id = "w2"
+    fake_redis.hset(api_mod.job_key(job_id), mapping={"job_id": job_id, "status": "RUNNING", "error": ""})
+
+    r = client.get(f"/jobs/{job_id}/wait", params={"timeout": 0.1})
+    assert r.status_code == 200
+    assert r.json()["status"] == "RUNNING"
+
+
+def test_wait_job_wakes_up_on_status_update(api_mod: ModuleType, client: TestClient, fake_redis: FakeRedis):
+    job_id = "w3"
+    key = api_mod.job_key(job_id)
+    fake_redis.hset(key, mapping={"job_id": job_id, "status": "RUNNING", "error": ""})
+
+    # The worker's PUT runs the update script, which publishes the status
+    script = FakeScript(fake_redis)
+    timer = threading.Timer(0.2, lambda: script(keys=[key], args=["status", "FAILED", "error", "boom"]))
+    timer.start()
+    try:
+        t0 = time.monotonic()
+        r = client.get(f"/jobs/{job_id}/wait", params={"timeout": 10})
+        assert time.monotonic() - t0 < 5
+    finally:
+        timer.cancel()
+
+    assert r.status_code == 200
+    assert r.json()["status"] == "FAILED"
+    assert r.json()["error"] == "boom"
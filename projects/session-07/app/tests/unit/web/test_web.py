@@ -20,19 +20,34 @@ import services.web.web as web_mod  # type: ignore
 
 
 class FakeBody:
-    """Minimal streaming body for StreamingResponse."""
+    """
+    Minimal botocore StreamingBody: read(amt) consumes the payload, and
+    chunks are re-sliced to the requested size (plain iteration uses
+    botocore's 1 KiB default). Served chunk sizes are recorded.
+    """
+    DEFAULT_CHUNK_SIZE = 1024
+
     def __init__(self, chunks):
-        self._chunks = list(chunks)
+        self._data = b"".join(chunks)
+        self._pos = 0
+        self.served: list[int] = []
+
+    def read(self, amt: int | None = None) -> bytes:
+        end = len(self._data) if amt is None or amt < 0 else self._pos + amt
+        out = self._data[self._pos:end]
+        self._pos += len(out)
+        return out
+
+    def iter_chunks(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                break
+            self.served.append(len(chunk))
+            yield chunk
 
     def __iter__(self):
-        yield from self._chunks
-
-    # Some callers may use .read(); provide it too.
-    def read(self, amt: int = -1) -> bytes:
-        data = b"".join(self._chunks)
-        if amt == -1:
-            return data
-        return data[:amt]
+        return self.iter_chunks(self.DEFAULT_CHUNK_SIZE)
 
 
 class FakeS3:
@@ -42,7 +57,7 @@ class FakeS3:
         self.last_get_object_args = None
 
     def put_mp3(self, bucket: str, key: str, content: bytes):
-        self.objects[(bucket, key)] = {"Body": FakeBody([content])}
+        self.objects[(bucket, key)] = {"Body": FakeBody([content]), "ContentLength": len(content)}
 
     def get_object(self, Bucket: str, Key: str):
         self.last_get_object_args = {"Bucket": Bucket, "Key": Key}
@@ -62,18 +77,36 @@ class FakeS3:
             )
         return obj
 
+    def head_object(self, Bucket: str, Key: str):
+        # Same error behaviour as get_object, without the body
+        obj = self.get_object(Bucket=Bucket, Key=Key)
+        return {k: v for k, v in obj.items() if k != "Body"}
 
-@pytest.fixture()
-def fake_s3(monkeypatch) -> FakeS3:
+    def generate_presigned_url(self, ClientMethod: str, Params: Dict[str, str], ExpiresIn: int) -> str:
+        return f"http://s3.test/{Params['Bucket']}/{Params['Key']}?X-Amz-Expires={ExpiresIn}"
+
+
+@pytest.fixture(scope="module")
+def fake_s3() -> Iterator[FakeS3]:
+    # Installed once per module; reset_fake_s3 clears its state per test
     fs3 = FakeS3()
-    monkeypatch.setattr(web_mod, "s3", fs3, raising=True)
-    # Make env-derived globals deterministic in tests
-    monkeypatch.setattr(web_mod, "APP_ENV", "dev", raising=True)
-    monkeypatch.setattr(web_mod, "S3_BUCKET", "tts-dev", raising=True)
-    return fs3
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(web_mod, "s3", fs3, raising=True)
+        # Make env-derived globals deterministic in tests
+        mp.setattr(web_mod, "APP_ENV", "dev", raising=True)
+        mp.setattr(web_mod, "S3_BUCKET", "tts-dev", raising=True)
+        mp.setattr(web_mod, "s3_public", None, raising=True)  # proxy mode by default
+        yield fs3
 
 
-@pytest.fixture()
+@pytest.fixture(autouse=True)
+def reset_fake_s3(fake_s3: FakeS3) -> None:
+    fake_s3.objects.clear()
+    fake_s3.raise_client_error_code = None
+    fake_s3.last_get_object_args = None
+
+
+@pytest.fixture(scope="module")
 def client(fake_s3) -> TestClient:
     return TestClient(web_mod.app)
 
@@ -108,9 +141,24 @@ def test_mp3_streams_audio_from_s3(client: TestClient, fake_s3: FakeS3):
     assert r.status_code == 200
     assert r.headers.get("content-type", "").startswith("audio/mpeg")
     assert r.content[:3] == b"ID3"
+    assert r.headers.get("content-length") == "53"
     assert fake_s3.last_get_object_args == {"Bucket": "tts-dev", "Key": "job123.mp3"}
 
 
+def test_mp3_streams_in_large_chunks(client: TestClient, fake_s3: FakeS3):
+    payload = b"ID3" + os.urandom(200 * 1024)
+    fake_s3.put_mp3("tts-dev", "big.mp3", payload)
+    body = fake_s3.objects[("tts-dev", "big.mp3")]["Body"]
+
+    r = client.get("/mp3/big.mp3")
+
+    assert r.status_code == 200
+    assert r.content == payload
+    # Not botocore's 1 KiB iteration default
+    assert max(body.served) >= 16 * 1024
+    assert len(body.served) <= -(-len(payload) // web_mod.MP3_CHUNK_SIZE)
+
+
 def test_mp3_404_when_key_missing(client: TestClient, fake_s3: FakeS3):
     # FakeS3 defaults to raising NoSuchKey if not found
     r = client.get("/mp3/missing.mp3")
@@ -132,3 +180,34 @@ def test_mp3_502_on_other_s3_errors(client: TestClient, fake_s3: FakeS3, code: s
     r = client.get("/mp3/whatever.mp3")
     assert r.status_code == 502
     assert r.json()["detail"] == "storage error"
+
+
+@pytest.fixture()
+def redirect_client(fake_s3: FakeS3, monkeypatch) -> TestClient:
+    # S3_PUBLIC_ENDPOINT set: pre-signed URLs are generated by the public client
+    monkeypatch.setattr(web_mod, "s3_public", fake_s3, raising=True)
+    monkeypatch.setattr(web_mod, "MP3_URL_EXPIRES", 300, raising=True)
+    return TestClient(web_mod.app)
+
+
+def test_mp3_redirects_to_presigned_url(redirect_client: TestClient, fake_s3: FakeS3):
+    fake_s3.put_mp3("tts-dev", "job123.mp3", b"ID3" + b"\x00" * 50)
+
+    r = redirect_client.get("/mp3/job123.mp3", follow_redirects=False)
+
+    assert r.status_code == 302
+    assert r.headers["Location"] == "http://s3.test/tts-dev/job123.mp3?X-Amz-Expires=300"
+    assert fake_s3.last_get_object_args == {"Bucket": "tts-dev", "Key": "job123.mp3"}
+
+
+def test_mp3_redirect_mode_404_when_key_missing(redirect_client: TestClient):
+    r = redirect_client.get("/mp3/missing.mp3", follow_redirects=False)
+    assert r.status_code == 404
+    assert r.json()["detail"] == "mp3 not found"
+
+
+def test_mp3_redirect_mode_502_on_other_s3_errors(redirect_client: TestClient, fake_s3: FakeS3):
+    fake_s3.raise_client_error_code = "AccessDenied"
+    r = redirect_client.get("/mp3/whatever.mp3", follow_redirects=False)
+    assert r.status_code == 502
+    assert r.json()["detail"] == "storage error"
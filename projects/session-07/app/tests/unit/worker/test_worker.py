@@ -3,16 +3,17 @@
 # Unit tests for services/worker/worker.py
 # - No Docker needed
 # - No Redis/MinIO/Piper/ffmpeg needed
-# - We patch external calls (requests, boto3, subprocess, shutil.which)
+# - We patch external calls (requests, botocore, subprocess, shutil.which)
 #
 # Run:
 #   PYTHONPATH=. pytest -q tests/unit/worker/test_worker.py
 
 from __future__ import annotations
 
+import fnmatch
+import io
 import json
-import os
-import subprocess
+import sys
 from types import SimpleNamespace
 from typing import Any, Dict, List
 
@@ -30,9 +31,8 @@ def calls(monkeypatch):
     captured: Dict[str, Any] = {
         "api_updates": [],          # list[(job_id, status, error)]
         "ensure_bucket": [],        # list[bucket]
-        "upload_mp3": [],           # list[(bucket, key, path)]
-        "run_piper": [],            # list[(text, wav_path)]
-        "wav_to_mp3": [],           # list[(wav_path, mp3_path)]
+        "upload_mp3": [],           # list[(bucket, key, mp3 bytes)]
+        "synthesize": [],           # list[text]
     }
 
     def _api_update(job_id: str, status: str, error: str | None = None):
@@ -41,27 +41,17 @@ def calls(monkeypatch):
     def _ensure_bucket(bucket: str):
         captured["ensure_bucket"].append(bucket)
 
-    def _upload_mp3(bucket: str, key: str, mp3_path: str):
-        captured["upload_mp3"].append((bucket, key, mp3_path))
+    def _upload_mp3(bucket: str, key: str, fileobj):
+        captured["upload_mp3"].append((bucket, key, fileobj.read()))
 
-    def _run_piper_to_wav(text: str, wav_path: str):
-        captured["run_piper"].append((text, wav_path))
-        # create a fake WAV file (size > 1000 requirement is inside run_piper_to_wav,
-        # but we are patching it here, so only downstream uses the path)
-        os.makedirs(os.path.dirname(wav_path), exist_ok=True)
-        with open(wav_path, "wb") as f:
-            f.write(b"0" * 2001)
-
-    def _wav_to_mp3(wav_path: str, mp3_path: str):
-        captured["wav_to_mp3"].append((wav_path, mp3_path))
-        with open(mp3_path, "wb") as f:
-            f.write(b"ID3" + b"\x00" * 100)  # looks like MP3 header
+    def _synthesize_to_mp3(text: str):
+        captured["synthesize"].append(text)
+        return io.BytesIO(b"ID3" + b"\x00" * 100)  # looks like MP3 header
 
     monkeypatch.setattr(worker_mod, "api_update", _api_update, raising=True)
     monkeypatch.setattr(worker_mod, "ensure_bucket", _ensure_bucket, raising=True)
     monkeypatch.setattr(worker_mod, "upload_mp3", _upload_mp3, raising=True)
-    monkeypatch.setattr(worker_mod, "run_piper_to_wav", _run_piper_to_wav, raising=True)
-    monkeypatch.setattr(worker_mod, "wav_to_mp3", _wav_to_mp3, raising=True)
+    monkeypatch.setattr(worker_mod, "synthesize_to_mp3", _synthesize_to_mp3, raising=True)
 
     # Make MAX_TEXT_LEN deterministic for tests
     monkeypatch.setattr(worker_mod, "MAX_TEXT_LEN", 2000, raising=True)
@@ -81,8 +71,7 @@ def test_process_job_fails_on_empty_text(calls):
     assert calls["api_updates"] == [
         ("j1", "FAILED", "empty text"),
     ]
-    assert calls["run_piper"] == []
-    assert calls["wav_to_mp3"] == []
+    assert calls["synthesize"] == []
     assert calls["upload_mp3"] == []
 
 
@@ -95,10 +84,35 @@ def test_process_job_fails_on_text_too_long(calls, monkeypatch):
     assert calls["api_updates"] == [
         ("j2", "FAILED", "text too long (> 5)"),
     ]
-    assert calls["run_piper"] == []
+    assert calls["synthesize"] == []
     assert calls["upload_mp3"] == []
 
 
+def test_process_job_rejects_oversized_payload_before_parsing(calls, monkeypatch):
+    monkeypatch.setattr(worker_mod, "MAX_RAW", 100, raising=True)
+    parsed = []
+    monkeypatch.setattr(worker_mod.json, "loads", lambda raw: parsed.append(raw), raising=True)
+
+    raw = '{"job_id":"j9","text":"' + "x" * 500 + '"}'
+    worker_mod.process_job(raw)
+
+    assert parsed == []
+    assert calls["api_updates"] == [("j9", "FAILED", "payload too large")]
+    assert calls["synthesize"] == []
+
+
+def test_process_job_accepts_max_length_text_of_escaped_control_chars(calls, monkeypatch):
+    monkeypatch.setattr(worker_mod, "MAX_RAW", worker_mod.MAX_TEXT_LEN * 6 + 512, raising=True)
+    text = "a" + "\x01" * (worker_mod.MAX_TEXT_LEN - 1)
+    raw = json.dumps({"job_id": "j10", "text": text, "voice": "en_US", "speed": 1.0,
+                      "bucket": "tts-dev", "mp3_key": "j10.mp3"})
+    assert len(raw) > worker_mod.MAX_TEXT_LEN * 4 + 512  # the old bound
+
+    worker_mod.process_job(raw)
+
+    assert calls["api_updates"][-1] == ("j10", "DONE", None)
+
+
 def test_process_job_success_happy_path(calls):
     raw = json.dumps({"job_id": "j3", "text": "hello", "bucket": "tts-dev", "mp3_key": "j3.mp3"})
     worker_mod.process_job(raw)
@@ -108,15 +122,14 @@ def test_process_job_success_happy_path(calls):
     assert calls["api_updates"][-1] == ("j3", "DONE", None)
 
     # pipeline steps executed
-    assert len(calls["run_piper"]) == 1
-    assert len(calls["wav_to_mp3"]) == 1
+    assert len(calls["synthesize"]) == 1
     assert calls["ensure_bucket"] == ["tts-dev"]
     assert len(calls["upload_mp3"]) == 1
 
-    bucket, key, mp3_path = calls["upload_mp3"][0]
+    bucket, key, data = calls["upload_mp3"][0]
     assert bucket == "tts-dev"
     assert key == "j3.mp3"
-    assert mp3_path.endswith("j3.mp3")
+    assert data.startswith(b"ID3")
 
 
 def test_process_job_uses_defaults_for_bucket_and_key(calls):
@@ -135,7 +148,7 @@ def test_process_job_marks_failed_if_piper_raises(calls, monkeypatch):
     def boom(*args, **kwargs):
         raise RuntimeError("piper exploded")
 
-    monkeypatch.setattr(worker_mod, "run_piper_to_wav", boom, raising=True)
+    monkeypatch.setattr(worker_mod, "synthesize_to_mp3", boom, raising=True)
 
     raw = json.dumps({"job_id": "j5", "text": "hello"})
     with pytest.raises(RuntimeError):
@@ -149,100 +162,367 @@ def test_process_job_marks_failed_if_piper_raises(calls, monkeypatch):
 
 
 # -------------------------
-# run_piper_to_wav() tests
+# synthesize_to_mp3() tests
 # -------------------------
 
-def test_run_piper_to_wav_raises_if_piper_missing(monkeypatch, tmp_path):
+@pytest.fixture(autouse=True)
+def no_cached_piper_cmd(monkeypatch):
+    monkeypatch.setattr(worker_mod, "_PIPER_CMD", None, raising=True)
+    monkeypatch.setattr(worker_mod, "_resident", None, raising=True)
+
+
+def test_synthesize_raises_if_piper_missing(monkeypatch, tmp_path):
     # Ensure which("piper") returns None
     monkeypatch.setattr(worker_mod.shutil, "which", lambda _: None, raising=True)
 
     with pytest.raises(RuntimeError, match="piper binary not found"):
-        worker_mod.run_piper_to_wav("hi", str(tmp_path / "out.wav"))
+        worker_mod.synthesize_to_mp3("hi")
 
 
-def test_run_piper_to_wav_tries_candidates_until_success(monkeypatch, tmp_path):
+def test_synthesize_tries_candidates_until_success(monkeypatch, tmp_path):
     """
-    Simulate first candidate failing, second succeeding by creating wav file.
+    Simulate first piper candidate failing, second succeeding.
     We patch:
       - shutil.which -> found
-      - worker_mod._run -> returns returncode and stderr
-      - os.path.exists/getsize controlled by actually writing file on success
+      - worker_mod._run_pipeline -> return codes + stderr, writes mp3 on success
     """
     monkeypatch.setattr(worker_mod.shutil, "which", lambda _: "/usr/bin/piper", raising=True)
 
-    out_wav = tmp_path / "out.wav"
     seen_cmds: List[List[str]] = []
 
-    def fake_run(cmd: List[str], stdin_text: str):
-        seen_cmds.append(cmd)
-        # fail first candidate
+    def fake_pipeline(piper_cmd: List[str], ffmpeg_cmd: List[str], stdin_text: str, out):
+        seen_cmds.append(piper_cmd)
+        assert ffmpeg_cmd[-1] == "pipe:1"
+        assert "pipe:0" in ffmpeg_cmd
+        # fail first candidate (after partial output, which must be discarded)
         if len(seen_cmds) == 1:
-            return SimpleNamespace(returncode=1, stderr=b"bad flag", stdout=b"")
-        # succeed second candidate by writing a valid wav (>1000 bytes)
-        out_wav.write_bytes(b"0" * 2001)
-        return SimpleNamespace(returncode=0, stderr=b"", stdout=b"")
+            out.write(b"garbage")
+            return 1, b"bad flag", 0, b""
+        out.write(b"ID3" + b"\x00" * 100)
+        return 0, b"", 0, b""
 
-    monkeypatch.setattr(worker_mod, "_run", fake_run, raising=True)
+    monkeypatch.setattr(worker_mod, "_run_pipeline", fake_pipeline, raising=True)
 
-    worker_mod.run_piper_to_wav("hello", str(out_wav))
+    with worker_mod.synthesize_to_mp3("hello") as mp3:
+        data = mp3.read()
 
-    assert len(seen_cmds) >= 2
-    assert out_wav.exists()
-    assert out_wav.stat().st_size > 1000
+    assert len(seen_cmds) == 2
+    assert all("--output_raw" in cmd for cmd in seen_cmds)
+    assert data == b"ID3" + b"\x00" * 100
 
+    # The working variant is cached: next job spawns only that one
+    assert worker_mod._PIPER_CMD == seen_cmds[1]
+    with worker_mod.synthesize_to_mp3("again"):
+        pass
+    assert seen_cmds[2:] == [seen_cmds[1]]
 
-def test_run_piper_to_wav_raises_with_last_stderr(monkeypatch, tmp_path):
+
+def test_detect_piper_cmd_caches_first_working_variant(monkeypatch):
     monkeypatch.setattr(worker_mod.shutil, "which", lambda _: "/usr/bin/piper", raising=True)
+    seen_cmds: List[List[str]] = []
 
-    out_wav = tmp_path / "out.wav"
+    def fake_run(cmd, input, stdout, stderr, check):
+        seen_cmds.append(cmd)
+        if "-m" in cmd:
+            return SimpleNamespace(returncode=0, stdout=b"\x00" * 4000, stderr=b"")
+        return SimpleNamespace(returncode=2, stdout=b"", stderr=b"unknown option")
+
+    monkeypatch.setattr(worker_mod.subprocess, "run", fake_run, raising=True)
+
+    cmd = worker_mod.detect_piper_cmd()
 
-    def always_fail(cmd: List[str], stdin_text: str):
-        return SimpleNamespace(returncode=1, stderr=b"nope", stdout=b"")
+    assert cmd[:2] == ["piper", "-m"]
+    assert worker_mod._PIPER_CMD == cmd
+    assert len(seen_cmds) == 3
 
-    monkeypatch.setattr(worker_mod, "_run", always_fail, raising=True)
 
-    with pytest.raises(RuntimeError, match="piper failed"):
-        worker_mod.run_piper_to_wav("hello", str(out_wav))
+def test_synthesize_raises_with_last_stderr(monkeypatch, tmp_path):
+    monkeypatch.setattr(worker_mod.shutil, "which", lambda _: "/usr/bin/piper", raising=True)
+
+    def always_fail(piper_cmd, ffmpeg_cmd, stdin_text, out):
+        return 1, b"nope", 0, b""
+
+    monkeypatch.setattr(worker_mod, "_run_pipeline", always_fail, raising=True)
+
+    with pytest.raises(RuntimeError, match="piper failed.*nope"):
+        worker_mod.synthesize_to_mp3("hello")
+
+
+def test_synthesize_raises_on_ffmpeg_failure(monkeypatch, tmp_path):
+    monkeypatch.setattr(worker_mod.shutil, "which", lambda _: "/usr/bin/piper", raising=True)
+
+    def ffmpeg_fails(piper_cmd, ffmpeg_cmd, stdin_text, out):
+        return 0, b"", 1, b"ffmpeg error"
+
+    monkeypatch.setattr(worker_mod, "_run_pipeline", ffmpeg_fails, raising=True)
+
+    with pytest.raises(RuntimeError, match="ffmpeg failed"):
+        worker_mod.synthesize_to_mp3("hello")
+
+
+def test_run_pipeline_pipes_first_stdout_into_second(tmp_path):
+    # Real processes: "cat" stands in for piper, "wc -c" for ffmpeg
+    out = io.BytesIO()
+    piper_rc, _, ff_rc, _ = worker_mod._run_pipeline(["cat"], ["wc", "-c"], "hello", out)
+    assert (piper_rc, ff_rc) == (0, 0)
+    assert out.getvalue().strip() == b"5"
 
 
 # -------------------------
-# wav_to_mp3() tests
+# ResidentPiper tests
 # -------------------------
 
-def test_wav_to_mp3_raises_on_ffmpeg_failure(monkeypatch, tmp_path):
-    wav = tmp_path / "in.wav"
-    mp3 = tmp_path / "out.mp3"
-    wav.write_bytes(b"0" * 10)
+# Stands in for `piper --json-input`: one WAV per JSON line, path echoed;
+# text "die" makes it exit
+FAKE_RESIDENT_PIPER = """
+import json, sys
+for line in sys.stdin:
+    req = json.loads(line)
+    if req["text"] == "die":
+        sys.exit(1)
+    with open(req["output_file"], "wb") as f:
+        f.write(b"RIFF" + b"\\x00" * 2000)
+    print(req["output_file"], flush=True)
+"""
+
+
+def test_resident_piper_serves_many_jobs_from_one_process(tmp_path):
+    rp = worker_mod.ResidentPiper([sys.executable, "-c", FAKE_RESIDENT_PIPER])
+    try:
+        rp.synthesize("one", str(tmp_path / "1.wav"))
+        pid = rp.proc.pid
+        rp.synthesize("two", str(tmp_path / "2.wav"))
+        assert rp.proc.pid == pid
+        assert (tmp_path / "2.wav").stat().st_size > 1000
+    finally:
+        rp.close()
+
+
+def test_resident_piper_restarts_after_exit(tmp_path):
+    rp = worker_mod.ResidentPiper([sys.executable, "-c", FAKE_RESIDENT_PIPER])
+    try:
+        with pytest.raises(RuntimeError, match="exited"):
+            rp.synthesize("die", str(tmp_path / "x.wav"))
+        rp.synthesize("back", str(tmp_path / "y.wav"))
+        assert (tmp_path / "y.wav").exists()
+    finally:
+        rp.close()
+
+
+def test_synthesize_falls_back_when_resident_fails(monkeypatch):
+    monkeypatch.setattr(worker_mod.shutil, "which", lambda _: "/usr/bin/piper", raising=True)
+    monkeypatch.setattr(worker_mod, "_resident", object(), raising=True)
+    monkeypatch.setattr(worker_mod, "_synthesize_resident", lambda text: None, raising=True)
 
-    def fail_run(cmd, stdout, stderr, check):
-        return SimpleNamespace(returncode=1, stderr=b"ffmpeg error", stdout=b"")
+    def fake_pipeline(piper_cmd, ffmpeg_cmd, stdin_text, out):
+        out.write(b"ID3")
+        return 0, b"", 0, b""
 
-    monkeypatch.setattr(worker_mod.subprocess, "run", fail_run, raising=True)
+    monkeypatch.setattr(worker_mod, "_run_pipeline", fake_pipeline, raising=True)
 
-    with pytest.raises(RuntimeError, match="ffmpeg failed"):
-        worker_mod.wav_to_mp3(str(wav), str(mp3))
+    with worker_mod.synthesize_to_mp3("hello") as mp3:
+        assert mp3.read() == b"ID3"
 
 
 # -------------------------
 # upload_mp3() tests
 # -------------------------
 
-def test_upload_mp3_calls_s3_upload_file(monkeypatch, tmp_path):
-    mp3 = tmp_path / "a.mp3"
-    mp3.write_bytes(b"ID3" + b"\x00" * 10)
+def test_upload_mp3_calls_s3_put_object(monkeypatch):
+    mp3 = io.BytesIO(b"ID3" + b"\x00" * 10)
 
     called = {}
 
     class FakeS3:
-        def upload_file(self, Filename, Bucket, Key, ExtraArgs):
-            called["args"] = (Filename, Bucket, Key, ExtraArgs)
+        def put_object(self, Body, Bucket, Key, ContentType):
+            called["args"] = (Body, Bucket, Key, ContentType)
 
     monkeypatch.setattr(worker_mod, "s3", FakeS3(), raising=True)
 
-    worker_mod.upload_mp3("bkt", "k.mp3", str(mp3))
+    worker_mod.upload_mp3("bkt", "k.mp3", mp3)
 
-    Filename, Bucket, Key, ExtraArgs = called["args"]
-    assert Filename == str(mp3)
+    Body, Bucket, Key, ContentType = called["args"]
+    assert Body is mp3
     assert Bucket == "bkt"
     assert Key == "k.mp3"
-    assert ExtraArgs == {"ContentType": "audio/mpeg"}
+    assert ContentType == "audio/mpeg"
+
+
+# -------------------------
+# fetch_batch() / handle_job() tests
+# -------------------------
+
+class FakeListRedis:
+    """
+    Minimal list emulation for blmove/lmove/lrem + non-transactional pipeline,
+    plus set/exists/delete/scan_iter for the worker lease keys.
+    """
+
+    def __init__(self):
+        self.lists: Dict[str, List[str]] = {}
+        self.strings: Dict[str, str] = {}
+
+    def set(self, key, value, ex=None):
+        self.strings[key] = value
+        return True
+
+    def exists(self, key):
+        return int(key in self.strings or bool(self.lists.get(key)))
+
+    def delete(self, key):
+        return int(self.strings.pop(key, None) is not None)
+
+    def scan_iter(self, match="*", count=None):
+        return [k for k in list(self.lists) if fnmatch.fnmatchcase(k, match) and self.lists[k]]
+
+    def _lmove(self, src, dst, wherefrom, whereto):
+        items = self.lists.get(src) or []
+        if not items:
+            return None
+        v = items.pop(0 if wherefrom == "LEFT" else -1)
+        d = self.lists.setdefault(dst, [])
+        if whereto == "LEFT":
+            d.insert(0, v)
+        else:
+            d.append(v)
+        return v
+
+    def lmove(self, src, dst, wherefrom="LEFT", whereto="RIGHT"):
+        return self._lmove(src, dst, wherefrom, whereto)
+
+    def blmove(self, src, dst, timeout, wherefrom="LEFT", whereto="RIGHT"):
+        return self._lmove(src, dst, wherefrom, whereto)
+
+    def lrem(self, key, count, value):
+        items = self.lists.get(key) or []
+        if value in items:
+            items.remove(value)
+            return 1
+        return 0
+
+    def pipeline(self, transaction=True):
+        outer = self
+
+        class Pipe:
+            def __init__(self):
+                self.ops = []
+
+            def lmove(self, *args):
+                self.ops.append(args)
+                return self
+
+            def execute(self):
+                return [outer._lmove(*a) for a in self.ops]
+
+        return Pipe()
+
+
+def test_fetch_batch_drains_in_fifo_order_onto_processing(monkeypatch):
+    fr = FakeListRedis()
+    fr.lists["q"] = [f"j{i}" for i in range(5)]
+    monkeypatch.setattr(worker_mod, "r", fr, raising=True)
+    monkeypatch.setattr(worker_mod, "QUEUE_KEY", "q", raising=True)
+    monkeypatch.setattr(worker_mod, "PROCESSING_KEY", "q:processing", raising=True)
+    monkeypatch.setattr(worker_mod, "QUEUE_BATCH", 3, raising=True)
+
+    assert worker_mod.fetch_batch() == ["j0", "j1", "j2"]
+    assert fr.lists["q"] == ["j3", "j4"]
+    assert fr.lists["q:processing"] == ["j0", "j1", "j2"]
+
+
+@pytest.fixture()
+def queue_redis(monkeypatch) -> FakeListRedis:
+    fr = FakeListRedis()
+    monkeypatch.setattr(worker_mod, "r", fr, raising=True)
+    monkeypatch.setattr(worker_mod, "QUEUE_KEY", "q", raising=True)
+    monkeypatch.setattr(worker_mod, "PROCESSING_PREFIX", "q:processing:", raising=True)
+    monkeypatch.setattr(worker_mod, "PROCESSING_KEY", "q:processing:me", raising=True)
+    return fr
+
+
+def test_recover_orphans_requeues_only_lists_without_lease(queue_redis):
+    fr = queue_redis
+    fr.lists["q"] = ["j9"]
+    fr.lists["q:processing:me"] = ["mine"]
+    fr.lists["q:processing:alive"] = ["a1"]
+    fr.lists["q:processing:dead"] = ["d1", "d2"]
+    fr.set(worker_mod.lease_key("q:processing:alive"), "alive")
+
+    assert worker_mod.recover_orphans() == 2
+
+    # Oldest orphan first, ahead of the queued job
+    assert fr.lists["q"] == ["d1", "d2", "j9"]
+    assert fr.lists["q:processing:dead"] == []
+    assert fr.lists["q:processing:alive"] == ["a1"]
+    assert fr.lists["q:processing:me"] == ["mine"]
+
+
+def test_sigterm_requeues_unstarted_jobs_and_drops_lease(queue_redis, monkeypatch):
+    fr = queue_redis
+    fr.lists["q"] = ["j9"]
+    fr.lists["q:processing:me"] = ["j0", "j1"]
+    worker_mod.renew_lease(force=True)
+    monkeypatch.setattr(worker_mod, "_io_pool", worker_mod.ThreadPoolExecutor(1), raising=True)
+    monkeypatch.setattr(worker_mod, "_api_session", SimpleNamespace(close=lambda: None), raising=True)
+
+    with pytest.raises(SystemExit):
+        worker_mod._on_sigterm(15, None)
+
+    assert fr.lists["q"] == ["j0", "j1", "j9"]
+    assert fr.lists["q:processing:me"] == []
+    assert not fr.exists(worker_mod.lease_key("q:processing:me"))
+
+
+def test_handle_job_acks_even_on_failure(calls, monkeypatch):
+    fr = FakeListRedis()
+    raw = json.dumps({"job_id": "j6", "text": "hello"})
+    fr.lists["q:processing"] = [raw]
+    monkeypatch.setattr(worker_mod, "r", fr, raising=True)
+    monkeypatch.setattr(worker_mod, "PROCESSING_KEY", "q:processing", raising=True)
+
+    def boom(*args, **kwargs):
+        raise RuntimeError("piper exploded")
+
+    monkeypatch.setattr(worker_mod, "synthesize_to_mp3", boom, raising=True)
+
+    worker_mod.handle_job(raw)
+
+    assert calls["api_updates"][-1][:2] == ("j6", "FAILED")
+    assert fr.lists["q:processing"] == []
+
+
+# -------------------------
+# ensure_bucket() tests
+# -------------------------
+
+def test_ensure_bucket_checks_s3_once_per_bucket(monkeypatch):
+    seen: List[str] = []
+
+    class FakeS3:
+        def head_bucket(self, Bucket):
+            seen.append(Bucket)
+
+    monkeypatch.setattr(worker_mod, "s3", FakeS3(), raising=True)
+    monkeypatch.setattr(worker_mod, "_known_buckets", set(), raising=True)
+
+    worker_mod.ensure_bucket("bkt")
+    worker_mod.ensure_bucket("bkt")
+    worker_mod.ensure_bucket("other")
+
+    assert seen == ["bkt", "other"]
+
+
+def test_handle_job_publishes_in_background_then_acks(calls, monkeypatch):
+    fr = FakeListRedis()
+    raw = json.dumps({"job_id": "j7", "text": "hello"})
+    fr.lists["q:processing"] = [raw]
+    monkeypatch.setattr(worker_mod, "r", fr, raising=True)
+    monkeypatch.setattr(worker_mod, "PROCESSING_KEY", "q:processing", raising=True)
+
+    fut = worker_mod.handle_job(raw)
+    assert fut is not None
+    fut.result(timeout=5)
+
+    assert calls["api_updates"] == [("j7", "RUNNING", None), ("j7", "DONE", None)]
+    assert calls["upload_mp3"][0][:2] == ("tts-dev", "j7.mp3")
+    assert fr.lists["q:processing"] == []
@@ -1,13 +1,16 @@
 #!/usr/bin/env python3
 import argparse
-import subprocess
-import shutil
+import functools
+import os
+import re
+from collections import ChainMap
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
 
 try:
-    from jinja2 import Environment, FileSystemLoader, StrictUndefined
+    from jinja2 import Environment, FileSystemLoader, StrictUndefined, Template
 except ModuleNotFoundError as exc:
     raise SystemExit(
         "Missing dependency: jinja2. Install with "
@@ -22,8 +25,24 @@ except ModuleNotFoundError as exc:
         "`python3 -m pip install -r mde/transformers/requirements.txt`."
     ) from exc
 
+# libyaml's C parser when PyYAML was built against it (libyaml-dev/libyaml
+# present at install time); the pure-Python loader otherwise.
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
+
+GENERATED_SUBDIRS = frozenset({"terraform", "kubernetes"})
+MAX_ENV_WORKERS = 8
+
+# Output directories already created by this generate() run; many records
+# share a directory (e.g. kubernetes/overlays/<env>/). Shared by the
+# environment threads without a lock: a race only repeats an
+# exist_ok makedirs, and a path is added only after it exists.
+_created_dirs: Set[str] = set()
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class Paths:
     root: Path
     models: Path
@@ -31,72 +50,184 @@ class Paths:
 
 
 def load_yaml(path: Path) -> Dict[str, Any]:
-    with path.open("r", encoding="utf-8") as f:
-        data = yaml.safe_load(f)
+    # Bytes in: the reader detects the encoding (UTF-8 unless a BOM says
+    # otherwise), so no Python-level text decode runs ahead of libyaml.
+    with path.open("rb") as f:
+        data = yaml.load(f, Loader=YamlLoader)
     if not isinstance(data, dict):
         raise ValueError(f"YAML root must be a mapping: {path}")
     return data
 
 
-def merge_dicts(base: Dict[str, Any], override: Dict[str, Any]) -> Dict[str, Any]:
-    merged = dict(base)
-    merged.update(override)
-    return merged
-
+def enrich_environment_context(
+    defaults: Dict[str, Any], env_cfg: Dict[str, Any], output_root: Path
+) -> ChainMap[str, Any]:
+    # Layered view instead of a merged copy: only the derived keys are new,
+    # writes land in that first layer, and defaults are shared by all envs.
+    base = ChainMap(env_cfg, defaults)
 
-def enrich_environment_context(defaults: Dict[str, Any], env_cfg: Dict[str, Any], output_root: Path) -> Dict[str, Any]:
-    context = merge_dicts(defaults, env_cfg)
-
-    name = str(context["name"])
-    context["env_name"] = name
+    name = str(base["name"])
+    derived: Dict[str, Any] = {"env_name": name}
 
     # Derived defaults to keep environment model compact.
-    context.setdefault("k8s_overlay", name)
-    context.setdefault("env_value", name)
-    context.setdefault("mp3_bucket", f"tts-{name}")
-    context.setdefault("internal_token", f"changeme-{name}")
-    context.setdefault("tfvars_filename", f"{name}.tfvars")
-    context.setdefault("k8s_root_path", str((output_root / "kubernetes").resolve()))
+    for key, value in (
+        ("k8s_overlay", name),
+        ("env_value", name),
+        ("mp3_bucket", f"tts-{name}"),
+        ("internal_token", f"changeme-{name}"),
+        ("tfvars_filename", f"{name}.tfvars"),
+    ):
+        if key not in base:
+            derived[key] = value
+    if "k8s_root_path" not in base:
+        derived["k8s_root_path"] = str((output_root / "kubernetes").resolve())
+
+    return base.new_child(derived)
+
+
+@functools.lru_cache(maxsize=None)
+def template_environment(templates_dir: Path) -> Environment:
+    # One Environment per templates directory and process, so repeated
+    # generate() calls reuse compiled templates: keep every template
+    # (cache_size=-1) and skip the per-get_template mtime check.
+    return Environment(
+        loader=FileSystemLoader(str(templates_dir)),
+        undefined=StrictUndefined,
+        trim_blocks=True,
+        lstrip_blocks=True,
+        cache_size=-1,
+        auto_reload=False,
+    )
 
-    return context
+
+@functools.lru_cache(maxsize=None)
+def compile_string(template_env: Environment, template_string: str) -> Template:
+    # Inline templates (image tags, output paths) repeat across environments:
+    # parse/compile each source string once per Environment.
+    return template_env.from_string(template_string)
 
 
 def render_string(template_env: Environment, template_string: str, context: Dict[str, Any]) -> str:
-    return template_env.from_string(template_string).render(**context)
+    return compile_string(template_env, template_string).render(**context)
+
+
+def write_bytes(destination: Path, data: bytes) -> None:
+    # Unbuffered: the whole rendered file goes out in (usually) one write().
+    fd = os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+# `{{ name }}` with nothing but a variable name inside
+_SIMPLE_VAR = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+
+@functools.lru_cache(maxsize=None)
+def simple_variables(template_string: str) -> Optional[Tuple[str, ...]]:
+    # Variable names when the string is plain text plus `{{ name }}`
+    # substitutions (e.g. "{{ env_name }}"), None if it needs Jinja.
+    if "\n" in template_string:  # Jinja drops a single trailing newline
+        return None
+    rest = _SIMPLE_VAR.sub("", template_string)
+    if "{{" in rest or "{%" in rest or "{#" in rest:
+        return None
+    return tuple(_SIMPLE_VAR.findall(template_string))
+
+
+def render_string_fast(template_env: Environment, template_string: str, context: Mapping[str, Any]) -> str:
+    # Substitutes simple strings directly; anything else, and any undefined
+    # name (so StrictUndefined still raises), goes through Jinja.
+    names = simple_variables(template_string)
+    if names is None or not all(n in context for n in names):
+        return render_string(template_env, template_string, context)
+    return _SIMPLE_VAR.sub(lambda m: str(context[m.group(1)]), template_string)
+
 
+def render_template(template: Template, context: Dict[str, Any], destination: Path) -> None:
+    content = template.render(**context)
+    parent = str(destination.parent)
+    if parent not in _created_dirs:
+        os.makedirs(parent, exist_ok=True)
+        _created_dirs.add(parent)
+    write_bytes(destination, content.encode("utf-8"))
 
-def render_template(template_env: Environment, template_name: str, context: Dict[str, Any], destination: Path) -> None:
-    content = template_env.get_template(template_name).render(**context)
-    destination.parent.mkdir(parents=True, exist_ok=True)
-    destination.write_text(content, encoding="utf-8")
 
+# Records grouped by their `when` gate (None: always rendered), each as
+# (output path template, body template), in files.yaml order within a group
+RenderPlan = Dict[Optional[str], List[Tuple[Template, Template]]]
 
-def should_render(record: Dict[str, Any], context: Dict[str, Any]) -> bool:
-    condition = record.get("when")
+
+def plan_records(template_env: Environment, records: List[Dict[str, Any]]) -> RenderPlan:
+    # Resolve and compile every template once, ahead of the environment loop.
+    plan: RenderPlan = {}
+    for record in records:
+        plan.setdefault(record.get("when") or None, []).append(
+            (
+                compile_string(template_env, record["output"]),
+                template_env.get_template(record["template"]),
+            )
+        )
+    return plan
+
+
+def should_render(condition: Optional[str], context: Dict[str, Any]) -> bool:
     if not condition:
         return True
     return bool(context.get(condition, False))
 
 
-def render_records(
+def render_records(plan: RenderPlan, context: Dict[str, Any], output_root: Path) -> None:
+    # Each gate is evaluated once per context, not once per record.
+    for condition, entries in plan.items():
+        if not should_render(condition, context):
+            continue
+        for output_template, template in entries:
+            output_rel = output_template.render(**context)
+            render_template(template, context, output_root / output_rel)
+
+
+def render_environment(
     template_env: Environment,
-    records: List[Dict[str, Any]],
-    context: Dict[str, Any],
+    plan: RenderPlan,
+    defaults: Dict[str, Any],
+    env_cfg: Dict[str, Any],
     output_root: Path,
 ) -> None:
-    for record in records:
-        if not should_render(record, context):
-            continue
-        output_rel = render_string(template_env, record["output"], context)
-        render_template(template_env, record["template"], context, output_root / output_rel)
+    context = enrich_environment_context(defaults, env_cfg, output_root)
+
+    for key in ["api_image_tag", "web_image_tag", "worker_image_tag", "tfvars_filename"]:
+        context[key] = render_string_fast(template_env, str(context[key]), context)
+
+    # Templates render with **context: flatten the layers once per env
+    render_records(plan, dict(context), output_root)
+
+
+def remove_tree(path: str) -> None:
+    # Bottom-up over os.scandir: DirEntry.is_dir() answers from the readdir
+    # d_type, so entries are unlinked without a stat each.
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                remove_tree(entry.path)
+            else:
+                os.unlink(entry.path)
+    os.rmdir(path)
 
 
 def clean_output_root(output_root: Path) -> None:
     # Keep generation idempotent while preserving unrelated files.
-    for subdir in ["terraform", "kubernetes"]:
-        target = output_root / subdir
-        if target.exists():
-            subprocess.run(["rm", "-rf", str(target)], check=True)
+    with os.scandir(output_root) as entries:
+        for entry in entries:
+            if entry.name not in GENERATED_SUBDIRS:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                remove_tree(entry.path)
+            else:
+                os.unlink(entry.path)
 
 
 def generate(paths: Paths, output_root: Path) -> None:
@@ -108,25 +239,25 @@ def generate(paths: Paths, output_root: Path) -> None:
     core_files = file_model["core_files"]
     env_files = file_model["env_files"]
 
-    template_env = Environment(
-        loader=FileSystemLoader(str(paths.templates)),
-        undefined=StrictUndefined,
-        trim_blocks=True,
-        lstrip_blocks=True,
-    )
+    template_env = template_environment(paths.templates)
+    # Planned before cleaning: a missing/broken template fails without
+    # wiping the previous output.
+    core_plan = plan_records(template_env, core_files)
+    env_plan = plan_records(template_env, env_files)
 
     output_root.mkdir(parents=True, exist_ok=True)
     clean_output_root(output_root)
+    _created_dirs.clear()
 
-    render_records(template_env, core_files, defaults, output_root)
-
-    for env_cfg in environments:
-        context = enrich_environment_context(defaults, env_cfg, output_root)
-
-        for key in ["api_image_tag", "web_image_tag", "worker_image_tag", "tfvars_filename"]:
-            context[key] = render_string(template_env, str(context[key]), context)
+    render_records(core_plan, defaults, output_root)
 
-        render_records(template_env, env_files, context, output_root)
+    # Environments render to disjoint subtrees: overlap their file I/O.
+    if environments:
+        with ThreadPoolExecutor(max_workers=min(MAX_ENV_WORKERS, len(environments))) as pool:
+            list(pool.map(
+                lambda env_cfg: render_environment(template_env, env_plan, defaults, env_cfg, output_root),
+                environments,
+            ))
 
 
 def parse_args() -> argparse.Namespace: